@@ -5,6 +5,7 @@ from typing import Any
 from homeassistant import config_entries, core
 
 from custom_components.db_train_tracker.config_flow import DOMAIN
+from custom_components.db_train_tracker.services import async_setup_services
 
 CONF_SCAN_INTERVAL = 2
 SCAN_INTERVAL = timedelta(minutes=2)
@@ -12,6 +13,7 @@ SCAN_INTERVAL = timedelta(minutes=2)
 
 async def async_setup(hass: core.HomeAssistant, config: dict) -> bool:
     """Set up the db_train_tracker component."""
+    async_setup_services(hass)
     return True
 
 
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import AsyncIterator, Iterable, TypeVar
+
+from custom_components.db_train_tracker.const import DEFAULT_LOOP_BUDGET_MS
+
+T = TypeVar("T")
+
+
+class LoopBudget:
+    """Yields control to the event loop once a slice of synchronous work used up its time budget.
+
+    Tracks the longest slice which ran without yielding, which is the longest time the loop was blocked, since the
+    last reset and overall.
+    """
+
+    def __init__(self, budget_ms: float = DEFAULT_LOOP_BUDGET_MS) -> None:
+        self.budget = budget_ms / 1000
+        self.longest_slice = 0.0
+        self.max_slice = 0.0
+        self._slice_start = time.monotonic()
+
+    @property
+    def longest_slice_ms(self) -> float:
+        return round(self.longest_slice * 1000, 3)
+
+    @property
+    def max_slice_ms(self) -> float:
+        return round(self.max_slice * 1000, 3)
+
+    def reset(self) -> None:
+        """Starts tracking the longest slice anew, for example for every refresh."""
+        self.longest_slice = 0.0
+
+    def start(self) -> None:
+        self._slice_start = time.monotonic()
+
+    def stop(self) -> None:
+        self._record(time.monotonic() - self._slice_start)
+
+    def _record(self, elapsed: float) -> None:
+        self.longest_slice = max(self.longest_slice, elapsed)
+        self.max_slice = max(self.max_slice, elapsed)
+
+    async def async_checkpoint(self) -> None:
+        elapsed = time.monotonic() - self._slice_start
+        if elapsed < self.budget:
+            return
+        self._record(elapsed)
+        await asyncio.sleep(0)
+        self._slice_start = time.monotonic()
+
+    async def async_iterate(self, items: Iterable[T]) -> AsyncIterator[T]:
+        for item in items:
+            await self.async_checkpoint()
+            yield item
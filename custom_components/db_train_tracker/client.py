@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import sys
+from typing import TYPE_CHECKING, Dict
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.db_train_tracker.const import DATA_CLIENTS, DEFAULT_PROXY
+
+if TYPE_CHECKING:
+    from weiche import Schiene
+
+
+def _import_client_modules() -> None:
+    import weiche  # noqa: F401
+
+    import custom_components.db_train_tracker.proxies  # noqa: F401
+
+
+async def async_import_client(hass: HomeAssistant) -> None:
+    """Imports weiche in the import executor, so the first client is not created by importing on the event loop."""
+    if "custom_components.db_train_tracker.proxies" not in sys.modules:
+        await hass.async_add_import_executor_job(_import_client_modules)
+
+
+def get_client(hass: HomeAssistant, proxy: str = DEFAULT_PROXY) -> Schiene:
+    """The Schiene client shared by the config flow, the trackers and the services using the same proxies.
+
+    weiche is only imported once the first client is needed, which keeps it out of the integration load during
+    the Home Assistant start. Call async_import_client before from the event loop.
+    """
+    from custom_components.db_train_tracker.proxies import parse_proxies
+
+    proxies = parse_proxies(proxy)
+    clients: Dict[str, Schiene] = hass.data.setdefault(DATA_CLIENTS, {})
+    key = ";".join(proxies)
+    if (client := clients.get(key)) is None:
+        if proxies:
+            from custom_components.db_train_tracker.proxies import ProxyPool
+
+            client = ProxyPool(proxies)
+        else:
+            from weiche import Schiene
+
+            client = Schiene()
+        clients[key] = client
+    return client
@@ -1,54 +1,126 @@
 import logging
+import re
 from typing import Any, Dict, List, Optional, Tuple
 
 import homeassistant.helpers.config_validation as cv
+import requests
 import voluptuous as vol
-import weiche
 from homeassistant import config_entries
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
+from homeassistant.helpers.selector import SelectSelector, SelectSelectorConfig, SelectSelectorMode
 
+from custom_components.db_train_tracker.client import async_import_client, get_client
 from custom_components.db_train_tracker.const import (
+    CONF_ALTERNATIVE_DELAY,
+    CONF_ALTERNATIVE_STATIONS,
+    CONF_CALENDAR_ORIGINS,
     CONF_CALENDARS,
+    CONF_COMPACT_ATTRIBUTES,
+    CONF_DEPARTURE_BUFFER,
+    CONF_DEPARTURE_BUFFERS,
+    CONF_DUPLICATE_TOLERANCE,
     CONF_DURATION,
+    CONF_EXPORT_CONNECTIONS,
+    CONF_EXPORT_RETENTION,
     CONF_FILTERED_REGULAR_EXPRESSIONS,
     CONF_HOME_STATION,
+    CONF_JOURNEY_DETAILS,
+    CONF_LOCATION_DESTINATIONS,
+    CONF_LOOKAHEAD,
+    CONF_LOOP_BUDGET,
     CONF_MAPPINGS,
     CONF_MAX_RESULTS,
+    CONF_OFFLOAD_PARSING,
+    CONF_PREFETCH_WINDOW,
     CONF_PROXY,
     CONF_REMOVE_TIME_DUPLICATES,
+    DEFAULT_ALTERNATIVE_DELAY,
+    DEFAULT_ALTERNATIVE_STATIONS,
+    DEFAULT_ALTERNATIVE_STATIONS_STRING,
+    DEFAULT_CALENDAR_ORIGINS,
+    DEFAULT_CALENDAR_ORIGINS_STRING,
+    DEFAULT_COMPACT_ATTRIBUTES,
+    DEFAULT_DEPARTURE_BUFFER,
+    DEFAULT_DEPARTURE_BUFFERS,
+    DEFAULT_DEPARTURE_BUFFERS_STRING,
+    DEFAULT_DUPLICATE_TOLERANCE,
     DEFAULT_DURATION,
+    DEFAULT_EXPORT_CONNECTIONS,
+    DEFAULT_EXPORT_RETENTION,
     DEFAULT_FILTERED_REGULAR_EXPRESSIONS,
     DEFAULT_FILTERED_REGULAR_EXPRESSIONS_STRING,
+    DEFAULT_JOURNEY_DETAILS,
+    DEFAULT_LOCATION_DESTINATIONS,
+    DEFAULT_LOOKAHEAD,
+    DEFAULT_LOOP_BUDGET_MS,
     DEFAULT_MAPPINGS,
     DEFAULT_MAPPINGS_STRING,
     DEFAULT_MAX_RESULTS,
+    DEFAULT_OFFLOAD_PARSING,
+    DEFAULT_PREFETCH_WINDOW,
     DEFAULT_PROXY,
     DEFAULT_REMOVE_TIME_DUPLICATES,
     DOMAIN,
 )
+from custom_components.db_train_tracker.data_gatherer import parse_time_window
+from custom_components.db_train_tracker.expressions import compile_expression, is_expression_too_slow
+from custom_components.db_train_tracker.stations import async_get_station_store, normalize_station
 
 DB_TRAIN_TRACKER_DATA_SCHEMA = vol.Schema({vol.Required("")})
 
-_LOGGER = logging.getLogger(__name__)
+# Number of stations requested from Deutsche Bahn per search, all of them are added to the local station list.
+STATION_SUGGESTIONS = 10
 
-SCHIENE = weiche.Schiene()
+_LOGGER = logging.getLogger(__name__)
 
 
 async def _validate_station(hass: HomeAssistant, station: str) -> str:
     if not station:
         raise vol.Invalid("station_empty")
 
-    station_check = await hass.async_add_executor_job(SCHIENE.stations, station, 1)
+    # Stations entered before are resolved from the local station list without asking Deutsche Bahn again.
+    stations = await async_get_station_store(hass)
+    if (known_station := stations.get(station)) is not None:
+        return known_station
+
+    await async_import_client(hass)
+    try:
+        station_check = await hass.async_add_executor_job(get_client(hass).stations, station, STATION_SUGGESTIONS)
+    except (requests.RequestException, ValueError) as error:
+        _LOGGER.warning(f"Could not search the station {station}: {error}")
+        raise vol.Invalid("cannot_connect") from error
+    stations.add(result["value"] for result in station_check)
     if len(station_check) == 0:
         raise vol.Invalid("station_not_found")
 
+    stations.add_alias(station, station_check[0]["value"])
     return station_check[0]["value"]
 
 
-async def _validate_mappings(mappings: str) -> Tuple[Tuple[str, str], ...]:
+async def _suggest_stations(hass: HomeAssistant, station: str) -> List[str]:
+    # Shorten the entered name until stations starting with it are known, which covers typos at the end.
+    stations = await async_get_station_store(hass)
+    query = normalize_station(station)
+    while query:
+        if suggestions := stations.suggest(query, STATION_SUGGESTIONS):
+            return suggestions
+        query = query[:-1]
+    return []
+
+
+def _station_selector(suggestions: List[str]) -> Any:
+    if not suggestions:
+        return cv.string
+    return SelectSelector(
+        SelectSelectorConfig(options=suggestions, custom_value=True, mode=SelectSelectorMode.DROPDOWN)
+    )
+
+
+async def _validate_mappings(hass: HomeAssistant, mappings: str) -> Tuple[Tuple[str, str], ...]:
     if not mappings:
         return tuple()
+    stations = await async_get_station_store(hass)
     to_return_mappings: List[Tuple[str, str]] = []
     for line in mappings.split(";"):
         if line.strip() == "":
@@ -56,15 +128,91 @@ async def _validate_mappings(mappings: str) -> Tuple[Tuple[str, str], ...]:
         items = line.strip().split(",")
         if not len(items) == 2:
             raise vol.Invalid("mapping_format")
-        mapping_tuple: Tuple[str, str] = tuple(item.strip() for item in items)  # type: ignore[assignment]
-        to_return_mappings.append(mapping_tuple)
+        name, station = (item.strip() for item in items)
+        if not station:
+            raise vol.Invalid("mapping_station_not_found")
+        # Targets are only checked against the local station list. Unknown targets are kept as entered and
+        # resolved once a travel to them is looked up.
+        to_return_mappings.append((name, stations.get(station) or station))
     return tuple(to_return_mappings)
 
 
-async def _validate_regular_expressions(expressions: str) -> Tuple[str, ...]:
+async def _validate_calendar_origins(hass: HomeAssistant, calendar_origins: str) -> Tuple[Tuple[str, str], ...]:
+    if not calendar_origins:
+        return tuple()
+    to_return_origins: List[Tuple[str, str]] = []
+    for line in calendar_origins.split(";"):
+        if line.strip() == "":
+            continue
+        items = line.strip().split(",")
+        if not len(items) == 2:
+            raise vol.Invalid("calendar_origin_format")
+        calendar, station = (item.strip() for item in items)
+        to_return_origins.append((calendar, await _validate_station(hass, station)))
+    return tuple(to_return_origins)
+
+
+async def _validate_alternative_stations(hass: HomeAssistant, alternatives: str) -> Tuple[Tuple[str, str], ...]:
+    if not alternatives:
+        return tuple()
+    to_return_alternatives: List[Tuple[str, str]] = []
+    for line in alternatives.split(";"):
+        if line.strip() == "":
+            continue
+        items = line.strip().split(",")
+        if not len(items) == 2:
+            raise vol.Invalid("alternative_station_format")
+        station, alternative = (item.strip() for item in items)
+        to_return_alternatives.append(
+            (await _validate_station(hass, station), await _validate_station(hass, alternative))
+        )
+    return tuple(to_return_alternatives)
+
+
+async def _validate_departure_buffers(buffers: str) -> Tuple[Tuple[str, int], ...]:
+    if not buffers:
+        return tuple()
+    to_return_buffers: List[Tuple[str, int]] = []
+    for line in buffers.split(";"):
+        if line.strip() == "":
+            continue
+        items = line.strip().split(",")
+        if not len(items) == 2:
+            raise vol.Invalid("departure_buffer_format")
+        try:
+            minutes = int(items[1].strip())
+        except ValueError as error:
+            raise vol.Invalid("departure_buffer_format") from error
+        if minutes < 0:
+            raise vol.Invalid("departure_buffer_format")
+        to_return_buffers.append((items[0].strip(), minutes))
+    return tuple(to_return_buffers)
+
+
+async def _validate_prefetch_window(window: str) -> str:
+    try:
+        parsed_window = parse_time_window(window)
+    except ValueError as error:
+        raise vol.Invalid("prefetch_window_format") from error
+    if parsed_window is None:
+        return DEFAULT_PREFETCH_WINDOW
+    start, end = parsed_window
+    return f"{start.strftime('%H:%M')}-{end.strftime('%H:%M')}"
+
+
+async def _validate_regular_expressions(hass: HomeAssistant, expressions: str) -> Tuple[str, ...]:
     if not expressions:
         raise vol.Invalid("expressions_empty")
-    return tuple(item.strip() for item in expressions.split(";") if item.strip())
+    to_return_expressions = tuple(item.strip() for item in expressions.split(";") if item.strip())
+    for expression in to_return_expressions:
+        try:
+            pattern = compile_expression(expression)
+        except re.error as error:
+            raise vol.Invalid("expression_invalid") from error
+        # Every calendar summary is matched against the expressions, reject those prone to catastrophic backtracking.
+        if await hass.async_add_executor_job(is_expression_too_slow, pattern):
+            raise vol.Invalid("expression_too_slow")
+    return to_return_expressions
 
 
 class OptionsFlowHandler(config_entries.OptionsFlow):
@@ -88,6 +236,12 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                 return ";".join(result)
             if key == CONF_MAPPINGS:
                 return ";".join(",".join(mapping) for mapping in result)
+            if key == CONF_CALENDAR_ORIGINS:
+                return ";".join(",".join(mapping) for mapping in result)
+            if key == CONF_ALTERNATIVE_STATIONS:
+                return ";".join(",".join(alternative) for alternative in result)
+            if key == CONF_DEPARTURE_BUFFERS:
+                return ";".join(f"{station},{minutes}" for station, minutes in result)
             return result
 
         errors = {}
@@ -95,16 +249,47 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             user_input[CONF_HOME_STATION] = __get_option(CONF_HOME_STATION, "")
 
             try:
-                user_input[CONF_MAPPINGS] = await _validate_mappings(user_input.get(CONF_MAPPINGS, DEFAULT_MAPPINGS))
+                user_input[CONF_MAPPINGS] = await _validate_mappings(
+                    self.hass, user_input.get(CONF_MAPPINGS, DEFAULT_MAPPINGS)
+                )
             except vol.Invalid as error:
                 errors[CONF_MAPPINGS] = error.error_message
 
+            try:
+                user_input[CONF_CALENDAR_ORIGINS] = await _validate_calendar_origins(
+                    self.hass, user_input.get(CONF_CALENDAR_ORIGINS, DEFAULT_CALENDAR_ORIGINS_STRING)
+                )
+            except vol.Invalid as error:
+                errors[CONF_CALENDAR_ORIGINS] = error.error_message
+
+            try:
+                user_input[CONF_DEPARTURE_BUFFERS] = await _validate_departure_buffers(
+                    user_input.get(CONF_DEPARTURE_BUFFERS, DEFAULT_DEPARTURE_BUFFERS_STRING)
+                )
+            except vol.Invalid as error:
+                errors[CONF_DEPARTURE_BUFFERS] = error.error_message
+
+            try:
+                user_input[CONF_ALTERNATIVE_STATIONS] = await _validate_alternative_stations(
+                    self.hass, user_input.get(CONF_ALTERNATIVE_STATIONS, DEFAULT_ALTERNATIVE_STATIONS_STRING)
+                )
+            except vol.Invalid as error:
+                errors[CONF_ALTERNATIVE_STATIONS] = error.error_message
+
+            try:
+                user_input[CONF_PREFETCH_WINDOW] = await _validate_prefetch_window(
+                    user_input.get(CONF_PREFETCH_WINDOW, DEFAULT_PREFETCH_WINDOW)
+                )
+            except vol.Invalid as error:
+                errors[CONF_PREFETCH_WINDOW] = error.error_message
+
             try:
                 user_input[CONF_FILTERED_REGULAR_EXPRESSIONS] = await _validate_regular_expressions(
+                    self.hass,
                     user_input.get(
                         CONF_FILTERED_REGULAR_EXPRESSIONS,
                         DEFAULT_FILTERED_REGULAR_EXPRESSIONS,
-                    )
+                    ),
                 )
             except vol.Invalid as error:
                 errors[CONF_FILTERED_REGULAR_EXPRESSIONS] = error.error_message
@@ -122,10 +307,18 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             data_schema=vol.Schema(
                 {
                     vol.Required(CONF_CALENDARS, default=__get_option(CONF_CALENDARS, [])): cv.multi_select(calendars),
+                    vol.Optional(
+                        CONF_CALENDAR_ORIGINS,
+                        default=__get_option(CONF_CALENDAR_ORIGINS, DEFAULT_CALENDAR_ORIGINS),
+                    ): cv.string,
                     vol.Required(
                         CONF_DURATION,
                         default=__get_option(CONF_DURATION, DEFAULT_DURATION),
                     ): cv.positive_int,
+                    vol.Required(
+                        CONF_LOCATION_DESTINATIONS,
+                        default=__get_option(CONF_LOCATION_DESTINATIONS, DEFAULT_LOCATION_DESTINATIONS),
+                    ): cv.boolean,
                     vol.Required(
                         CONF_FILTERED_REGULAR_EXPRESSIONS,
                         default=__get_option(
@@ -147,7 +340,59 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                         CONF_REMOVE_TIME_DUPLICATES,
                         default=__get_option(CONF_REMOVE_TIME_DUPLICATES, DEFAULT_REMOVE_TIME_DUPLICATES),
                     ): cv.boolean,
+                    vol.Required(
+                        CONF_LOOKAHEAD,
+                        default=__get_option(CONF_LOOKAHEAD, DEFAULT_LOOKAHEAD),
+                    ): cv.positive_int,
+                    vol.Required(
+                        CONF_DUPLICATE_TOLERANCE,
+                        default=__get_option(CONF_DUPLICATE_TOLERANCE, DEFAULT_DUPLICATE_TOLERANCE),
+                    ): cv.positive_int,
+                    vol.Required(
+                        CONF_OFFLOAD_PARSING,
+                        default=__get_option(CONF_OFFLOAD_PARSING, DEFAULT_OFFLOAD_PARSING),
+                    ): cv.boolean,
+                    vol.Optional(
+                        CONF_JOURNEY_DETAILS,
+                        default=__get_option(CONF_JOURNEY_DETAILS, DEFAULT_JOURNEY_DETAILS),
+                    ): cv.boolean,
+                    vol.Optional(
+                        CONF_EXPORT_CONNECTIONS,
+                        default=__get_option(CONF_EXPORT_CONNECTIONS, DEFAULT_EXPORT_CONNECTIONS),
+                    ): cv.boolean,
+                    vol.Required(
+                        CONF_EXPORT_RETENTION,
+                        default=__get_option(CONF_EXPORT_RETENTION, DEFAULT_EXPORT_RETENTION),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1)),
+                    vol.Optional(
+                        CONF_PREFETCH_WINDOW,
+                        default=__get_option(CONF_PREFETCH_WINDOW, DEFAULT_PREFETCH_WINDOW),
+                    ): cv.string,
                     vol.Optional(CONF_PROXY, default=__get_option(CONF_PROXY, DEFAULT_PROXY)): cv.string,
+                    vol.Optional(
+                        CONF_COMPACT_ATTRIBUTES,
+                        default=__get_option(CONF_COMPACT_ATTRIBUTES, DEFAULT_COMPACT_ATTRIBUTES),
+                    ): cv.boolean,
+                    vol.Required(
+                        CONF_DEPARTURE_BUFFER,
+                        default=__get_option(CONF_DEPARTURE_BUFFER, DEFAULT_DEPARTURE_BUFFER),
+                    ): cv.positive_int,
+                    vol.Optional(
+                        CONF_DEPARTURE_BUFFERS,
+                        default=__get_option(CONF_DEPARTURE_BUFFERS, DEFAULT_DEPARTURE_BUFFERS),
+                    ): cv.string,
+                    vol.Optional(
+                        CONF_ALTERNATIVE_STATIONS,
+                        default=__get_option(CONF_ALTERNATIVE_STATIONS, DEFAULT_ALTERNATIVE_STATIONS),
+                    ): cv.string,
+                    vol.Required(
+                        CONF_ALTERNATIVE_DELAY,
+                        default=__get_option(CONF_ALTERNATIVE_DELAY, DEFAULT_ALTERNATIVE_DELAY),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1)),
+                    vol.Required(
+                        CONF_LOOP_BUDGET,
+                        default=__get_option(CONF_LOOP_BUDGET, DEFAULT_LOOP_BUDGET_MS),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1)),
                 }
             ),
             errors=errors,
@@ -160,27 +405,58 @@ class DBTrainTrackerConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):  # typ
 
     async def async_step_user(self, user_input: Optional[Dict[str, Any]] = None) -> FlowResult:
         errors = {}
+        station_suggestions: List[str] = []
         if user_input is not None:
             unique_id = user_input[CONF_HOME_STATION]
             try:
                 unique_id = await _validate_station(self.hass, unique_id)
             except vol.Invalid as error:
                 errors[CONF_HOME_STATION] = error.error_message
+                station_suggestions = await _suggest_stations(self.hass, unique_id)
             user_input[CONF_HOME_STATION] = unique_id
 
             try:
                 user_input[CONF_MAPPINGS] = await _validate_mappings(
-                    user_input.get(CONF_MAPPINGS, DEFAULT_MAPPINGS_STRING)
+                    self.hass, user_input.get(CONF_MAPPINGS, DEFAULT_MAPPINGS_STRING)
                 )
             except vol.Invalid as error:
                 errors[CONF_MAPPINGS] = error.error_message
 
+            try:
+                user_input[CONF_CALENDAR_ORIGINS] = await _validate_calendar_origins(
+                    self.hass, user_input.get(CONF_CALENDAR_ORIGINS, DEFAULT_CALENDAR_ORIGINS_STRING)
+                )
+            except vol.Invalid as error:
+                errors[CONF_CALENDAR_ORIGINS] = error.error_message
+
+            try:
+                user_input[CONF_DEPARTURE_BUFFERS] = await _validate_departure_buffers(
+                    user_input.get(CONF_DEPARTURE_BUFFERS, DEFAULT_DEPARTURE_BUFFERS_STRING)
+                )
+            except vol.Invalid as error:
+                errors[CONF_DEPARTURE_BUFFERS] = error.error_message
+
+            try:
+                user_input[CONF_ALTERNATIVE_STATIONS] = await _validate_alternative_stations(
+                    self.hass, user_input.get(CONF_ALTERNATIVE_STATIONS, DEFAULT_ALTERNATIVE_STATIONS_STRING)
+                )
+            except vol.Invalid as error:
+                errors[CONF_ALTERNATIVE_STATIONS] = error.error_message
+
+            try:
+                user_input[CONF_PREFETCH_WINDOW] = await _validate_prefetch_window(
+                    user_input.get(CONF_PREFETCH_WINDOW, DEFAULT_PREFETCH_WINDOW)
+                )
+            except vol.Invalid as error:
+                errors[CONF_PREFETCH_WINDOW] = error.error_message
+
             try:
                 user_input[CONF_FILTERED_REGULAR_EXPRESSIONS] = await _validate_regular_expressions(
+                    self.hass,
                     user_input.get(
                         CONF_FILTERED_REGULAR_EXPRESSIONS,
                         DEFAULT_FILTERED_REGULAR_EXPRESSIONS_STRING,
-                    )
+                    ),
                 )
             except vol.Invalid as error:
                 errors[CONF_FILTERED_REGULAR_EXPRESSIONS] = error.error_message
@@ -203,8 +479,10 @@ class DBTrainTrackerConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):  # typ
             data_schema=vol.Schema(
                 {
                     vol.Required(CONF_CALENDARS): cv.multi_select(calendars),
-                    vol.Required(CONF_HOME_STATION): cv.string,
+                    vol.Required(CONF_HOME_STATION): _station_selector(station_suggestions),
+                    vol.Optional(CONF_CALENDAR_ORIGINS, default=DEFAULT_CALENDAR_ORIGINS_STRING): cv.string,
                     vol.Required(CONF_DURATION, default=DEFAULT_DURATION): cv.positive_int,
+                    vol.Required(CONF_LOCATION_DESTINATIONS, default=DEFAULT_LOCATION_DESTINATIONS): cv.boolean,
                     vol.Required(
                         CONF_FILTERED_REGULAR_EXPRESSIONS,
                         default=DEFAULT_FILTERED_REGULAR_EXPRESSIONS_STRING,
@@ -215,7 +493,26 @@ class DBTrainTrackerConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):  # typ
                     ): cv.string,
                     vol.Required(CONF_MAX_RESULTS, default=DEFAULT_MAX_RESULTS): cv.positive_int,
                     vol.Required(CONF_REMOVE_TIME_DUPLICATES, default=DEFAULT_REMOVE_TIME_DUPLICATES): cv.boolean,
+                    vol.Required(CONF_LOOKAHEAD, default=DEFAULT_LOOKAHEAD): cv.positive_int,
+                    vol.Required(CONF_DUPLICATE_TOLERANCE, default=DEFAULT_DUPLICATE_TOLERANCE): cv.positive_int,
+                    vol.Required(CONF_OFFLOAD_PARSING, default=DEFAULT_OFFLOAD_PARSING): cv.boolean,
+                    vol.Optional(CONF_JOURNEY_DETAILS, default=DEFAULT_JOURNEY_DETAILS): cv.boolean,
+                    vol.Optional(CONF_EXPORT_CONNECTIONS, default=DEFAULT_EXPORT_CONNECTIONS): cv.boolean,
+                    vol.Required(CONF_EXPORT_RETENTION, default=DEFAULT_EXPORT_RETENTION): vol.All(
+                        vol.Coerce(int), vol.Range(min=1)
+                    ),
+                    vol.Optional(CONF_PREFETCH_WINDOW, default=DEFAULT_PREFETCH_WINDOW): cv.string,
                     vol.Optional(CONF_PROXY, default=DEFAULT_PROXY): cv.string,
+                    vol.Optional(CONF_COMPACT_ATTRIBUTES, default=DEFAULT_COMPACT_ATTRIBUTES): cv.boolean,
+                    vol.Required(CONF_DEPARTURE_BUFFER, default=DEFAULT_DEPARTURE_BUFFER): cv.positive_int,
+                    vol.Optional(CONF_DEPARTURE_BUFFERS, default=DEFAULT_DEPARTURE_BUFFERS_STRING): cv.string,
+                    vol.Optional(CONF_ALTERNATIVE_STATIONS, default=DEFAULT_ALTERNATIVE_STATIONS_STRING): cv.string,
+                    vol.Required(CONF_ALTERNATIVE_DELAY, default=DEFAULT_ALTERNATIVE_DELAY): vol.All(
+                        vol.Coerce(int), vol.Range(min=1)
+                    ),
+                    vol.Required(CONF_LOOP_BUDGET, default=DEFAULT_LOOP_BUDGET_MS): vol.All(
+                        vol.Coerce(int), vol.Range(min=1)
+                    ),
                 }
             ),
             errors=errors,
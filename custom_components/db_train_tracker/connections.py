@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.db_train_tracker.const import DATA_CONNECTION_CACHE
+
+# Connections fetched by any tracker or query are reused by on demand queries for this many seconds.
+CONNECTION_CACHE_TTL = 60
+# Upper bound of the cached connection queries, the oldest ones are dropped first.
+MAX_CACHED_CONNECTIONS = 256
+
+ConnectionKey = Tuple[str, str, datetime.datetime]
+Connections = List[Dict[str, Any]]
+
+
+class ConnectionCache:
+    """Short lived cache of upstream connection queries which also coalesces concurrent identical queries.
+
+    Concurrent queries for the same route and time wait for the query already in flight instead of sending
+    their own request upstream. If the caller which sent that query is canceled, one of the waiting callers
+    sends it again.
+    """
+
+    def __init__(self, ttl: float = CONNECTION_CACHE_TTL, max_size: int = MAX_CACHED_CONNECTIONS) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: Dict[ConnectionKey, Tuple[float, Connections]] = {}
+        self._in_flight: Dict[ConnectionKey, asyncio.Future[Connections]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def async_get(
+        self, key: ConnectionKey, fetch: Callable[[], Awaitable[Connections]], max_age: float | None = None
+    ) -> Connections:
+        """Returns the connections of a query not older than max_age seconds, which defaults to the ttl."""
+        max_age = self.ttl if max_age is None else max_age
+        cached = self._entries.get(key)
+        if cached is not None and time.monotonic() - cached[0] < max_age:
+            return cached[1]
+        while (in_flight := self._in_flight.get(key)) is not None:
+            try:
+                return await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                # Only the caller which sent the query was canceled, the waiting callers query again.
+                if not in_flight.cancelled():
+                    raise
+
+        future: asyncio.Future[Connections] = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            connections = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # Mark the exception as retrieved, the caller gets it raised and there might be no other waiter.
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+        future.set_result(connections)
+        self._store(key, connections)
+        return connections
+
+    def _store(self, key: ConnectionKey, connections: Connections) -> None:
+        now = time.monotonic()
+        self._entries.pop(key, None)
+        self._entries[key] = (now, connections)
+        for expired_key in [
+            cached_key for cached_key, (fetched_at, _) in self._entries.items() if now - fetched_at >= self.ttl
+        ]:
+            del self._entries[expired_key]
+        while len(self._entries) > self.max_size:
+            del self._entries[next(iter(self._entries))]
+
+
+def get_connection_cache(hass: HomeAssistant) -> ConnectionCache:
+    """The connection cache shared by all trackers and the query service."""
+    cache: ConnectionCache = hass.data.setdefault(DATA_CONNECTION_CACHE, ConnectionCache())
+    return cache
@@ -1,6 +1,16 @@
 from typing import Tuple
 
 DOMAIN = "db_train_tracker"
+EVENT_DELAY_CHANGED = f"{DOMAIN}_delay_changed"
+EVENT_CANCELED = f"{DOMAIN}_canceled"
+EVENT_PLATFORM_CHANGED = f"{DOMAIN}_platform_changed"
+DATA_TRACKER = "tracker"
+DATA_CONNECTION_CACHE = f"{DOMAIN}_connection_cache"
+DATA_CLIENTS = f"{DOMAIN}_clients"
+DATA_STATION_STORE = f"{DOMAIN}_station_store"
+DATA_EXPORTERS = f"{DOMAIN}_exporters"
+SERVICE_QUERY_CONNECTIONS = "query_connections"
+SERVICE_FLUSH_EXPORT = "flush_export"
 CONF_CALENDARS = "calendars"
 CONF_HOME_STATION = "home_station"
 CONF_DURATION = "scan_duration_hours"
@@ -9,6 +19,21 @@ CONF_MAPPINGS = "station_mappings"
 CONF_MAX_RESULTS = "max_train_results"
 CONF_REMOVE_TIME_DUPLICATES = "remove_time_duplicates"
 CONF_PROXY = "proxy"
+CONF_COMPACT_ATTRIBUTES = "compact_attributes"
+CONF_DEPARTURE_BUFFER = "departure_buffer_minutes"
+CONF_DEPARTURE_BUFFERS = "departure_buffers"
+CONF_CALENDAR_ORIGINS = "calendar_origins"
+CONF_LOCATION_DESTINATIONS = "location_destinations"
+CONF_LOOKAHEAD = "lookahead_minutes"
+CONF_OFFLOAD_PARSING = "offload_calendar_parsing"
+CONF_PREFETCH_WINDOW = "prefetch_window"
+CONF_JOURNEY_DETAILS = "journey_details"
+CONF_DUPLICATE_TOLERANCE = "duplicate_tolerance_minutes"
+CONF_ALTERNATIVE_STATIONS = "alternative_stations"
+CONF_ALTERNATIVE_DELAY = "alternative_delay_minutes"
+CONF_EXPORT_CONNECTIONS = "export_connections"
+CONF_EXPORT_RETENTION = "export_retention_days"
+CONF_LOOP_BUDGET = "loop_budget_ms"
 
 DEFAULT_DURATION = 48
 DEFAULT_MAX_RESULTS = 5
@@ -24,3 +49,22 @@ DEFAULT_MAPPINGS: Tuple[Tuple[str, str], ...] = tuple()
 DEFAULT_MAPPINGS_STRING = ";".join(",".join(mapping) for mapping in DEFAULT_MAPPINGS)
 DEFAULT_REMOVE_TIME_DUPLICATES: bool = True
 DEFAULT_PROXY: str = ""
+DEFAULT_COMPACT_ATTRIBUTES: bool = False
+DEFAULT_HISTORY_DAYS: int = 7
+DEFAULT_DEPARTURE_BUFFER: int = 0
+DEFAULT_DEPARTURE_BUFFERS: Tuple[Tuple[str, int], ...] = tuple()
+DEFAULT_DEPARTURE_BUFFERS_STRING = ";".join(f"{station},{minutes}" for station, minutes in DEFAULT_DEPARTURE_BUFFERS)
+DEFAULT_CALENDAR_ORIGINS: Tuple[Tuple[str, str], ...] = tuple()
+DEFAULT_CALENDAR_ORIGINS_STRING = ";".join(",".join(mapping) for mapping in DEFAULT_CALENDAR_ORIGINS)
+DEFAULT_LOCATION_DESTINATIONS: bool = True
+DEFAULT_LOOKAHEAD: int = 0
+DEFAULT_OFFLOAD_PARSING: bool = False
+DEFAULT_PREFETCH_WINDOW = ""
+DEFAULT_JOURNEY_DETAILS: bool = False
+DEFAULT_DUPLICATE_TOLERANCE: int = 10
+DEFAULT_ALTERNATIVE_STATIONS: Tuple[Tuple[str, str], ...] = tuple()
+DEFAULT_ALTERNATIVE_STATIONS_STRING = ";".join(",".join(mapping) for mapping in DEFAULT_ALTERNATIVE_STATIONS)
+DEFAULT_ALTERNATIVE_DELAY: int = 15
+DEFAULT_EXPORT_CONNECTIONS: bool = False
+DEFAULT_EXPORT_RETENTION: int = 30
+DEFAULT_LOOP_BUDGET_MS: int = 5
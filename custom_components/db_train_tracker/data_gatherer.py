@@ -1,26 +1,90 @@
 from __future__ import annotations
 
+import asyncio
 import datetime
 import logging
 import re
+import sys
+import time
 from dataclasses import dataclass
 from functools import cached_property, partial
-from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_state_change_event
 from homeassistant.util import dt
-from weiche import Schiene
 
+from custom_components.db_train_tracker.budget import LoopBudget
+from custom_components.db_train_tracker.connections import ConnectionCache
 from custom_components.db_train_tracker.const import (
+    DEFAULT_ALTERNATIVE_DELAY,
+    DEFAULT_ALTERNATIVE_STATIONS,
+    DEFAULT_CALENDAR_ORIGINS,
+    DEFAULT_DEPARTURE_BUFFER,
+    DEFAULT_DEPARTURE_BUFFERS,
+    DEFAULT_DUPLICATE_TOLERANCE,
     DEFAULT_DURATION,
     DEFAULT_FILTERED_REGULAR_EXPRESSIONS,
+    DEFAULT_JOURNEY_DETAILS,
+    DEFAULT_LOCATION_DESTINATIONS,
+    DEFAULT_LOOKAHEAD,
+    DEFAULT_LOOP_BUDGET_MS,
     DEFAULT_MAPPINGS,
     DEFAULT_MAX_RESULTS,
+    DEFAULT_OFFLOAD_PARSING,
     DEFAULT_REMOVE_TIME_DUPLICATES,
 )
+from custom_components.db_train_tracker.details import (
+    DetailsKey,
+    DetailsVersion,
+    JourneyDetails,
+    JourneyDetailsCache,
+    fetch_journey_details,
+)
+from custom_components.db_train_tracker.events import get_change_events, get_platform_change_event
+from custom_components.db_train_tracker.expressions import MAX_SUMMARY_LENGTH, compile_expression
+from custom_components.db_train_tracker.stations import (
+    StationIndex,
+    StationStore,
+    async_get_station_store,
+    normalize_station,
+)
+from custom_components.db_train_tracker.trips import TripIndex
+
+if TYPE_CHECKING:
+    from weiche import Schiene
 
 _LOGGER = logging.getLogger(__name__)
 
+# Calendars are only re-fetched completely if their state changed. As not every change of a calendar changes its
+# state, they are still fully re-fetched after this interval.
+CALENDAR_FULL_REFRESH_INTERVAL = datetime.timedelta(hours=1)
+# Upper bound of the events kept per calendar.
+MAX_CACHED_CALENDAR_ENTRIES = 5000
+# Connections prefetched during the quiet window are used until the planned travel starts within this time, from
+# then on the connections are queried on every refresh again to keep the delays current.
+PREFETCH_REFRESH_HORIZON = datetime.timedelta(hours=2)
+# Matching the calendar entries of one refresh against all expressions taking longer than this is logged.
+SLOW_MATCHING_WARNING = 0.05
+# Upper bound of the alternative routes queried for a trip and of those queried at the same time.
+MAX_ALTERNATIVE_ROUTES = 4
+MAX_PARALLEL_ALTERNATIVE_QUERIES = 2
+
+TimeWindow = Tuple[datetime.time, datetime.time]
+
+
+def parse_time_window(value: str) -> TimeWindow | None:
+    """Parses a window like 01:00-05:00. The window may span midnight, an empty value disables it."""
+    if not value or not value.strip():
+        return None
+    items = value.split("-")
+    if len(items) != 2:
+        raise ValueError(f"Invalid time window {value}")
+    start, end = (datetime.datetime.strptime(item.strip(), "%H:%M").time() for item in items)
+    if start == end:
+        raise ValueError(f"Empty time window {value}")
+    return start, end
+
 
 class GathererConfig(NamedTuple):
     origin: str
@@ -30,9 +94,75 @@ class GathererConfig(NamedTuple):
     mappings: Tuple[Tuple[str, str], ...] = DEFAULT_MAPPINGS
     max_results: int = DEFAULT_MAX_RESULTS
     remove_same_time_duplicates: bool = DEFAULT_REMOVE_TIME_DUPLICATES
+    departure_buffer: int = DEFAULT_DEPARTURE_BUFFER
+    departure_buffers: Tuple[Tuple[str, int], ...] = DEFAULT_DEPARTURE_BUFFERS
+    calendar_origins: Tuple[Tuple[str, str], ...] = DEFAULT_CALENDAR_ORIGINS
+    location_destinations: bool = DEFAULT_LOCATION_DESTINATIONS
+    lookahead_minutes: int = DEFAULT_LOOKAHEAD
+    offload_parsing: bool = DEFAULT_OFFLOAD_PARSING
+    prefetch_window: TimeWindow | None = None
+    journey_details: bool = DEFAULT_JOURNEY_DETAILS
+    duplicate_tolerance_minutes: int = DEFAULT_DUPLICATE_TOLERANCE
+    alternative_stations: Tuple[Tuple[str, str], ...] = DEFAULT_ALTERNATIVE_STATIONS
+    alternative_delay_minutes: int = DEFAULT_ALTERNATIVE_DELAY
+
+    def get_lookahead_horizon(self, planned_travel_time: PlannedTravelTime) -> datetime.datetime | None:
+        if self.lookahead_minutes <= 0:
+            return None
+        return planned_travel_time.end + datetime.timedelta(minutes=self.lookahead_minutes)
+
+    def in_prefetch_window(self, now: datetime.datetime) -> bool:
+        if self.prefetch_window is None:
+            return False
+        start, end = self.prefetch_window
+        current = now.time()
+        if start < end:
+            return start <= current < end
+        return current >= start or current < end
+
+    @property
+    def origins(self) -> Tuple[str, ...]:
+        origins = [self.origin]
+        for _, origin in self.calendar_origins:
+            if origin not in origins:
+                origins.append(origin)
+        return tuple(origins)
+
+    def get_origin_of(self, entry: CalendarEntryResult) -> str:
+        # An event located at one of the home stations starts there, otherwise the home station of the calendar
+        # is used before falling back to the default home station.
+        if entry.location:
+            location = entry.location.strip().casefold()
+            for origin in self.origins:
+                if origin.casefold() == location:
+                    return origin
+        for calendar, origin in self.calendar_origins:
+            if calendar == entry.calendar:
+                return origin
+        return self.origin
+
+    def get_departure_buffer(self, origin: str) -> datetime.timedelta:
+        for station, minutes in self.departure_buffers:
+            if station == origin:
+                return datetime.timedelta(minutes=minutes)
+        return datetime.timedelta(minutes=self.departure_buffer)
+
+    def get_alternatives_of(self, station: str) -> Tuple[str, ...]:
+        key = normalize_station(station)
+        return tuple(alternative for name, alternative in self.alternative_stations if normalize_station(name) == key)
+
+    def needs_alternatives(self, connections: Iterable[TravelInformation]) -> bool:
+        """Alternatives are only looked up if the first connection is canceled or delayed beyond the threshold."""
+        if not self.alternative_stations:
+            return False
+        first = next(iter(connections), None)
+        if first is None:
+            return False
+        # Entries saved before the minimum of one minute existed would otherwise query alternatives on every refresh.
+        return first.canceled or first.departure_delay >= max(self.alternative_delay_minutes, 1)
 
     def get_compiled_expressions(self) -> Tuple[re.Pattern, ...]:
-        return tuple(re.compile(expr, re.IGNORECASE | re.UNICODE) for expr in self.filtered_regular_expressions)
+        return tuple(compile_expression(expr) for expr in self.filtered_regular_expressions)
 
     @property
     def scan_duration_dict(self) -> Dict[str, Any]:
@@ -58,16 +188,119 @@ class CalendarEntryResult:
         return dt.parse_datetime(self.end) or dt.parse_date(self.end)
 
 
+# Start, end, default origin, calendar, summary and the route of a calendar entry.
+MatchedEntry = Tuple[datetime.datetime, datetime.datetime, str, str, str, Tuple[str, str]]
+# Resolves a location to a known station without any upstream lookup.
+LocationResolver = Callable[[str], Optional[str]]
+
+
+class CalendarMatcher:
+    """Parses calendar entries and matches them against the configured expressions.
+
+    Does not access home assistant and can run in the executor. It is created once per configuration, so the
+    expressions are only compiled once.
+    """
+
+    def __init__(self, config: GathererConfig) -> None:
+        self.config = config
+        self.expressions = config.get_compiled_expressions()
+        # Seconds spent per expression since the last reset, reset on every refresh.
+        self.costs = [0.0] * len(self.expressions)
+
+    def reset_costs(self) -> None:
+        self.costs = [0.0] * len(self.expressions)
+
+    def get_costs(self) -> Dict[str, float]:
+        return {expr.pattern: cost for expr, cost in zip(self.expressions, self.costs)}
+
+    def match(
+        self, entries: Iterable[CalendarEntryResult], resolve_location: LocationResolver | None = None
+    ) -> List[MatchedEntry]:
+        matched_entries = (self.match_entry(entry, resolve_location) for entry in entries)
+        return self.sort([matched_entry for matched_entry in matched_entries if matched_entry is not None])
+
+    @staticmethod
+    def sort(matched_entries: List[MatchedEntry]) -> List[MatchedEntry]:
+        return sorted(matched_entries, key=lambda e: _force_convert_to_datetime(e[0]))
+
+    def match_entry(
+        self, entry: CalendarEntryResult, resolve_location: LocationResolver | None = None
+    ) -> MatchedEntry | None:
+        start_dt, end_dt = entry.start_dt, entry.end_dt
+        if not isinstance(start_dt, datetime.datetime) or not isinstance(end_dt, datetime.datetime):
+            return None
+        origin = self.config.get_origin_of(entry)
+        # A location which is a known station is the destination, the expressions only run for the other entries.
+        route = self.match_location(entry.location, origin, resolve_location)
+        if route is None:
+            route = self.match_summary(entry.summary, origin)
+        if route is None:
+            return None
+        return start_dt, end_dt, origin, entry.calendar, entry.summary, route
+
+    def match_location(
+        self, location: str | None, origin: str, resolve_location: LocationResolver | None
+    ) -> Tuple[str, str] | None:
+        if not location or resolve_location is None or not self.config.location_destinations:
+            return None
+        destination = resolve_location(_convert_destination(location, self.config.mappings))
+        if destination is None or normalize_station(destination) == normalize_station(origin):
+            return None
+        return origin, destination
+
+    def match_summary(self, summary: str, origin: str) -> Tuple[str, str] | None:
+        summary = summary[:MAX_SUMMARY_LENGTH]
+        for index, expr in enumerate(self.expressions):
+            start = time.perf_counter()
+            match = expr.match(summary)
+            self.costs[index] += time.perf_counter() - start
+            if match:
+                groupdict = match.groupdict()
+                destination = groupdict.get("destination") or match.groups()[-1]
+                return groupdict.get("origin") or origin, _convert_destination(destination, self.config.mappings)
+        return None
+
+
+def _resolve_local_station(stations: StationIndex, station_store: StationStore, query: str) -> str | None:
+    return stations.get(query) or station_store.get(query)
+
+
+class CachedCalendar(NamedTuple):
+    entries: Tuple[CalendarEntryResult, ...]
+    window_end: datetime.datetime
+    fetched_at: datetime.datetime
+
+
 class PlannedTravelTime(NamedTuple):
     start: datetime.datetime
     end: datetime.datetime
     origin: str
     destination: str
+    # The calendars the travel was found in.
+    calendars: Tuple[str, ...] = ()
+
+
+class AlternativeConnection(NamedTuple):
+    origin: str
+    destination: str
+    connection: TravelInformation
+
+    @property
+    def actual_arrival_dt(self) -> datetime.datetime:
+        return self.connection.arrival_dt + datetime.timedelta(minutes=self.connection.arrival_delay)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"origin": self.origin, "destination": self.destination, **self.connection.to_dict()}
+
+    def to_compact_dict(self) -> Dict[str, Any]:
+        return {"o": self.origin, "d": self.destination, "c": self.connection.to_compact_dict()}
 
 
 class PossibleTravelTimes(NamedTuple):
     planned_travel_time: PlannedTravelTime
     connections: Tuple[TravelInformation, ...]
+    # Connections via alternative stations, only looked up if the first connection is canceled or heavily delayed.
+    alternatives: Tuple[AlternativeConnection, ...] = ()
 
     @property
     def origin(self) -> str:
@@ -213,10 +446,38 @@ class PossibleTravelTimes(NamedTuple):
         else:
             return self.connections[1].products
 
-    def to_dict(self) -> dict:
+    @property
+    def viable_connection(self) -> TravelInformation | None:
+        for connection in self.connections:
+            if not connection.canceled:
+                return connection
+        return None
+
+    def without_departed(self, now: datetime.datetime) -> PossibleTravelTimes:
+        connections = tuple(connection for connection in self.connections if connection.actual_departure_dt > now)
+        if len(connections) == 0 and len(self.connections) > 0:
+            # Keep the last departed connection while the trip is still ongoing.
+            connections = self.connections[-1:]
+        if len(connections) == len(self.connections):
+            return self
+        return self._replace(connections=connections)
+
+    def leave_by(self, buffer: datetime.timedelta) -> datetime.datetime | None:
+        if len(self.connections) == 0:
+            return self.planned_travel_time.start - buffer
+        # Fall back to the next alternative if the first connection is canceled.
+        connection = self.viable_connection
+        if connection is None:
+            return None
+        return connection.departure_dt + datetime.timedelta(minutes=connection.departure_delay) - buffer
+
+    def to_dict(self, compact: bool = False) -> dict:
+        if compact:
+            return self.to_compact_dict()
         return {
             "origin": self.origin,
             "destination": self.destination,
+            "calendars": self.planned_travel_time.calendars,
             "start": self.start,
             "end": self.end,
             "start_string": self.start_string,
@@ -227,8 +488,23 @@ class PossibleTravelTimes(NamedTuple):
             "products": self.products,
             "departure_delay": self.departure_delay,
             "connections": [conn.to_dict() for conn in self.connections],
+            "alternatives": [alternative.to_dict() for alternative in self.alternatives],
         }
 
+    def to_compact_dict(self) -> dict:
+        # Short keys and epoch seconds keep the recorded attribute payload small.
+        # The string representations are left out as they can be derived from the timestamps.
+        compact = {
+            "o": self.origin,
+            "d": self.destination,
+            "s": _to_epoch(self.start),
+            "e": _to_epoch(self.end),
+            "c": [conn.to_compact_dict() for conn in self.connections],
+        }
+        if self.alternatives:
+            compact["a"] = [alternative.to_compact_dict() for alternative in self.alternatives]
+        return compact
+
 
 class TravelInformation(NamedTuple):
     reference_time: datetime.datetime
@@ -265,6 +541,10 @@ class TravelInformation(NamedTuple):
     def arrival_dt(self) -> datetime.datetime:
         return self._normalize_time_string(self.arrival)
 
+    @property
+    def actual_departure_dt(self) -> datetime.datetime:
+        return self.departure_dt + datetime.timedelta(minutes=self.departure_delay)
+
     @property
     def time_timedelta(self) -> datetime.timedelta:
         split_time = self.time.split(":")
@@ -275,6 +555,10 @@ class TravelInformation(NamedTuple):
 
         return datetime.timedelta(hours=hours, minutes=minutes)
 
+    @property
+    def details_version(self) -> DetailsVersion:
+        return self.departure_delay, self.arrival_delay, self.canceled
+
     @classmethod
     def from_dict(self, reference_time: datetime.datetime, data: Dict[str, Any]) -> TravelInformation:
         return TravelInformation(
@@ -285,7 +569,7 @@ class TravelInformation(NamedTuple):
             transfers=data.get("transfers", None),
             time=data.get("time", "00:00"),
             price=data.get("price", None),
-            products=tuple(data["products"]),
+            products=tuple(sys.intern(product) for product in data["products"]),
             arrival_delay=data.get("delay", {}).get("delay_arrival", 0),
             departure_delay=data.get("delay", {}).get("delay_departure", 0),
             canceled=data.get("canceled", False),
@@ -307,9 +591,22 @@ class TravelInformation(NamedTuple):
             "canceled": self.canceled,
         }
 
+    def to_compact_dict(self) -> Dict[str, Any]:
+        return {
+            "d": _to_epoch(self.departure_dt),
+            "a": _to_epoch(self.arrival_dt),
+            "dd": self.departure_delay,
+            "ad": self.arrival_delay,
+            "t": self.transfers,
+            "p": self.products,
+            "o": self.ontime,
+            "x": self.canceled,
+        }
+
 
 class GathererResult(NamedTuple):
     travel_times: Tuple[PossibleTravelTimes, ...]
+    leave_by: datetime.datetime | None = None
 
     @property
     def exists(self) -> bool:
@@ -460,6 +757,10 @@ class GathererResult(NamedTuple):
         return self.travel_times[1]
 
 
+def _to_epoch(value: datetime.datetime) -> int:
+    return int(value.timestamp())
+
+
 def _convert_destination(destination: str, mappings: Iterable[Tuple[str, str]]) -> str:
     destination = destination.strip()
     for pattern, replacement in mappings:
@@ -468,72 +769,232 @@ def _convert_destination(destination: str, mappings: Iterable[Tuple[str, str]])
     return destination
 
 
+def deduplicate_planned_travel_times(
+    planned_travel_times: Iterable[PlannedTravelTime], tolerance: datetime.timedelta
+) -> List[PlannedTravelTime]:
+    """Merges travels on the same route starting within the tolerance of each other, like the same trip being in
+    a personal and a shared calendar.
+
+    The merged travel keeps the earliest start, the latest end and all calendars it was found in, so each trip is
+    only looked up once.
+    """
+    deduplicated: List[PlannedTravelTime] = []
+    latest_of_route: Dict[Tuple[str, str], int] = {}
+    for planned in sorted(planned_travel_times, key=lambda planned: planned.start):
+        route = (normalize_station(planned.origin), normalize_station(planned.destination))
+        index = latest_of_route.get(route)
+        if index is not None and planned.start - deduplicated[index].start <= tolerance:
+            kept = deduplicated[index]
+            deduplicated[index] = kept._replace(
+                end=max(kept.end, planned.end),
+                calendars=kept.calendars
+                + tuple(calendar for calendar in planned.calendars if calendar not in kept.calendars),
+            )
+            continue
+        latest_of_route[route] = len(deduplicated)
+        deduplicated.append(planned)
+    return deduplicated
+
+
 def _force_convert_to_datetime(item: datetime.datetime | datetime.date) -> datetime.datetime:
     if isinstance(item, datetime.datetime):
         return dt.as_local(item)
     return dt.as_local(datetime.datetime(year=item.year, month=item.month, day=item.day))
 
 
+def _cap_calendar_entries(
+    calendar: str, entries: List[CalendarEntryResult], window_end: datetime.datetime
+) -> Tuple[Tuple[CalendarEntryResult, ...], datetime.datetime]:
+    """Keeps the earliest events of a calendar exceeding the cap and moves the window end before the dropped ones.
+
+    The dropped events are fetched by a later refresh once the kept ones ended, instead of being skipped until the
+    next full refresh.
+    """
+    if len(entries) <= MAX_CACHED_CALENDAR_ENTRIES:
+        return tuple(entries), window_end
+    entries = sorted(entries, key=lambda entry: _force_convert_to_datetime(entry.start_dt))
+    capped_end = _force_convert_to_datetime(entries[MAX_CACHED_CALENDAR_ENTRIES].start_dt)
+    kept = [
+        entry
+        for entry in entries[:MAX_CACHED_CALENDAR_ENTRIES]
+        if _force_convert_to_datetime(entry.start_dt) < capped_end
+    ]
+    if not kept:
+        # All kept events start at the same time, moving the window end would never make progress.
+        kept, capped_end = entries[:MAX_CACHED_CALENDAR_ENTRIES], window_end
+    _LOGGER.warning(
+        f"Calendar {calendar} has more than {MAX_CACHED_CALENDAR_ENTRIES} events in the scan window, "
+        f"events starting from {capped_end} are fetched once earlier events ended"
+    )
+    return tuple(kept), min(capped_end, window_end)
+
+
 class DataGatherer:
-    def __init__(self, hass: HomeAssistant, schiene: Schiene) -> None:
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        schiene: Schiene,
+        loop_budget_ms: float = DEFAULT_LOOP_BUDGET_MS,
+        connection_cache: ConnectionCache | None = None,
+        connection_max_age: float = 0,
+    ) -> None:
         self.schiene = schiene
         self.hass = hass
+        # Trackers always query fresh connections by default, they only join identical queries already in flight.
+        self.connection_cache = connection_cache if connection_cache is not None else ConnectionCache()
+        self.connection_max_age = connection_max_age
+        self.budget = LoopBudget(loop_budget_ms)
+        self.previous_result: GathererResult | None = None
+        # The key and the details of the connection the details were fetched for last.
+        self.previous_details: Tuple[DetailsKey, JourneyDetails] | None = None
+        self.stations = StationIndex(hass, schiene)
+        self.calendar_cache: Dict[str, CachedCalendar] = {}
+        self.invalidated_calendars: Set[str] = set()
+        self.trips = TripIndex()
+        self.matcher: CalendarMatcher | None = None
+        self.prefetched: Dict[PlannedTravelTime, List[Dict[str, Any]]] = {}
+        self.expression_costs: Dict[str, float] = {}
+        self.details = JourneyDetailsCache()
+
+    def cache_sizes(self) -> Dict[str, int]:
+        return {
+            "stations": len(self.stations),
+            "calendars": len(self.calendar_cache),
+            "calendar_entries": sum(len(cached.entries) for cached in self.calendar_cache.values()),
+            "trips": len(self.trips),
+            "prefetched": len(self.prefetched),
+            "connections": len(self.connection_cache),
+            "details": len(self.details),
+        }
+
+    @callback
+    def async_track_calendars(self, config: GathererConfig) -> CALLBACK_TYPE:
+        @callback
+        def _invalidate_calendar(event: Event) -> None:
+            self.invalidated_calendars.add(event.data["entity_id"])
+
+        return async_track_state_change_event(self.hass, list(config.calendars), _invalidate_calendar)
+
+    async def _get_calendar_events(
+        self, calendar: str, start: datetime.datetime, end: datetime.datetime
+    ) -> List[CalendarEntryResult]:
+        payload = await self.hass.services.async_call(
+            "calendar",
+            "get_events",
+            service_data={
+                "entity_id": calendar,
+                "start_date_time": start.isoformat(),
+                "end_date_time": end.isoformat(),
+            },
+            return_response=True,
+            blocking=True,
+        )
+        return [CalendarEntryResult(calendar=calendar, **event_dict) for event_dict in payload[calendar]["events"]]
+
+    async def _get_cached_calendar(
+        self, calendar: str, now: datetime.datetime, window_end: datetime.datetime
+    ) -> CachedCalendar:
+        cached = self.calendar_cache.get(calendar)
+        if (
+            cached is None
+            or calendar in self.invalidated_calendars
+            or now - cached.fetched_at >= CALENDAR_FULL_REFRESH_INTERVAL
+        ):
+            _LOGGER.debug(f"Fetching all events of calendar {calendar}")
+            self.invalidated_calendars.discard(calendar)
+            entries = await self._get_calendar_events(calendar, now, window_end)
+            entries, window_end = _cap_calendar_entries(calendar, entries, window_end)
+            return CachedCalendar(entries=entries, window_end=window_end, fetched_at=now)
+
+        # Only fetch the slice the window moved forward. Events overlapping the previous window end were already
+        # part of the last fetch.
+        entries = [entry for entry in cached.entries if _force_convert_to_datetime(entry.end_dt) > now]
+        if window_end > cached.window_end:
+            _LOGGER.debug(f"Fetching new events of calendar {calendar}")
+            entries.extend(
+                entry
+                for entry in await self._get_calendar_events(calendar, cached.window_end, window_end)
+                if _force_convert_to_datetime(entry.start_dt) >= cached.window_end
+            )
+        entries, window_end = _cap_calendar_entries(calendar, entries, window_end)
+        return CachedCalendar(entries=entries, window_end=window_end, fetched_at=cached.fetched_at)
 
     async def _get_calendar_entries(self, config: GathererConfig) -> List[CalendarEntryResult]:
         calendar_entries: List[CalendarEntryResult] = []
+        now = dt.now()
+        window_end = now + datetime.timedelta(**config.scan_duration_dict)
         for calendar in config.calendars:
             _LOGGER.debug(f"Checking calendar {calendar}")
             state = self.hass.states.get(calendar)
             # Skip any calendars which do not work
             if state is None or state.state == "unavailable":
+                self.calendar_cache.pop(calendar, None)
                 continue
 
-            payload = await self.hass.services.async_call(
-                "calendar",
-                "get_events",
-                service_data={
-                    "entity_id": calendar,
-                    "start_date_time": dt.now().isoformat(),
-                    "duration": config.scan_duration_dict,
-                },
-                return_response=True,
-                blocking=True,
-            )
-            calendar_entries.extend(
-                CalendarEntryResult(calendar=calendar, **event_dict) for event_dict in payload[calendar]["events"]
-            )
+            cached = self.calendar_cache[calendar] = await self._get_cached_calendar(calendar, now, window_end)
+            calendar_entries.extend(cached.entries)
         _LOGGER.debug(f"Found {len(calendar_entries)} calendar entries")
-        return sorted(calendar_entries, key=lambda e: _force_convert_to_datetime(e.start_dt))
+        return calendar_entries
+
+    def _get_matcher(self, config: GathererConfig) -> CalendarMatcher:
+        if self.matcher is None or self.matcher.config != config:
+            self.matcher = CalendarMatcher(config)
+        return self.matcher
 
     async def get_planned_travel_times(self, config: GathererConfig) -> List[PlannedTravelTime]:
         planned_travel_times = []
-        for entry in await self._get_calendar_entries(config):
-            for expr in config.get_compiled_expressions():
-                if match := expr.match(entry.summary):
-                    groupdict = match.groupdict()
-                    origin = groupdict.get("origin") or config.origin
-                    destination = groupdict.get("destination") or match.groups()[-1]
-                    _LOGGER.debug(f"Found calendar candidate {entry}")
-
-                    if isinstance(entry.start_dt, datetime.datetime) and isinstance(entry.end_dt, datetime.datetime):
-                        planned_travel_times.append(
-                            PlannedTravelTime(
-                                start=entry.start_dt,
-                                end=entry.end_dt,
-                                origin=_convert_destination(origin, config.mappings),
-                                destination=_convert_destination(destination, config.mappings),
-                            )
-                        )
-                        break
+        resolve_location: LocationResolver | None = None
+        if config.location_destinations:
+            # Locations are only looked up locally, free text like addresses or meeting links never leaves the
+            # instance.
+            self.stations.add((*config.origins, *(station for _, station in config.mappings)))
+            station_store = await async_get_station_store(self.hass)
+            resolve_location = partial(_resolve_local_station, self.stations, station_store)
+        entries = await self._get_calendar_entries(config)
+        matcher = self._get_matcher(config)
+        matcher.reset_costs()
+        if config.offload_parsing:
+            matched_entries = await self.hass.async_add_executor_job(matcher.match, entries, resolve_location)
+        else:
+            matched_entries = []
+            self.budget.start()
+            async for entry in self.budget.async_iterate(entries):
+                if (matched_entry := matcher.match_entry(entry, resolve_location)) is not None:
+                    matched_entries.append(matched_entry)
+            matched_entries = matcher.sort(matched_entries)
+            self.budget.stop()
+
+        self.budget.start()
+        async for start_dt, end_dt, _, calendar, _, (origin, destination) in self.budget.async_iterate(matched_entries):
+            _LOGGER.debug(f"Found calendar candidate from {origin} to {destination} at {start_dt}")
+            planned_travel_times.append(
+                PlannedTravelTime(
+                    start=start_dt,
+                    end=end_dt,
+                    origin=_convert_destination(origin, config.mappings),
+                    destination=destination,
+                    calendars=(calendar,),
+                )
+            )
+        self.budget.stop()
+        planned_travel_times = deduplicate_planned_travel_times(
+            planned_travel_times, datetime.timedelta(minutes=config.duplicate_tolerance_minutes)
+        )
+        self.expression_costs = matcher.get_costs()
+        if (total_cost := sum(self.expression_costs.values())) > SLOW_MATCHING_WARNING:
+            slowest = max(self.expression_costs, key=lambda pattern: self.expression_costs[pattern])
+            _LOGGER.warning(
+                f"Matching the calendar entries took {total_cost * 1000:.1f}ms, the slowest expression is {slowest}"
+            )
         return planned_travel_times
 
-    def _deduplicate_connections(self, connections: List[TravelInformation]) -> List[TravelInformation]:
+    async def _deduplicate_connections(self, connections: List[TravelInformation]) -> List[TravelInformation]:
         # Remove all connections which have the same departure and arrival time
         # This is necessary as the db api sometimes returns the same connection twice
         # if the connection has multiple stops
         unique_connections = []
         entries_group: Dict[Tuple[datetime.datetime, datetime.datetime], List[TravelInformation]] = {}
-        for conn in connections:
+        async for conn in self.budget.async_iterate(connections):
             match_tuple = (conn.departure_dt, conn.arrival_dt)
             entries_group.setdefault(match_tuple, []).append(conn)
 
@@ -546,35 +1007,241 @@ class DataGatherer:
 
         return sorted(unique_connections, key=lambda c: c.departure_dt)
 
-    async def get_travel_times_of(
-        self, planned_travel_time: PlannedTravelTime, config: GathererConfig
-    ) -> PossibleTravelTimes:
-        connections = await self.hass.async_add_executor_job(
+    async def _convert_connections(
+        self, planned_travel_time: PlannedTravelTime, connections: Iterable[Dict[str, Any]], config: GathererConfig
+    ) -> List[TravelInformation]:
+        # The connections are returned ordered by their departure. This allows to stop converting them as soon
+        # as the remaining ones can not be part of the result anyway.
+        horizon = config.get_lookahead_horizon(planned_travel_time)
+        travel_connections: List[TravelInformation] = []
+        unique_times: Set[Tuple[datetime.datetime, datetime.datetime]] = set()
+        latest_departure: datetime.datetime | None = None
+        async for conn in self.budget.async_iterate(connections):
+            travel_information = TravelInformation.from_dict(planned_travel_time.start, conn)
+            departure_dt = travel_information.departure_dt
+            # Remove all travel connections which are before the planned travel time
+            if departure_dt < planned_travel_time.start:
+                continue
+            if horizon is not None and departure_dt > horizon:
+                break
+            if not config.remove_same_time_duplicates:
+                travel_connections.append(travel_information)
+                if len(travel_connections) >= config.max_results:
+                    break
+                continue
+
+            # Duplicates share the departure time, only stop once a later departure than all kept ones shows up.
+            if len(unique_times) >= config.max_results and latest_departure is not None:
+                if departure_dt > latest_departure:
+                    break
+            unique_times.add((departure_dt, travel_information.arrival_dt))
+            latest_departure = max(latest_departure or departure_dt, departure_dt)
+            travel_connections.append(travel_information)
+        return travel_connections
+
+    async def _query_connections(
+        self, origin: str, destination: str, departure: datetime.datetime
+    ) -> List[Dict[str, Any]]:
+        return await self.connection_cache.async_get(
+            (origin, destination, departure),
             partial(
-                self.schiene.connections,
-                origin=planned_travel_time.origin,
-                destination=planned_travel_time.destination,
-                dt=dt.as_local(planned_travel_time.start),
-            )
+                self.hass.async_add_executor_job,
+                partial(self.schiene.connections, origin=origin, destination=destination, dt=departure),
+            ),
+            max_age=self.connection_max_age,
         )
 
-        all_travel_connections = [TravelInformation.from_dict(planned_travel_time.start, conn) for conn in connections]
+    async def _get_connections(
+        self, planned_travel_time: PlannedTravelTime, config: GathererConfig, now: datetime.datetime
+    ) -> List[Dict[str, Any]]:
+        if planned_travel_time.start - now > PREFETCH_REFRESH_HORIZON:
+            if (connections := self.prefetched.get(planned_travel_time)) is not None:
+                _LOGGER.debug(f"Using prefetched connections from {planned_travel_time.origin} at {now}")
+                return connections
+        else:
+            self.prefetched.pop(planned_travel_time, None)
+
+        connections = await self._query_connections(
+            planned_travel_time.origin, planned_travel_time.destination, dt.as_local(planned_travel_time.start)
+        )
+        # Within the quiet window the connections of the planned travels until the end of the next day are kept,
+        # which takes their queries out of the busy morning hours.
+        if config.in_prefetch_window(now) and planned_travel_time.start - now > PREFETCH_REFRESH_HORIZON:
+            prefetch_end = dt.start_of_local_day(now) + datetime.timedelta(days=2)
+            if planned_travel_time.start < prefetch_end:
+                self.prefetched[planned_travel_time] = connections
+        return connections
 
-        # Remove all travel connections which are before the planned travel time
-        travel_connections = [conn for conn in all_travel_connections if conn.departure_dt >= planned_travel_time.start]
+    async def get_travel_times_of(
+        self, planned_travel_time: PlannedTravelTime, config: GathererConfig, now: datetime.datetime | None = None
+    ) -> PossibleTravelTimes:
+        connections = await self._get_connections(planned_travel_time, config, now or dt.now())
+
+        self.budget.start()
+        travel_connections = await self._convert_connections(planned_travel_time, connections, config)
         if config.remove_same_time_duplicates:
-            travel_connections = self._deduplicate_connections(travel_connections)
+            travel_connections = await self._deduplicate_connections(travel_connections)
+        self.budget.stop()
 
         max_results = config.max_results
         travel_connections = travel_connections[:max_results]
 
+        alternatives: Tuple[AlternativeConnection, ...] = tuple()
+        if config.needs_alternatives(travel_connections):
+            alternatives = await self._get_alternatives(planned_travel_time, config)
+
         return PossibleTravelTimes(
             planned_travel_time=planned_travel_time,
             connections=tuple(travel_connections),
+            alternatives=alternatives,
         )
 
+    @staticmethod
+    def _get_alternative_routes(
+        planned_travel_time: PlannedTravelTime, config: GathererConfig
+    ) -> List[Tuple[str, str]]:
+        origin, destination = planned_travel_time.origin, planned_travel_time.destination
+        origins = (origin, *config.get_alternatives_of(origin))
+        destinations = (destination, *config.get_alternatives_of(destination))
+        planned_route = (normalize_station(origin), normalize_station(destination))
+        routes = []
+        for alternative_origin in origins:
+            for alternative_destination in destinations:
+                route = (normalize_station(alternative_origin), normalize_station(alternative_destination))
+                if route != planned_route and route[0] != route[1]:
+                    routes.append((alternative_origin, alternative_destination))
+        return routes[:MAX_ALTERNATIVE_ROUTES]
+
+    async def _get_alternatives(
+        self, planned_travel_time: PlannedTravelTime, config: GathererConfig
+    ) -> Tuple[AlternativeConnection, ...]:
+        """Queries the routes via the alternative stations of the trip, ranked by their expected arrival."""
+        routes = self._get_alternative_routes(planned_travel_time, config)
+        if not routes:
+            return tuple()
+        departure = dt.as_local(planned_travel_time.start)
+        semaphore = asyncio.Semaphore(MAX_PARALLEL_ALTERNATIVE_QUERIES)
+
+        async def _query(route: Tuple[str, str]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self._query_connections(route[0], route[1], departure)
+
+        results = await asyncio.gather(*(_query(route) for route in routes), return_exceptions=True)
+        alternatives: List[AlternativeConnection] = []
+        self.budget.start()
+        for (origin, destination), result in zip(routes, results):
+            if isinstance(result, BaseException):
+                # A failing alternative must not hide the connections of the trip itself.
+                _LOGGER.warning(f"Could not query the alternative route from {origin} to {destination}: {result}")
+                continue
+            alternative_travel_time = planned_travel_time._replace(origin=origin, destination=destination)
+            alternatives.extend(
+                AlternativeConnection(origin, destination, connection)
+                for connection in await self._convert_connections(alternative_travel_time, result, config)
+                if not connection.canceled
+            )
+        self.budget.stop()
+        alternatives.sort(key=lambda alternative: alternative.actual_arrival_dt)
+        return tuple(alternatives[: config.max_results])
+
     async def collect(self, config: GathererConfig) -> GathererResult:
         travel_times = await self.get_planned_travel_times(config)
-        possible_travel_times = [await self.get_travel_times_of(planned_time, config) for planned_time in travel_times]
+        # Drop the prefetched connections of planned travels which were removed from the calendar.
+        self.prefetched = {
+            planned_time: self.prefetched[planned_time]
+            for planned_time in travel_times
+            if planned_time in self.prefetched
+        }
+        now = dt.now()
+        possible_travel_times = [
+            await self.get_travel_times_of(planned_time, config, now) for planned_time in travel_times
+        ]
+        self.trips = TripIndex(possible_travel_times)
+
+        result = self._get_result(config, tuple(self.trips))
+        # Only the details of the connection one is about to take are fetched on every refresh.
+        if config.journey_details and result.connection is not None:
+            if (connection := result.connection.viable_connection) is not None:
+                origin, destination = result.connection.origin, result.connection.destination
+                details = await self.async_get_details(origin, destination, connection)
+                self._fire_platform_change_event((origin, destination, connection.departure_dt), details, config)
+        self._fire_change_events(result, config)
+        return result
+
+    async def async_get_details(
+        self, origin: str, destination: str, connection: TravelInformation
+    ) -> JourneyDetails | None:
+        """The legs, stops and tracks of a connection, fetched once and again only if its delays change."""
+        key: DetailsKey = (origin, destination, connection.departure_dt)
+        try:
+            return await self.details.async_get(
+                key,
+                connection.details_version,
+                partial(
+                    self.hass.async_add_executor_job,
+                    fetch_journey_details,
+                    self.schiene,
+                    origin,
+                    destination,
+                    connection.departure_dt,
+                ),
+            )
+        except Exception:
+            # Missing details must not make the connections themselves unavailable.
+            _LOGGER.warning(f"Could not fetch the details of the connection from {origin} at {key[2]}", exc_info=True)
+            return None
 
-        return GathererResult(travel_times=tuple(possible_travel_times))
+    def cached_details(self, travel_time: PossibleTravelTimes | None) -> JourneyDetails | None:
+        """The already fetched details of the next viable connection of a trip, without any upstream call."""
+        if travel_time is None or (connection := travel_time.viable_connection) is None:
+            return None
+        return self.details.get(
+            (travel_time.origin, travel_time.destination, connection.departure_dt), connection.details_version
+        )
+
+    def result_at(self, config: GathererConfig, now: datetime.datetime) -> GathererResult:
+        """Roll the last collected trips forward to the given time without any upstream calls."""
+        self.trips.evict(now)
+        return self._get_result(
+            config, tuple(travel_time.without_departed(now) for travel_time in self.trips.upcoming(now))
+        )
+
+    def next_change_at(self, now: datetime.datetime) -> datetime.datetime | None:
+        """The next time a connection departs or a trip ends after which result_at changes."""
+        changes = []
+        for travel_time in self.trips.upcoming(now):
+            changes.append(travel_time.planned_travel_time.end)
+            changes.extend(
+                departure
+                for departure in (connection.actual_departure_dt for connection in travel_time.connections)
+                if departure > now
+            )
+        return min(changes, default=None)
+
+    def _get_result(self, config: GathererConfig, travel_times: Tuple[PossibleTravelTimes, ...]) -> GathererResult:
+        leave_by = None
+        if len(travel_times) > 0:
+            next_travel_time = travel_times[0]
+            leave_by = next_travel_time.leave_by(config.get_departure_buffer(next_travel_time.origin))
+
+        return GathererResult(travel_times=travel_times, leave_by=leave_by)
+
+    def _fire_platform_change_event(
+        self, key: DetailsKey, details: JourneyDetails | None, config: GathererConfig
+    ) -> None:
+        # The track is only known from the details, so it is compared whenever the details were fetched again.
+        if details is None:
+            return
+        previous_details, self.previous_details = self.previous_details, (key, details)
+        if previous_details is None or previous_details[0] != key:
+            return
+        if (event := get_platform_change_event(key, previous_details[1], details)) is not None:
+            event_type, event_data = event
+            self.hass.bus.async_fire(event_type, {"home_station": config.origin, **event_data})
+
+    def _fire_change_events(self, result: GathererResult, config: GathererConfig) -> None:
+        previous_result, self.previous_result = self.previous_result, result
+        if previous_result is None:
+            return
+        for event_type, event_data in get_change_events(previous_result, result):
+            self.hass.bus.async_fire(event_type, {"home_station": config.origin, **event_data})
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import datetime
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, NamedTuple, Tuple
+
+from homeassistant.util import dt
+
+if TYPE_CHECKING:
+    from weiche import Schiene
+    from weiche.objects import ConnectionSegment
+
+# Upper bound of the cached journey details, the oldest ones are dropped first.
+MAX_CACHED_DETAILS = 64
+# Connections searched for the one departing at the scheduled time, earlier or canceled ones may come first.
+DETAILS_SEARCH_LIMIT = 10
+
+# Origin, destination and scheduled departure of a connection.
+DetailsKey = Tuple[str, str, datetime.datetime]
+# Departure delay, arrival delay and cancellation of the connection the details were fetched for.
+DetailsVersion = Tuple[int, int, bool]
+
+
+class JourneyStop(NamedTuple):
+    name: str
+    departure: datetime.datetime | None
+    track: str | None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "departure": self.departure.isoformat() if self.departure is not None else None,
+            "track": self.track,
+        }
+
+
+class JourneyLeg(NamedTuple):
+    name: str
+    direction: str | None
+    origin: str
+    destination: str
+    departure: datetime.datetime | None
+    arrival: datetime.datetime
+    stops: Tuple[JourneyStop, ...]
+
+    @property
+    def departure_track(self) -> str | None:
+        return self.stops[0].track if self.stops else None
+
+    @property
+    def arrival_track(self) -> str | None:
+        return self.stops[-1].track if self.stops else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "direction": self.direction,
+            "origin": self.origin,
+            "destination": self.destination,
+            "departure": self.departure.isoformat() if self.departure is not None else None,
+            "arrival": self.arrival.isoformat(),
+            "departure_track": self.departure_track,
+            "arrival_track": self.arrival_track,
+            "stops": [stop.to_dict() for stop in self.stops],
+        }
+
+
+class JourneyDetails(NamedTuple):
+    legs: Tuple[JourneyLeg, ...]
+
+    @property
+    def departure_track(self) -> str | None:
+        return self.legs[0].departure_track if self.legs else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"departure_track": self.departure_track, "legs": [leg.to_dict() for leg in self.legs]}
+
+
+def _leg_from_segment(segment: ConnectionSegment) -> JourneyLeg:
+    return JourneyLeg(
+        name=segment.means_of_transport.name,
+        direction=segment.means_of_transport.direction,
+        origin=segment.departure_location,
+        destination=segment.arrival_location,
+        departure=segment.departure_time,
+        arrival=segment.arrival_time,
+        stops=tuple(JourneyStop(stop.name, stop.departure_time, stop.track) for stop in segment.stops),
+    )
+
+
+def fetch_journey_details(
+    schiene: Schiene, origin: str, destination: str, departure: datetime.datetime
+) -> JourneyDetails | None:
+    """Searches the connection departing at the given time again and returns its legs, stops and tracks.
+
+    The connection list of weiche does not contain any details, so this costs two station lookups and one
+    connection search. Blocking, it has to run in the executor.
+    """
+    from custom_components.db_train_tracker.proxies import ProxyPool
+
+    if isinstance(schiene, ProxyPool):
+        return schiene.journey_details(origin, destination, departure)
+
+    origin_locations = schiene.api.search_locations(origin, limit=1)
+    destination_locations = schiene.api.search_locations(destination, limit=1)
+    if not origin_locations or not destination_locations:
+        return None
+    # Deutsche Bahn returns local times without a time zone.
+    scheduled = _local_minute(departure)
+    for connection in schiene.api.search_connections(
+        at=departure,
+        from_location=origin_locations[0].id,
+        to_location=destination_locations[0].id,
+        limit=DETAILS_SEARCH_LIMIT,
+    ):
+        first_departure = connection.segments[0].departure_time if connection.segments else None
+        if first_departure is not None and _local_minute(first_departure) == scheduled:
+            return JourneyDetails(legs=tuple(_leg_from_segment(segment) for segment in connection.segments))
+    return None
+
+
+def _local_minute(value: datetime.datetime) -> datetime.datetime:
+    if value.tzinfo is not None:
+        value = dt.as_local(value).replace(tzinfo=None)
+    return value.replace(second=0, microsecond=0)
+
+
+class JourneyDetailsCache:
+    """Journey details per connection, fetched only on demand.
+
+    Details are kept as long as the delays and the cancellation of their connection stay the same, a change
+    usually also changes the tracks or the stops.
+    """
+
+    def __init__(self, max_size: int = MAX_CACHED_DETAILS) -> None:
+        self.max_size = max_size
+        self._entries: Dict[DetailsKey, Tuple[DetailsVersion, JourneyDetails | None]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: DetailsKey, version: DetailsVersion) -> JourneyDetails | None:
+        cached = self._entries.get(key)
+        if cached is None or cached[0] != version:
+            return None
+        return cached[1]
+
+    async def async_get(
+        self,
+        key: DetailsKey,
+        version: DetailsVersion,
+        fetch: Callable[[], Awaitable[JourneyDetails | None]],
+    ) -> JourneyDetails | None:
+        cached = self._entries.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        details = await fetch()
+        # Connections without details are cached as well, so they are not searched again on every refresh.
+        self._entries.pop(key, None)
+        self._entries[key] = (version, details)
+        while len(self._entries) > self.max_size:
+            del self._entries[next(iter(self._entries))]
+        return details
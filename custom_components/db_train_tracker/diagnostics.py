@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import os
+import tracemalloc
+from typing import Any, Dict, List
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from custom_components.db_train_tracker.const import CONF_PROXY, DATA_TRACKER, DOMAIN
+
+# Number of source lines listed in the memory snapshot, ordered by allocated size.
+TOP_ALLOCATIONS = 10
+
+
+def get_memory_snapshot(limit: int = TOP_ALLOCATIONS) -> Dict[str, Any]:
+    """Returns the memory currently held by the integration if tracemalloc is tracing.
+
+    Tracing is not started here, as allocations made before the start are not visible. Start it with the
+    profiler integration or by setting PYTHONTRACEMALLOC before starting Home Assistant.
+    """
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+
+    component_filter = tracemalloc.Filter(True, os.path.join(os.path.dirname(__file__), "*"))
+    snapshot = tracemalloc.take_snapshot().filter_traces([component_filter])
+    statistics = snapshot.statistics("lineno")
+    return {
+        "tracing": True,
+        "total_size": sum(statistic.size for statistic in statistics),
+        "top_allocations": [
+            {"location": str(statistic.traceback), "size": statistic.size, "count": statistic.count}
+            for statistic in statistics[:limit]
+        ],
+    }
+
+
+def _get_proxy_statistics(tracker: Any) -> List[Dict[str, Any]]:
+    if tracker is None:
+        return []
+    # The tracker created its client already, so importing the proxies does not load anything new.
+    from custom_components.db_train_tracker.proxies import ProxyPool
+
+    if not isinstance(tracker.schiene, ProxyPool):
+        return []
+    return tracker.schiene.statistics()
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> Dict[str, Any]:
+    data = hass.data[DOMAIN][entry.entry_id]
+    tracker = data.get(DATA_TRACKER)
+    return {
+        "config": async_redact_data(
+            {key: value for key, value in data.items() if key not in (DATA_TRACKER, "unsub_options_update_listener")},
+            {CONF_PROXY},
+        ),
+        "caches": tracker.cache_sizes() if tracker is not None else {},
+        "proxies": _get_proxy_statistics(tracker),
+        "expression_costs_ms": (
+            {pattern: round(cost * 1000, 3) for pattern, cost in tracker.gatherer.expression_costs.items()}
+            if tracker is not None
+            else {}
+        ),
+        "export": tracker.exporter.to_dict() if tracker is not None and tracker.exporter is not None else None,
+        "memory": get_memory_snapshot(),
+    }
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+from custom_components.db_train_tracker.const import EVENT_CANCELED, EVENT_DELAY_CHANGED, EVENT_PLATFORM_CHANGED
+
+if TYPE_CHECKING:
+    from custom_components.db_train_tracker.data_gatherer import GathererResult, TravelInformation
+    from custom_components.db_train_tracker.details import JourneyDetails
+
+ConnectionKey = Tuple[str, str, datetime.datetime]
+
+
+def _index_connections(result: GathererResult) -> Dict[ConnectionKey, TravelInformation]:
+    return {
+        (travel_time.origin, travel_time.destination, connection.departure_dt): connection
+        for travel_time in result.travel_times
+        for connection in travel_time.connections
+    }
+
+
+def get_change_events(previous: GathererResult, current: GathererResult) -> List[Tuple[str, Dict[str, Any]]]:
+    """Diff two consecutive results and return the events of connections which changed in between.
+
+    Connections are matched by origin, destination and scheduled departure. Connections which only appear in one
+    of the results do not create any events.
+    """
+    events: List[Tuple[str, Dict[str, Any]]] = []
+    previous_connections = _index_connections(previous)
+    for key, connection in _index_connections(current).items():
+        previous_connection = previous_connections.get(key)
+        if previous_connection is None:
+            continue
+        origin, destination, departure = key
+        base_data = {
+            "origin": origin,
+            "destination": destination,
+            "departure": departure.isoformat(),
+        }
+        if connection.canceled and not previous_connection.canceled:
+            events.append((EVENT_CANCELED, base_data))
+        if (
+            connection.departure_delay != previous_connection.departure_delay
+            or connection.arrival_delay != previous_connection.arrival_delay
+        ):
+            events.append(
+                (
+                    EVENT_DELAY_CHANGED,
+                    {
+                        **base_data,
+                        "departure_delay": connection.departure_delay,
+                        "previous_departure_delay": previous_connection.departure_delay,
+                        "arrival_delay": connection.arrival_delay,
+                        "previous_arrival_delay": previous_connection.arrival_delay,
+                    },
+                )
+            )
+    return events
+
+
+def get_platform_change_event(
+    key: ConnectionKey, previous: JourneyDetails, current: JourneyDetails
+) -> Tuple[str, Dict[str, Any]] | None:
+    """Compare two fetched journey details of the same connection and return the event if its track changed."""
+    if previous.departure_track is None or current.departure_track is None:
+        return None
+    if previous.departure_track == current.departure_track:
+        return None
+    origin, destination, departure = key
+    return (
+        EVENT_PLATFORM_CHANGED,
+        {
+            "origin": origin,
+            "destination": destination,
+            "departure": departure.isoformat(),
+            "track": current.departure_track,
+            "previous_track": previous.departure_track,
+        },
+    )
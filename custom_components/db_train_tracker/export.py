@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import datetime
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.util import dt
+
+from custom_components.db_train_tracker.const import DATA_EXPORTERS, DEFAULT_EXPORT_RETENTION
+from custom_components.db_train_tracker.data_gatherer import GathererResult
+
+_LOGGER = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = (
+    "snapshot",
+    "origin",
+    "destination",
+    "planned_start",
+    "departure",
+    "arrival",
+    "departure_delay",
+    "arrival_delay",
+    "canceled",
+    "ontime",
+    "transfers",
+    "duration",
+    "products",
+)
+# Queued rows are written once this many are waiting, or at the latest when the flush interval passed.
+EXPORT_BATCH_ROWS = 500
+EXPORT_FLUSH_INTERVAL = datetime.timedelta(minutes=15)
+# Upper bound of the queued rows if writing keeps failing, the oldest rows are dropped first.
+MAX_PENDING_ROWS = 10000
+
+ExportRow = Tuple[Any, ...]
+
+
+def get_partition_path(directory: Path, day: datetime.date) -> Path:
+    return directory / f"{day.isoformat()}.csv"
+
+
+def write_partitions(
+    directory: Path, rows: Iterable[ExportRow], retention_days: int, today: datetime.date
+) -> Tuple[int, int]:
+    """Appends the rows to the file of the day they were taken and deletes the files older than the retention.
+
+    Returns the number of written rows and deleted files. Blocking, it has to run in the executor.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    partitions: Dict[datetime.date, List[ExportRow]] = {}
+    for row in rows:
+        partitions.setdefault(row[0].date(), []).append(row)
+
+    written = 0
+    for day, day_rows in partitions.items():
+        path = get_partition_path(directory, day)
+        is_new = not path.exists()
+        with path.open("a", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            if is_new:
+                writer.writerow(EXPORT_COLUMNS)
+            writer.writerows(
+                (snapshot.isoformat(), *columns[:-1], ";".join(columns[-1])) for snapshot, *columns in day_rows
+            )
+        written += len(day_rows)
+
+    deleted = 0
+    # The current day is always kept, even with a retention below one day.
+    oldest_kept = today - datetime.timedelta(days=max(retention_days, 1) - 1)
+    for path in directory.glob("*.csv"):
+        try:
+            day = datetime.date.fromisoformat(path.stem)
+        except ValueError:
+            continue
+        if day < oldest_kept:
+            path.unlink()
+            deleted += 1
+    return written, deleted
+
+
+class ConnectionExporter:
+    """Append only export of the connections of every refresh into one CSV file per day.
+
+    Refreshes only queue the rows. They are written in batches by the executor, so the export never waits for
+    the disk while updating the sensor.
+    """
+
+    def __init__(self, hass: HomeAssistant, directory: Path, retention_days: int = DEFAULT_EXPORT_RETENTION) -> None:
+        self.hass = hass
+        self.directory = directory
+        self.retention_days = retention_days
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self._pending: List[ExportRow] = []
+        self._lock = asyncio.Lock()
+        self._flush_task: asyncio.Future[int] | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, snapshot: datetime.datetime, result: GathererResult) -> None:
+        snapshot = dt.as_local(snapshot).replace(microsecond=0)
+        for travel_time in result.travel_times:
+            planned_start = travel_time.planned_travel_time.start.isoformat()
+            for connection in travel_time.connections:
+                self._pending.append(
+                    (
+                        snapshot,
+                        travel_time.origin,
+                        travel_time.destination,
+                        planned_start,
+                        connection.departure_dt.isoformat(),
+                        connection.arrival_dt.isoformat(),
+                        connection.departure_delay,
+                        connection.arrival_delay,
+                        connection.canceled,
+                        connection.ontime,
+                        connection.transfers,
+                        connection.time,
+                        connection.products,
+                    )
+                )
+        if len(self._pending) > MAX_PENDING_ROWS:
+            dropped = len(self._pending) - MAX_PENDING_ROWS
+            del self._pending[:dropped]
+            self.rows_dropped += dropped
+        if len(self._pending) >= EXPORT_BATCH_ROWS:
+            self.async_schedule_flush()
+
+    @callback
+    def async_schedule_flush(self, *_: Any) -> None:
+        """Writes the queued rows in the background, unless a write is already running."""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = self.hass.async_create_task(self.async_flush())
+
+    async def async_flush(self) -> int:
+        """Writes the queued rows and returns how many were written."""
+        async with self._lock:
+            rows, self._pending = self._pending, []
+            try:
+                written, deleted = await self.hass.async_add_executor_job(
+                    write_partitions, self.directory, rows, self.retention_days, dt.now().date()
+                )
+            except OSError as error:
+                _LOGGER.warning(f"Could not export {len(rows)} connections to {self.directory}: {error}")
+                # Keep the rows for the next attempt, rows queued meanwhile are newer.
+                self._pending[:0] = rows[-MAX_PENDING_ROWS:]
+                return 0
+            if deleted:
+                _LOGGER.debug(f"Deleted {deleted} exported days older than {self.retention_days} days")
+            self.rows_written += written
+            return written
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "directory": str(self.directory),
+            "pending": len(self._pending),
+            "written": self.rows_written,
+            "dropped": self.rows_dropped,
+        }
+
+
+def get_exporters(hass: HomeAssistant) -> Dict[str, ConnectionExporter]:
+    """The exporters of all trackers by their home station, flushed together by the flush service."""
+    exporters: Dict[str, ConnectionExporter] = hass.data.setdefault(DATA_EXPORTERS, {})
+    return exporters
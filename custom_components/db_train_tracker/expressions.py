@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import re
+import time
+from typing import Iterator, Tuple
+
+# Calendar summaries are cut to this length before matching, which bounds the cost of any expression.
+MAX_SUMMARY_LENGTH = 256
+# A single match of an expression against a benchmark input may take at most this many seconds.
+MATCH_TIME_BUDGET = 0.01
+BENCHMARK_ATTEMPTS = 3
+
+SAMPLE_SUMMARIES = (
+    "Train Travel to Berlin Hbf",
+    "Train Travel from Fulda Hbf to Wolfsburg Hbf",
+    "Blocker: Travel to München Hbf",
+    "Stuttgart Hbf → Hamburg Hbf",
+    "Weekly sync",
+)
+# Catastrophic backtracking shows on long runs of one character which almost but not completely match.
+ADVERSARIAL_PREFIXES = ("", "Train Travel to ", "Train Travel from ", "Blocker: Travel to ")
+ADVERSARIAL_CHARACTERS = ("a", " ", "1", "-", ".", "→")
+ADVERSARIAL_SUFFIXES = ("", "!", " to")
+
+
+def compile_expression(expression: str) -> re.Pattern:
+    return re.compile(expression, re.IGNORECASE | re.UNICODE)
+
+
+def _benchmark_families() -> Iterator[Tuple[str, str, str]]:
+    for prefix in ADVERSARIAL_PREFIXES:
+        for character in ADVERSARIAL_CHARACTERS:
+            for suffix in ADVERSARIAL_SUFFIXES:
+                yield prefix, character, suffix
+
+
+def _time_match(pattern: re.Pattern, summary: str) -> float:
+    start = time.perf_counter()
+    pattern.match(summary)
+    return time.perf_counter() - start
+
+
+def _exceeds_budget(pattern: re.Pattern, summary: str, budget: float) -> bool:
+    # Measured again before rejecting, so a single pause of the interpreter does not reject a fast expression.
+    return all(_time_match(pattern, summary) > budget for _ in range(BENCHMARK_ATTEMPTS))
+
+
+def is_expression_too_slow(pattern: re.Pattern, budget: float = MATCH_TIME_BUDGET) -> bool:
+    """Benchmarks an expression against sample summaries and adversarial inputs up to the maximum summary length.
+
+    The adversarial inputs grow one character at a time and the benchmark stops at the first match over the
+    budget. Even with exponential backtracking the time grows by a bounded factor per character, so the
+    benchmark itself does not hang on a pathological expression.
+    """
+    if any(_exceeds_budget(pattern, summary, budget) for summary in SAMPLE_SUMMARIES):
+        return True
+    for prefix, character, suffix in _benchmark_families():
+        for length in range(1, MAX_SUMMARY_LENGTH - len(prefix) - len(suffix) + 1):
+            if _exceeds_budget(pattern, prefix + character * length + suffix, budget):
+                return True
+    return False
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import datetime
+import math
+from array import array
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+from custom_components.db_train_tracker.const import DEFAULT_HISTORY_DAYS
+from custom_components.db_train_tracker.data_gatherer import GathererResult
+
+# Delays are tracked in a histogram with one bucket per minute. Anything above is clamped into the last bucket.
+MAX_TRACKED_DELAY = 180
+
+# Upper bounds of the recorded departures per day and of the departures waiting to be recorded.
+MAX_SAMPLES_PER_DAY = 10000
+MAX_PENDING_DEPARTURES = 1000
+
+RouteKey = Tuple[str, str]
+
+
+class RouteStatistics:
+    """Punctuality statistics of one route backed by a fixed size delay histogram."""
+
+    __slots__ = ("histogram", "samples", "canceled")
+
+    def __init__(self) -> None:
+        self.histogram = array("I", bytes(4 * (MAX_TRACKED_DELAY + 1)))
+        self.samples = 0
+        self.canceled = 0
+
+    def add(self, delay: int, canceled: bool) -> None:
+        self.samples += 1
+        if canceled:
+            self.canceled += 1
+        else:
+            self.histogram[min(max(delay, 0), MAX_TRACKED_DELAY)] += 1
+
+    def subtract(self, other: RouteStatistics) -> None:
+        self.samples -= other.samples
+        self.canceled -= other.canceled
+        for index, count in enumerate(other.histogram):
+            if count:
+                self.histogram[index] -= count
+
+    @property
+    def is_empty(self) -> bool:
+        return self.samples == 0
+
+    @property
+    def cancellation_rate(self) -> float | None:
+        if self.samples == 0:
+            return None
+        return self.canceled / self.samples
+
+    def percentile(self, quantile: float) -> int | None:
+        delay_samples = self.samples - self.canceled
+        if delay_samples == 0:
+            return None
+        rank = max(math.ceil(quantile * delay_samples), 1)
+        seen = 0
+        for delay, count in enumerate(self.histogram):
+            seen += count
+            if seen >= rank:
+                return delay
+        return MAX_TRACKED_DELAY
+
+    def to_dict(self) -> Dict[str, int | float | None]:
+        return {
+            "delay_p50": self.percentile(0.5),
+            "delay_p90": self.percentile(0.9),
+            "cancellation_rate": self.cancellation_rate,
+            "delay_samples": self.samples,
+        }
+
+
+class _DaySeries:
+    """Append only samples of a single day together with the per route statistics of that day."""
+
+    __slots__ = ("day", "departures", "delays", "canceled", "routes")
+
+    def __init__(self, day: datetime.date) -> None:
+        self.day = day
+        self.departures = array("q")
+        self.delays = array("h")
+        self.canceled = array("b")
+        self.routes: Dict[RouteKey, RouteStatistics] = {}
+
+    def __len__(self) -> int:
+        return len(self.departures)
+
+    def append(self, route: RouteKey, departure: int, delay: int, canceled: bool) -> bool:
+        if len(self.departures) >= MAX_SAMPLES_PER_DAY:
+            return False
+        self.departures.append(departure)
+        self.delays.append(min(max(delay, -MAX_TRACKED_DELAY), 32767))
+        self.canceled.append(1 if canceled else 0)
+        self.routes.setdefault(route, RouteStatistics()).add(delay, canceled)
+        return True
+
+
+class DelayHistory:
+    """Rolling delay history of the observed connections.
+
+    Each scheduled departure is recorded once, with the last delay observed before it departed. Statistics
+    are kept incrementally, adding a sample or rotating out a day never rescans the stored history.
+    """
+
+    def __init__(self, days: int = DEFAULT_HISTORY_DAYS) -> None:
+        self.days = days
+        self._series: Deque[_DaySeries] = deque()
+        self._totals: Dict[RouteKey, RouteStatistics] = {}
+        self._pending: Dict[Tuple[str, str, datetime.datetime], Tuple[int, bool]] = {}
+
+    def observe(self, result: GathererResult) -> None:
+        for travel_time in result.travel_times:
+            for connection in travel_time.connections:
+                key = (travel_time.origin, travel_time.destination, connection.departure_dt)
+                self._pending[key] = (connection.departure_delay, connection.canceled)
+        while len(self._pending) > MAX_PENDING_DEPARTURES:
+            del self._pending[next(iter(self._pending))]
+
+    def flush(self, now: datetime.datetime) -> None:
+        departed = [key for key in self._pending if key[2] <= now]
+        for key in sorted(departed, key=lambda k: k[2]):
+            delay, canceled = self._pending.pop(key)
+            origin, destination, departure = key
+            self._append((origin, destination), departure, delay, canceled)
+        self._rotate(now.date())
+
+    def sizes(self) -> Dict[str, int]:
+        return {
+            "history_days": len(self._series),
+            "history_samples": sum(len(series) for series in self._series),
+            "history_routes": len(self._totals),
+            "history_pending": len(self._pending),
+        }
+
+    def statistics(self, origin: str | None, destination: str | None) -> RouteStatistics | None:
+        if origin is None or destination is None:
+            return None
+        return self._totals.get((origin, destination))
+
+    def _append(self, route: RouteKey, departure: datetime.datetime, delay: int, canceled: bool) -> None:
+        day = departure.date()
+        if not self._series or self._series[-1].day < day:
+            self._series.append(_DaySeries(day))
+        if self._series[-1].append(route, int(departure.timestamp()), delay, canceled):
+            self._totals.setdefault(route, RouteStatistics()).add(delay, canceled)
+
+    def _rotate(self, today: datetime.date) -> None:
+        oldest_day = today - datetime.timedelta(days=self.days - 1)
+        while self._series and self._series[0].day < oldest_day:
+            evicted = self._series.popleft()
+            for route, statistics in evicted.routes.items():
+                total = self._totals[route]
+                total.subtract(statistics)
+                if total.is_empty:
+                    del self._totals[route]
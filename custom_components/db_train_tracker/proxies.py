@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Sequence, Tuple, TypeVar
+
+import requests
+from weiche import Schiene
+
+from custom_components.db_train_tracker.details import JourneyDetails, fetch_journey_details
+
+_LOGGER = logging.getLogger(__name__)
+
+# A proxy failing this many requests in a row is not used until the ejection time passed.
+PROXY_MAX_CONSECUTIVE_FAILURES = 3
+PROXY_EJECTION_SECONDS = 300
+# Weight of the latest request in the moving average of the latency.
+LATENCY_SMOOTHING = 0.2
+# Only failures of the transport count against a proxy. Errors of the request itself, like a station which
+# cannot be resolved, would fail with any proxy.
+PROXY_FAILURES = (requests.RequestException, TimeoutError)
+
+T = TypeVar("T")
+
+
+def parse_proxies(proxies: str) -> Tuple[str, ...]:
+    return tuple(proxy.strip() for proxy in proxies.split(";") if proxy.strip())
+
+
+class ProxyStatistics:
+    __slots__ = ("requests", "errors", "consecutive_failures", "latency", "ejected_until")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.latency: float | None = None
+        self.ejected_until = 0.0
+
+    def add_success(self, latency: float) -> None:
+        self.requests += 1
+        self.consecutive_failures = 0
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+
+    def add_failure(self, now: float) -> None:
+        self.requests += 1
+        self.errors += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= PROXY_MAX_CONSECUTIVE_FAILURES:
+            self.ejected_until = now + PROXY_EJECTION_SECONDS
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "ejected": self.ejected_until > now,
+        }
+
+
+class ProxyPool(Schiene):
+    """Schiene client spreading the requests round robin over several proxies.
+
+    Proxies failing repeatedly are ejected for a while. If all proxies are ejected the one which is back the
+    soonest is used, so requests are never rejected locally.
+    """
+
+    def __init__(self, proxies: Sequence[str], client_factory: Callable[[str], Schiene] | None = None) -> None:
+        # The requests are handled by one client per proxy. The inherited api is not used by the integration, it
+        # still goes through the first proxy, so no request bypasses the proxies.
+        super().__init__(proxy=proxies[0])
+        factory = client_factory or (lambda proxy: Schiene(proxy=proxy))
+        self.clients = tuple(factory(proxy) for proxy in proxies)
+        self.proxy_statistics = tuple(ProxyStatistics() for _ in proxies)
+        self._next_index = itertools.cycle(range(len(self.clients)))
+        self._lock = threading.Lock()
+
+    def _select(self) -> int:
+        with self._lock:
+            now = time.monotonic()
+            for _ in range(len(self.clients)):
+                index = next(self._next_index)
+                if self.proxy_statistics[index].ejected_until <= now:
+                    return index
+            return min(range(len(self.clients)), key=lambda index: self.proxy_statistics[index].ejected_until)
+
+    def _call(self, request: Callable[[Schiene], T]) -> T:
+        index = self._select()
+        start = time.monotonic()
+        try:
+            result = request(self.clients[index])
+        except PROXY_FAILURES:
+            with self._lock:
+                statistics = self.proxy_statistics[index]
+                statistics.add_failure(time.monotonic())
+                if statistics.consecutive_failures == PROXY_MAX_CONSECUTIVE_FAILURES:
+                    _LOGGER.warning(f"Ejecting proxy {index} for {PROXY_EJECTION_SECONDS}s after repeated failures")
+            raise
+        except Exception:
+            # The proxy answered, the request itself failed.
+            with self._lock:
+                self.proxy_statistics[index].add_success(time.monotonic() - start)
+            raise
+        with self._lock:
+            self.proxy_statistics[index].add_success(time.monotonic() - start)
+        return result
+
+    def stations(self, station: str, limit: int = 10) -> List[Any]:
+        return self._call(lambda client: client.stations(station, limit))
+
+    def connections(self, *args: Any, **kwargs: Any) -> List[Any]:
+        return self._call(lambda client: client.connections(*args, **kwargs))
+
+    def journey_details(self, *args: Any, **kwargs: Any) -> JourneyDetails | None:
+        return self._call(lambda client: fetch_journey_details(client, *args, **kwargs))
+
+    def statistics(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [statistics.to_dict(now) for statistics in self.proxy_statistics]
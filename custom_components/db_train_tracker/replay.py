@@ -0,0 +1,418 @@
+"""Replays an exported calendar against a tracker configuration without a running Home Assistant.
+
+Runs the calendar matching, the station lookups and the connection handling of the trackers against recorded or
+generated connections and prints the matched trips together with the time and memory spent in each stage:
+
+    python -m custom_components.db_train_tracker.replay calendar.ics config.json --now 2024-05-02T06:00
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import json
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterator, List, NamedTuple, Sequence, Tuple, cast
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt
+
+from custom_components.db_train_tracker.const import DATA_STATION_STORE
+from custom_components.db_train_tracker.data_gatherer import (
+    DataGatherer,
+    GathererConfig,
+    GathererResult,
+    TravelInformation,
+    parse_time_window,
+)
+from custom_components.db_train_tracker.stations import normalize_station
+
+if TYPE_CHECKING:
+    from weiche import Schiene
+
+DEFAULT_REPLAY_TIME_ZONE = "Europe/Berlin"
+# Routes without recorded connections get this many generated connections in this interval.
+GENERATED_CONNECTIONS = 10
+GENERATED_CONNECTION_INTERVAL = datetime.timedelta(minutes=30)
+GENERATED_TRAVEL_TIME = datetime.timedelta(minutes=90)
+
+CALENDAR_EVENT_FIELDS = ("start", "end", "summary", "description", "location")
+ICS_TEXT_PROPERTIES = {"SUMMARY": "summary", "DESCRIPTION": "description", "LOCATION": "location"}
+
+CalendarEvents = Dict[str, List[Dict[str, Any]]]
+
+
+def _unescape_ics_text(value: str) -> str:
+    return re.sub(r"\\([\\;,nN])", lambda match: "\n" if match.group(1) in "nN" else match.group(1), value)
+
+
+def _parse_ics_time(value: str, parameters: Dict[str, str]) -> datetime.datetime | datetime.date:
+    if parameters.get("VALUE") == "DATE" or len(value) == 8:
+        return datetime.datetime.strptime(value, "%Y%m%d").date()
+    parsed = datetime.datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        return parsed.replace(tzinfo=datetime.timezone.utc)
+    time_zone = dt.get_time_zone(parameters["TZID"]) if "TZID" in parameters else None
+    return parsed.replace(tzinfo=time_zone or dt.DEFAULT_TIME_ZONE)
+
+
+def parse_ics(text: str) -> List[Dict[str, Any]]:
+    """Parses the events of an ICS export into the format of the calendar.get_events service.
+
+    Recurring events are only replayed at their first occurrence, export the expanded events of the
+    calendar.get_events service as JSON to replay them completely.
+    """
+    events: List[Dict[str, Any]] = []
+    event: Dict[str, Any] | None = None
+    # Long lines are folded by starting the continuation with a space or a tab.
+    for line in re.sub(r"\r?\n[ \t]", "", text).splitlines():
+        if line == "BEGIN:VEVENT":
+            event = {"summary": ""}
+        elif line == "END:VEVENT":
+            if event is not None and "start" in event:
+                start = event["start"]
+                if "end" not in event:
+                    event["end"] = start + datetime.timedelta(days=1) if type(start) is datetime.date else start
+                events.append({**event, "start": start.isoformat(), "end": event["end"].isoformat()})
+            event = None
+        elif event is not None and ":" in line:
+            name_and_parameters, value = line.split(":", 1)
+            name, *parameter_items = name_and_parameters.split(";")
+            parameters = dict(item.split("=", 1) for item in parameter_items if "=" in item)
+            name = name.upper()
+            if name == "DTSTART":
+                event["start"] = _parse_ics_time(value, parameters)
+            elif name == "DTEND":
+                event["end"] = _parse_ics_time(value, parameters)
+            elif name in ICS_TEXT_PROPERTIES:
+                event[ICS_TEXT_PROPERTIES[name]] = _unescape_ics_text(value)
+    return events
+
+
+def load_calendar_dump(path: Path, calendar: str | None = None) -> CalendarEvents:
+    """Loads an ICS export or a JSON response of the calendar.get_events service, keyed by calendar entity.
+
+    ICS exports and plain JSON event lists are assigned to the given calendar, which defaults to the file name.
+    """
+    text = path.read_text(encoding="utf-8")
+    calendar = calendar or f"calendar.{re.sub(r'[^a-z0-9]+', '_', path.stem.lower()).strip('_')}"
+    if path.suffix.lower() in (".ics", ".ical"):
+        return {calendar: parse_ics(text)}
+
+    payload = json.loads(text)
+    if isinstance(payload, list):
+        return {calendar: payload}
+    if isinstance(payload.get("events"), list):
+        return {calendar: payload["events"]}
+    return {entity_id: response["events"] for entity_id, response in payload.items()}
+
+
+def load_config(path: Path, calendars: Sequence[str]) -> GathererConfig:
+    """Loads a tracker configuration from JSON using the field names of GathererConfig.
+
+    The calendars default to all calendars of the replayed dump.
+    """
+    data = json.loads(path.read_text(encoding="utf-8"))
+    unknown = set(data) - set(GathererConfig._fields)
+    if unknown:
+        raise ValueError(f"Unknown configuration fields {', '.join(sorted(unknown))}")
+    data.setdefault("calendars", list(calendars))
+    for field in ("calendars", "filtered_regular_expressions"):
+        data[field] = tuple(data.get(field, GathererConfig._field_defaults.get(field, ())))
+    for field in ("mappings", "departure_buffers", "calendar_origins"):
+        data[field] = tuple(tuple(item) for item in data.get(field, ()))
+    data["prefetch_window"] = parse_time_window(data.get("prefetch_window") or "")
+    return GathererConfig(**data)
+
+
+class ReplaySchiene:
+    """Connection backend serving recorded connections instead of querying Deutsche Bahn.
+
+    Routes without a recording get evenly spaced generated connections from the queried time on. Only the
+    configured and recorded stations are known to the station search.
+    """
+
+    def __init__(
+        self,
+        stations: Sequence[str] = (),
+        routes: Dict[Tuple[str, str], List[Dict[str, Any]]] | None = None,
+    ) -> None:
+        self.routes = routes or {}
+        self.known_stations = {normalize_station(station): station for station in stations}
+        for origin, destination in self.routes:
+            self.known_stations.setdefault(normalize_station(origin), origin)
+            self.known_stations.setdefault(normalize_station(destination), destination)
+        self.station_lookups = 0
+        self.connection_queries = 0
+
+    @classmethod
+    def from_recording(cls, path: Path | None, stations: Sequence[str] = ()) -> ReplaySchiene:
+        """Loads recorded connections, a JSON object with optional "stations" and "routes" lists.
+
+        Each route has an origin, a destination and its connections in the format returned by weiche.
+        """
+        if path is None:
+            return cls(stations)
+        data = json.loads(path.read_text(encoding="utf-8"))
+        routes = {(route["origin"], route["destination"]): route["connections"] for route in data.get("routes", [])}
+        return cls([*stations, *data.get("stations", [])], routes)
+
+    def stations(self, station: str, limit: int = 10) -> List[Dict[str, Any]]:
+        self.station_lookups += 1
+        known_station = self.known_stations.get(normalize_station(station))
+        return [] if known_station is None else [{"value": known_station}]
+
+    def connections(
+        self, origin: str, destination: str, dt: datetime.datetime, only_direct: bool = False
+    ) -> List[Dict[str, Any]]:
+        self.connection_queries += 1
+        if (recorded := self.routes.get((origin, destination))) is not None:
+            return recorded
+        return [
+            _generated_connection(dt + GENERATED_CONNECTION_INTERVAL * index) for index in range(GENERATED_CONNECTIONS)
+        ]
+
+
+def _generated_connection(departure: datetime.datetime) -> Dict[str, Any]:
+    hours, seconds = divmod(int(GENERATED_TRAVEL_TIME.total_seconds()), 3600)
+    return {
+        "details": "",
+        "departure": departure.strftime("%H:%M"),
+        "arrival": (departure + GENERATED_TRAVEL_TIME).strftime("%H:%M"),
+        "transfers": 0,
+        "time": f"{hours}:{seconds // 60:02d}",
+        "products": ["ICE"],
+        "price": None,
+        "ontime": True,
+        "canceled": False,
+        "delay": {"delay_departure": 0, "delay_arrival": 0},
+    }
+
+
+def _to_datetime(value: str) -> datetime.datetime:
+    if (parsed := dt.parse_datetime(value)) is not None:
+        return dt.as_local(parsed)
+    return dt.start_of_local_day(dt.parse_date(value))
+
+
+class _State:
+    state = "on"
+
+
+class _States:
+    def __init__(self, calendars: CalendarEvents) -> None:
+        self.calendars = calendars
+
+    def get(self, entity_id: str) -> _State | None:
+        return _State() if entity_id in self.calendars else None
+
+
+class _Services:
+    """Calendar service answering calendar.get_events from the loaded dump."""
+
+    def __init__(self, calendars: CalendarEvents) -> None:
+        self.calendars = calendars
+
+    async def async_call(
+        self, domain: str, service: str, service_data: Dict[str, Any], **kwargs: Any
+    ) -> Dict[str, Any]:
+        calendar = service_data["entity_id"]
+        start = _to_datetime(service_data["start_date_time"])
+        end = _to_datetime(service_data["end_date_time"])
+        events = [
+            {field: event[field] for field in CALENDAR_EVENT_FIELDS if field in event}
+            for event in self.calendars.get(calendar, [])
+            if _to_datetime(event["end"]) > start and _to_datetime(event["start"]) < end
+        ]
+        return {calendar: {"events": events}}
+
+
+class _Bus:
+    def async_fire(self, event_type: str, event_data: Dict[str, Any]) -> None:
+        pass
+
+
+class _StationList:
+    """Stands in for the local station list, it knows the configured and recorded stations."""
+
+    def __init__(self, schiene: ReplaySchiene) -> None:
+        self.schiene = schiene
+
+    def get(self, query: str) -> str | None:
+        return self.schiene.known_stations.get(normalize_station(query))
+
+
+class ReplayHass:
+    """The parts of Home Assistant used by the data gatherer."""
+
+    def __init__(self, calendars: CalendarEvents) -> None:
+        self.data: Dict[str, Any] = {}
+        self.states = _States(calendars)
+        self.services = _Services(calendars)
+        self.bus = _Bus()
+
+    async def async_add_executor_job(self, target: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(None, target, *args)
+
+
+class StageProfile(NamedTuple):
+    name: str
+    seconds: float
+    # Bytes still allocated after the stage and the highest allocation during the stage.
+    allocated: int
+    peak: int
+
+
+class ReplayReport(NamedTuple):
+    result: GathererResult
+    stages: Tuple[StageProfile, ...]
+    expression_costs: Dict[str, float]
+    station_lookups: int
+    connection_queries: int
+
+
+@contextmanager
+def _frozen_now(now: datetime.datetime) -> Iterator[None]:
+    original_now = dt.now
+    dt.now = lambda time_zone=None: now.astimezone(time_zone or dt.DEFAULT_TIME_ZONE)  # type: ignore[assignment]
+    try:
+        yield
+    finally:
+        dt.now = original_now  # type: ignore[assignment]
+
+
+async def _profile(name: str, stages: List[StageProfile], stage: Callable[[], Awaitable[Any]]) -> Any:
+    allocated_before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    value = await stage()
+    seconds = time.perf_counter() - start
+    allocated, peak = tracemalloc.get_traced_memory()
+    stages.append(StageProfile(name, seconds, allocated - allocated_before, peak - allocated_before))
+    return value
+
+
+async def async_replay(
+    calendars: CalendarEvents,
+    config: GathererConfig,
+    now: datetime.datetime,
+    schiene: ReplaySchiene | None = None,
+) -> ReplayReport:
+    """Runs one refresh of a tracker with the given configuration at the given time."""
+    schiene = schiene or ReplaySchiene([*config.origins, *(station for _, station in config.mappings)])
+    hass = cast(HomeAssistant, ReplayHass(calendars))
+    hass.data[DATA_STATION_STORE] = _StationList(schiene)
+    gatherer = DataGatherer(hass, cast("Schiene", schiene))
+    stages: List[StageProfile] = []
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        with _frozen_now(now):
+            # The first stage fills the calendar cache, matching then works on the cached events like a refresh does.
+            await _profile("calendar", stages, lambda: gatherer._get_calendar_entries(config))
+            planned_travel_times = await _profile("matching", stages, lambda: gatherer.get_planned_travel_times(config))
+
+            async def _get_travel_times() -> list:
+                return [await gatherer.get_travel_times_of(planned, config, now) for planned in planned_travel_times]
+
+            travel_times = await _profile("connections", stages, _get_travel_times)
+
+            async def _get_result() -> GathererResult:
+                result = gatherer._get_result(config, tuple(travel_times))
+                # Rendering the planned travels into the sensor attributes is part of every refresh.
+                for travel_time in result.travel_times:
+                    travel_time.to_dict()
+                return result
+
+            result = await _profile("result", stages, _get_result)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    return ReplayReport(
+        result=result,
+        stages=tuple(stages),
+        expression_costs=gatherer.expression_costs,
+        station_lookups=schiene.station_lookups,
+        connection_queries=schiene.connection_queries,
+    )
+
+
+def _format_connection(connection: TravelInformation) -> str:
+    delay = f" +{connection.departure_delay}" if connection.departure_delay else ""
+    canceled = " canceled" if connection.canceled else ""
+    return f"{connection.departure}{delay} → {connection.arrival} ({', '.join(connection.products)}){canceled}"
+
+
+def format_report(report: ReplayReport) -> str:
+    lines = [f"Matched trips: {len(report.result.travel_times)}"]
+    for travel_time in report.result.travel_times:
+        planned = travel_time.planned_travel_time
+        lines.append(
+            f"  {dt.as_local(planned.start):%Y-%m-%d %H:%M} {planned.origin} → {planned.destination}"
+            f" ({len(travel_time.connections)} connections)"
+        )
+        lines.extend(f"    {_format_connection(connection)}" for connection in travel_time.connections)
+    if report.result.leave_by is not None:
+        lines.append(f"Leave by: {dt.as_local(report.result.leave_by):%Y-%m-%d %H:%M}")
+
+    lines.append("")
+    lines.append(f"{'Stage':<12} {'Time ms':>10} {'Allocated KiB':>14} {'Peak KiB':>10}")
+    for stage in report.stages:
+        lines.append(
+            f"{stage.name:<12} {stage.seconds * 1000:>10.2f} {stage.allocated / 1024:>14.1f} {stage.peak / 1024:>10.1f}"
+        )
+    lines.append(f"Station lookups: {report.station_lookups}, connection queries: {report.connection_queries}")
+
+    if report.expression_costs:
+        lines.append("")
+        lines.append("Expression costs")
+        for pattern, cost in sorted(report.expression_costs.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"  {cost * 1000:>8.2f}ms {pattern}")
+    return "\n".join(lines)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m custom_components.db_train_tracker.replay",
+        description="Replays an exported calendar against a tracker configuration and profiles each stage.",
+    )
+    parser.add_argument("calendar", type=Path, help="ICS export or JSON response of calendar.get_events")
+    parser.add_argument("config", type=Path, help="JSON file with the fields of the tracker configuration")
+    parser.add_argument("--connections", type=Path, help="JSON file with recorded connections per route")
+    parser.add_argument("--calendar-id", help="Calendar entity of an ICS export, defaults to the file name")
+    parser.add_argument("--now", help="Time of the replayed refresh in ISO format, defaults to the current time")
+    parser.add_argument("--time-zone", default=DEFAULT_REPLAY_TIME_ZONE, help="Local time zone of the replay")
+    args = parser.parse_args(argv)
+
+    previous_time_zone = dt.DEFAULT_TIME_ZONE
+    time_zone = dt.get_time_zone(args.time_zone)
+    if time_zone is None:
+        parser.error(f"Unknown time zone {args.time_zone}")
+    dt.set_default_time_zone(time_zone)
+    try:
+        calendars = load_calendar_dump(args.calendar, args.calendar_id)
+        config = load_config(args.config, list(calendars))
+        now = dt.now()
+        if args.now:
+            if (parsed_now := dt.parse_datetime(args.now)) is None:
+                parser.error(f"Invalid time {args.now}")
+            now = parsed_now if parsed_now.tzinfo else parsed_now.replace(tzinfo=time_zone)
+        schiene = ReplaySchiene.from_recording(
+            args.connections, [*config.origins, *(station for _, station in config.mappings)]
+        )
+        report = asyncio.run(async_replay(calendars, config, now, schiene))
+        print(format_report(report))
+    finally:
+        dt.set_default_time_zone(previous_time_zone)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,79 @@
+from __future__ import annotations
+
 import logging
-from datetime import timedelta
-from typing import Any, Callable, Dict, Optional
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
 
 import requests
-from homeassistant.core import HomeAssistant
+from homeassistant.components.sensor import SensorDeviceClass, SensorEntity
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_track_point_in_time, async_track_time_interval
 from homeassistant.helpers.typing import ConfigType
-from weiche import Schiene
+from homeassistant.util import dt, slugify
 
+from custom_components.db_train_tracker.client import async_import_client, get_client
+from custom_components.db_train_tracker.connections import get_connection_cache
 from custom_components.db_train_tracker.const import (
+    CONF_ALTERNATIVE_DELAY,
+    CONF_ALTERNATIVE_STATIONS,
+    CONF_CALENDAR_ORIGINS,
     CONF_CALENDARS,
+    CONF_COMPACT_ATTRIBUTES,
+    CONF_DEPARTURE_BUFFER,
+    CONF_DEPARTURE_BUFFERS,
+    CONF_DUPLICATE_TOLERANCE,
     CONF_DURATION,
+    CONF_EXPORT_CONNECTIONS,
+    CONF_EXPORT_RETENTION,
     CONF_FILTERED_REGULAR_EXPRESSIONS,
     CONF_HOME_STATION,
+    CONF_JOURNEY_DETAILS,
+    CONF_LOCATION_DESTINATIONS,
+    CONF_LOOKAHEAD,
+    CONF_LOOP_BUDGET,
     CONF_MAPPINGS,
     CONF_MAX_RESULTS,
+    CONF_OFFLOAD_PARSING,
+    CONF_PREFETCH_WINDOW,
     CONF_PROXY,
     CONF_REMOVE_TIME_DUPLICATES,
+    DATA_TRACKER,
+    DEFAULT_ALTERNATIVE_DELAY,
+    DEFAULT_ALTERNATIVE_STATIONS,
+    DEFAULT_CALENDAR_ORIGINS,
+    DEFAULT_COMPACT_ATTRIBUTES,
+    DEFAULT_DEPARTURE_BUFFER,
+    DEFAULT_DEPARTURE_BUFFERS,
+    DEFAULT_DUPLICATE_TOLERANCE,
     DEFAULT_DURATION,
+    DEFAULT_EXPORT_CONNECTIONS,
+    DEFAULT_EXPORT_RETENTION,
     DEFAULT_FILTERED_REGULAR_EXPRESSIONS,
+    DEFAULT_JOURNEY_DETAILS,
+    DEFAULT_LOCATION_DESTINATIONS,
+    DEFAULT_LOOKAHEAD,
+    DEFAULT_LOOP_BUDGET_MS,
     DEFAULT_MAPPINGS,
     DEFAULT_MAX_RESULTS,
+    DEFAULT_OFFLOAD_PARSING,
+    DEFAULT_PREFETCH_WINDOW,
     DEFAULT_PROXY,
     DEFAULT_REMOVE_TIME_DUPLICATES,
     DOMAIN,
 )
-from custom_components.db_train_tracker.data_gatherer import DataGatherer, GathererConfig
+from custom_components.db_train_tracker.data_gatherer import (
+    DataGatherer,
+    GathererConfig,
+    GathererResult,
+    parse_time_window,
+)
+from custom_components.db_train_tracker.export import EXPORT_FLUSH_INTERVAL, ConnectionExporter, get_exporters
+from custom_components.db_train_tracker.history import DelayHistory, RouteStatistics
+
+if TYPE_CHECKING:
+    from weiche import Schiene
 
 _LOGGER = logging.getLogger(__name__)
 SCAN_INTERVAL = timedelta(minutes=3)
@@ -47,15 +95,31 @@ async def async_setup_entry(
         _LOGGER.debug("Using proxy: %s", proxy)
     else:
         _LOGGER.debug("No proxy configured")
-        proxy = None
-    schiene = Schiene(proxy=proxy)
+    await async_import_client(hass)
+    schiene = get_client(hass, proxy)
     sensor = DBTrainTrackerSensor(hass, schiene, config)
-    async_add_entities([sensor], update_before_add=True)
+    config[DATA_TRACKER] = sensor
+    async_add_entities([sensor, sensor.leave_by_sensor], update_before_add=True)
 
 
 class DBTrainTrackerSensor(Entity):
     """Tracker for one starting station of a train checking departure times for calendar entries."""
 
+    # The datetimes and the nested connection list change on every refresh and are only
+    # interesting for the current state, keep them out of the recorder database.
+    _unrecorded_attributes = frozenset(
+        {
+            "start",
+            "end",
+            "next_start",
+            "next_end",
+            "planned_travels",
+            "details",
+            "longest_loop_slice_ms",
+            "max_loop_slice_ms",
+        }
+    )
+
     def __init__(self, hass: HomeAssistant, schiene: Schiene, data: Dict[str, Any]):
         super().__init__()
         self.hass = hass
@@ -64,7 +128,13 @@ class DBTrainTrackerSensor(Entity):
         self._name = data.get("name", f"Train Tracker {self.home_station}")
         self._state: Optional[str] = None
         self.calendars = data[CONF_CALENDARS]
-        self.gatherer = DataGatherer(self.hass, self.schiene)
+        self.gatherer = DataGatherer(
+            self.hass,
+            self.schiene,
+            loop_budget_ms=data.get(CONF_LOOP_BUDGET, DEFAULT_LOOP_BUDGET_MS),
+            connection_cache=get_connection_cache(self.hass),
+        )
+        self.history = DelayHistory()
         self.attrs: Dict[str, Any] = {
             "home_station": self.home_station,
             "calendars": self.calendars,
@@ -74,6 +144,18 @@ class DBTrainTrackerSensor(Entity):
         max_results = data.get(CONF_MAX_RESULTS, DEFAULT_MAX_RESULTS)
         remove_same_time_duplicates = bool(data.get(CONF_REMOVE_TIME_DUPLICATES, DEFAULT_REMOVE_TIME_DUPLICATES))
         scan_duration_hours = data.get(CONF_DURATION, DEFAULT_DURATION)
+        departure_buffer = data.get(CONF_DEPARTURE_BUFFER, DEFAULT_DEPARTURE_BUFFER)
+        departure_buffers = data.get(CONF_DEPARTURE_BUFFERS, DEFAULT_DEPARTURE_BUFFERS)
+        calendar_origins = data.get(CONF_CALENDAR_ORIGINS, DEFAULT_CALENDAR_ORIGINS)
+        location_destinations = bool(data.get(CONF_LOCATION_DESTINATIONS, DEFAULT_LOCATION_DESTINATIONS))
+        lookahead_minutes = data.get(CONF_LOOKAHEAD, DEFAULT_LOOKAHEAD)
+        offload_parsing = bool(data.get(CONF_OFFLOAD_PARSING, DEFAULT_OFFLOAD_PARSING))
+        prefetch_window = parse_time_window(data.get(CONF_PREFETCH_WINDOW, DEFAULT_PREFETCH_WINDOW))
+        journey_details = bool(data.get(CONF_JOURNEY_DETAILS, DEFAULT_JOURNEY_DETAILS))
+        duplicate_tolerance_minutes = data.get(CONF_DUPLICATE_TOLERANCE, DEFAULT_DUPLICATE_TOLERANCE)
+        alternative_stations = data.get(CONF_ALTERNATIVE_STATIONS, DEFAULT_ALTERNATIVE_STATIONS)
+        alternative_delay_minutes = data.get(CONF_ALTERNATIVE_DELAY, DEFAULT_ALTERNATIVE_DELAY)
+        self.compact_attributes = bool(data.get(CONF_COMPACT_ATTRIBUTES, DEFAULT_COMPACT_ATTRIBUTES))
 
         self.gatherer_config = GathererConfig(
             calendars=tuple(self.calendars),
@@ -83,9 +165,54 @@ class DBTrainTrackerSensor(Entity):
             max_results=max_results,
             remove_same_time_duplicates=remove_same_time_duplicates,
             scan_duration_hours=scan_duration_hours,
+            departure_buffer=departure_buffer,
+            departure_buffers=tuple(tuple(departure) for departure in departure_buffers),
+            calendar_origins=tuple(tuple(calendar_origin) for calendar_origin in calendar_origins),
+            location_destinations=location_destinations,
+            lookahead_minutes=lookahead_minutes,
+            offload_parsing=offload_parsing,
+            prefetch_window=prefetch_window,
+            journey_details=journey_details,
+            duplicate_tolerance_minutes=duplicate_tolerance_minutes,
+            alternative_stations=tuple(tuple(alternative) for alternative in alternative_stations),
+            alternative_delay_minutes=alternative_delay_minutes,
         )
+        self.leave_by_sensor = DBTrainTrackerLeaveBySensor(self.home_station, self._name)
+        self.attrs["home_stations"] = self.gatherer_config.origins
+        self.exporter: ConnectionExporter | None = None
+        if bool(data.get(CONF_EXPORT_CONNECTIONS, DEFAULT_EXPORT_CONNECTIONS)):
+            self.exporter = ConnectionExporter(
+                self.hass,
+                Path(self.hass.config.path(DOMAIN, "export", slugify(self.home_station))),
+                data.get(CONF_EXPORT_RETENTION, DEFAULT_EXPORT_RETENTION),
+            )
 
         self._available = True
+        self._unsub_tick: CALLBACK_TYPE | None = None
+
+    def cache_sizes(self) -> Dict[str, int]:
+        sizes = {**self.gatherer.cache_sizes(), **self.history.sizes()}
+        if self.exporter is not None:
+            sizes["export_pending"] = len(self.exporter)
+        return sizes
+
+    async def async_added_to_hass(self) -> None:
+        """Invalidate the cached calendar events whenever a tracked calendar changes."""
+        self.async_on_remove(self.gatherer.async_track_calendars(self.gatherer_config))
+        if self.exporter is not None:
+            get_exporters(self.hass)[self.home_station] = self.exporter
+            self.async_on_remove(
+                async_track_time_interval(self.hass, self.exporter.async_schedule_flush, EXPORT_FLUSH_INTERVAL)
+            )
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Stop advancing the state locally and write the rows still queued for the export."""
+        if self._unsub_tick is not None:
+            self._unsub_tick()
+            self._unsub_tick = None
+        if self.exporter is not None:
+            get_exporters(self.hass).pop(self.home_station, None)
+            await self.exporter.async_flush()
 
     @property
     def name(self) -> str:
@@ -112,34 +239,100 @@ class DBTrainTrackerSensor(Entity):
 
     async def async_update(self) -> None:
         try:
+            self.gatherer.budget.reset()
             result = await self.gatherer.collect(self.gatherer_config)
 
-            self._state = "on" if result.exists else "off"
-            self.attrs["destination"] = result.destination
-            self.attrs["origin"] = result.origin
-            self.attrs["start"] = result.start
-            self.attrs["end"] = result.end
-            self.attrs["start_time"] = result.start_string
-            self.attrs["end_time"] = result.end_string
-            self.attrs["time"] = result.time
-            self.attrs["delay"] = result.departure_delay
-            self.attrs["arrival_delay"] = result.arrival_delay
-            self.attrs["products"] = result.products
-            self.attrs["ontime"] = result.ontime
-            self.attrs["canceled"] = result.canceled
-            self.attrs["next_start"] = result.next_start
-            self.attrs["next_start_time"] = result.next_start_string
-            self.attrs["next_end"] = result.next_end
-            self.attrs["next_end_time"] = result.next_end_string
-            self.attrs["next_time"] = result.next_time
-            self.attrs["next_delay"] = result.next_departure_delay
-            self.attrs["next_arrival_delay"] = result.next_arrival_delay
-            self.attrs["next_products"] = result.next_products
-            self.attrs["next_ontime"] = result.next_ontime
-            self.attrs["next_canceled"] = result.next_canceled
-            self.attrs["planned_travels"] = [travel_time.to_dict() for travel_time in result.travel_times]
-
+            self.history.observe(result)
+            self.history.flush(dt.now())
+            if self.exporter is not None:
+                # Only queues the rows, they are written in batches by the executor.
+                self.exporter.add(dt.now(), result)
+            budget = self.gatherer.budget
+            budget.start()
+            planned_travels = [
+                travel_time.to_dict(compact=self.compact_attributes)
+                async for travel_time in budget.async_iterate(result.travel_times)
+            ]
+            budget.stop()
+            self._apply_result(result, planned_travels)
             self._available = True
         except (requests.ConnectionError, ValueError):
             self._available = False
             _LOGGER.exception("Error retrieving data from DBTrainTracker for sensor %s.", self.name)
+        self._async_schedule_tick()
+
+    def _apply_result(self, result: GathererResult, planned_travels: List[Dict[str, Any]] | None = None) -> None:
+        self._state = "on" if result.exists else "off"
+        self.attrs["destination"] = result.destination
+        self.attrs["origin"] = result.origin
+        self.attrs["start"] = result.start
+        self.attrs["end"] = result.end
+        self.attrs["start_time"] = result.start_string
+        self.attrs["end_time"] = result.end_string
+        self.attrs["time"] = result.time
+        self.attrs["delay"] = result.departure_delay
+        self.attrs["arrival_delay"] = result.arrival_delay
+        self.attrs["products"] = result.products
+        self.attrs["ontime"] = result.ontime
+        self.attrs["canceled"] = result.canceled
+        self.attrs["next_start"] = result.next_start
+        self.attrs["next_start_time"] = result.next_start_string
+        self.attrs["next_end"] = result.next_end
+        self.attrs["next_end_time"] = result.next_end_string
+        self.attrs["next_time"] = result.next_time
+        self.attrs["next_delay"] = result.next_departure_delay
+        self.attrs["next_arrival_delay"] = result.next_arrival_delay
+        self.attrs["next_products"] = result.next_products
+        self.attrs["next_ontime"] = result.next_ontime
+        self.attrs["next_canceled"] = result.next_canceled
+        self.leave_by_sensor.set_leave_by(result.leave_by)
+        statistics = self.history.statistics(result.origin, result.destination) or RouteStatistics()
+        self.attrs.update(statistics.to_dict())
+        if planned_travels is None:
+            planned_travels = [
+                travel_time.to_dict(compact=self.compact_attributes) for travel_time in result.travel_times
+            ]
+        self.attrs["planned_travels"] = planned_travels
+        if self.gatherer_config.journey_details:
+            details = self.gatherer.cached_details(result.connection)
+            self.attrs["details"] = details.to_dict() if details is not None else None
+        self.attrs["longest_loop_slice_ms"] = self.gatherer.budget.longest_slice_ms
+        self.attrs["max_loop_slice_ms"] = self.gatherer.budget.max_slice_ms
+
+    @callback
+    def _async_schedule_tick(self) -> None:
+        # Advance the state locally when the next connection departs or the current trip ends.
+        if self._unsub_tick is not None:
+            self._unsub_tick()
+            self._unsub_tick = None
+        next_change = self.gatherer.next_change_at(dt.now())
+        if next_change is not None:
+            self._unsub_tick = async_track_point_in_time(self.hass, self._async_tick, next_change)
+
+    @callback
+    def _async_tick(self, now: datetime) -> None:
+        self._unsub_tick = None
+        self._apply_result(self.gatherer.result_at(self.gatherer_config, now))
+        self.async_write_ha_state()
+        self._async_schedule_tick()
+
+
+class DBTrainTrackerLeaveBySensor(SensorEntity):
+    """Time at which one has to leave to catch the next planned train, updated by the tracker sensor."""
+
+    _attr_device_class = SensorDeviceClass.TIMESTAMP
+    _attr_should_poll = False
+
+    def __init__(self, home_station: str, tracker_name: str) -> None:
+        super().__init__()
+        self._attr_name = f"{tracker_name} Leave By"
+        self._attr_unique_id = f"{home_station}_leave_by"
+        self._attr_native_value: datetime | None = None
+
+    def set_leave_by(self, leave_by: datetime | None) -> None:
+        if leave_by == self._attr_native_value:
+            return
+        self._attr_native_value = leave_by
+        # The sensor is refreshed before it is added to home assistant, only write the state once registered.
+        if self.hass is not None:
+            self.async_write_ha_state()
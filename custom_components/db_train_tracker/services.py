@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+from typing import Any, Dict, List
+
+import homeassistant.helpers.config_validation as cv
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.util import dt
+
+from custom_components.db_train_tracker.client import async_import_client, get_client
+from custom_components.db_train_tracker.connections import CONNECTION_CACHE_TTL, get_connection_cache
+from custom_components.db_train_tracker.const import (
+    DEFAULT_MAX_RESULTS,
+    DOMAIN,
+    SERVICE_FLUSH_EXPORT,
+    SERVICE_QUERY_CONNECTIONS,
+)
+from custom_components.db_train_tracker.data_gatherer import (
+    DataGatherer,
+    GathererConfig,
+    PlannedTravelTime,
+    TravelInformation,
+)
+from custom_components.db_train_tracker.export import get_exporters
+
+ATTR_ORIGIN = "origin"
+ATTR_DESTINATION = "destination"
+ATTR_DEPARTURE = "departure"
+ATTR_MAX_RESULTS = "max_results"
+ATTR_DETAILS = "details"
+
+QUERY_CONNECTIONS_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_ORIGIN): cv.string,
+        vol.Required(ATTR_DESTINATION): cv.string,
+        vol.Optional(ATTR_DEPARTURE): cv.datetime,
+        vol.Optional(ATTR_MAX_RESULTS, default=DEFAULT_MAX_RESULTS): cv.positive_int,
+        vol.Optional(ATTR_DETAILS, default=False): cv.boolean,
+    }
+)
+
+
+def _connection_to_response(connection: TravelInformation) -> Dict[str, Any]:
+    return {
+        **connection.to_dict(),
+        "departure": connection.departure_dt.isoformat(),
+        "arrival": connection.arrival_dt.isoformat(),
+        "products": list(connection.products),
+    }
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    gatherers: List[DataGatherer] = []
+
+    def _get_gatherer() -> DataGatherer:
+        # Created on the first call, so the client is not set up if the service is never used. On demand queries
+        # reuse connections fetched by the trackers or earlier queries within the cache ttl.
+        if not gatherers:
+            gatherers.append(
+                DataGatherer(
+                    hass,
+                    get_client(hass),
+                    connection_cache=get_connection_cache(hass),
+                    connection_max_age=CONNECTION_CACHE_TTL,
+                )
+            )
+        return gatherers[0]
+
+    async def _async_query_connections(call: ServiceCall) -> ServiceResponse:
+        await async_import_client(hass)
+        gatherer = _get_gatherer()
+        requested_origin = call.data[ATTR_ORIGIN]
+        requested_destination = call.data[ATTR_DESTINATION]
+        # Resolve the names so differently written queries for the same route share the cache.
+        origin = await gatherer.stations.async_resolve(requested_origin) or requested_origin
+        destination = await gatherer.stations.async_resolve(requested_destination) or requested_destination
+        departure = dt.as_local(call.data.get(ATTR_DEPARTURE) or dt.now()).replace(second=0, microsecond=0)
+
+        planned_travel_time = PlannedTravelTime(
+            start=departure, end=departure + datetime.timedelta(minutes=1), origin=origin, destination=destination
+        )
+        config = GathererConfig(origin=origin, calendars=(), max_results=call.data[ATTR_MAX_RESULTS])
+        travel_times = await gatherer.get_travel_times_of(planned_travel_time, config)
+        connections = [_connection_to_response(connection) for connection in travel_times.connections]
+        if call.data[ATTR_DETAILS]:
+            # Each connection costs an additional search upstream unless its details were fetched before.
+            for response, connection in zip(connections, travel_times.connections):
+                details = await gatherer.async_get_details(origin, destination, connection)
+                response["details"] = details.to_dict() if details is not None else None
+        return {
+            "origin": origin,
+            "destination": destination,
+            "connections": connections,
+        }
+
+    async def _async_flush_export(call: ServiceCall) -> ServiceResponse:
+        exporters = list(get_exporters(hass).items())
+        written = await asyncio.gather(*(exporter.async_flush() for _, exporter in exporters))
+        return {"rows_written": {home_station: rows for (home_station, _), rows in zip(exporters, written)}}
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_QUERY_CONNECTIONS,
+        _async_query_connections,
+        schema=QUERY_CONNECTIONS_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_FLUSH_EXPORT,
+        _async_flush_export,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import bisect
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from custom_components.db_train_tracker.const import DATA_STATION_STORE, DOMAIN
+
+if TYPE_CHECKING:
+    from weiche import Schiene
+
+_LOGGER = logging.getLogger(__name__)
+
+# Upper bound of cached station lookups, the oldest lookups are dropped first.
+MAX_CACHED_STATIONS = 1000
+
+STATION_STORAGE_VERSION = 1
+STATION_STORAGE_KEY = f"{DOMAIN}.stations"
+# Stations are written to disk at most this often, searches usually add several stations at once.
+STATION_SAVE_DELAY = 10
+# Upper bound of the stations kept in the local station list.
+MAX_STORED_STATIONS = 5000
+
+
+def normalize_station(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+class StationIndex:
+    """Cache of station names resolved against the Deutsche Bahn station search.
+
+    Queries are only considered a station if the search returns a station with exactly the queried name. Misses
+    are cached too, so free text which is not a station costs at most one upstream lookup.
+    """
+
+    def __init__(self, hass: HomeAssistant, schiene: Schiene) -> None:
+        self.hass = hass
+        self.schiene = schiene
+        self._stations: Dict[str, str | None] = {}
+
+    def __len__(self) -> int:
+        return len(self._stations)
+
+    def _set(self, key: str, station: str | None) -> None:
+        self._stations[key] = station
+        while len(self._stations) > MAX_CACHED_STATIONS:
+            del self._stations[next(iter(self._stations))]
+
+    def add(self, stations: Iterable[str]) -> None:
+        for station in stations:
+            self._set(normalize_station(station), station)
+
+    def __contains__(self, query: str) -> bool:
+        return self._stations.get(normalize_station(query)) is not None
+
+    def get(self, query: str) -> str | None:
+        return self._stations.get(normalize_station(query))
+
+    async def async_resolve(self, query: str) -> str | None:
+        key = normalize_station(query)
+        if not key:
+            return None
+        if key in self._stations:
+            return self._stations[key]
+
+        station: str | None = None
+        results = await self.hass.async_add_executor_job(self.schiene.stations, query, 1)
+        if len(results) > 0 and normalize_station(results[0]["value"]) == key:
+            station = results[0]["value"]
+        _LOGGER.debug(f"Resolved station {query} to {station}")
+        self._set(key, station)
+        return station
+
+
+class StationStore:
+    """Station names seen in Deutsche Bahn search results, stored locally and indexed by name prefix.
+
+    Allows resolving station names the user entered before and suggesting stations without any upstream lookup.
+    The entered names are kept as aliases of the station they resolved to, so "Hamburg" resolves offline as well.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._store: Store[Dict[str, Any]] = Store(hass, STATION_STORAGE_VERSION, STATION_STORAGE_KEY)
+        self._stations: Dict[str, str] = {}
+        self._sorted_keys: List[str] = []
+        self._aliases: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._stations)
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load()
+        if data is not None:
+            self._add(data.get("stations", []))
+            for alias, station in data.get("aliases", {}).items():
+                self._set_alias(alias, station)
+
+    def _add(self, stations: Iterable[str]) -> bool:
+        changed = False
+        for station in stations:
+            key = normalize_station(station)
+            if not key or self._stations.get(key) == station:
+                continue
+            if key not in self._stations:
+                bisect.insort(self._sorted_keys, key)
+            else:
+                del self._stations[key]
+            self._stations[key] = station
+            changed = True
+        while len(self._stations) > MAX_STORED_STATIONS:
+            key = next(iter(self._stations))
+            del self._stations[key]
+            del self._sorted_keys[bisect.bisect_left(self._sorted_keys, key)]
+        return changed
+
+    def _set_alias(self, alias: str, station: str) -> bool:
+        key = normalize_station(alias)
+        if not key or key in self._stations or self._aliases.get(key) == station:
+            return False
+        self._aliases.pop(key, None)
+        self._aliases[key] = station
+        while len(self._aliases) > MAX_STORED_STATIONS:
+            del self._aliases[next(iter(self._aliases))]
+        return True
+
+    def _save(self) -> None:
+        self._store.async_delay_save(
+            lambda: {"stations": list(self._stations.values()), "aliases": dict(self._aliases)}, STATION_SAVE_DELAY
+        )
+
+    def add(self, stations: Iterable[str]) -> None:
+        if self._add(stations):
+            self._save()
+
+    def add_alias(self, alias: str, station: str) -> None:
+        """Remembers that the entered name resolved to the station."""
+        if self._set_alias(alias, station):
+            self._save()
+
+    def get(self, query: str) -> str | None:
+        key = normalize_station(query)
+        return self._stations.get(key) or self._aliases.get(key)
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        key = normalize_station(prefix)
+        suggestions = []
+        for index in range(bisect.bisect_left(self._sorted_keys, key), len(self._sorted_keys)):
+            if len(suggestions) >= limit or not self._sorted_keys[index].startswith(key):
+                break
+            suggestions.append(self._stations[self._sorted_keys[index]])
+        return suggestions
+
+
+async def async_get_station_store(hass: HomeAssistant) -> StationStore:
+    """The local station list shared by all config flows, loaded on first use."""
+    if (store := hass.data.get(DATA_STATION_STORE)) is None:
+        store = StationStore(hass)
+        await store.async_load()
+        hass.data[DATA_STATION_STORE] = store
+    return store
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import datetime
+from bisect import bisect_left, bisect_right
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Tuple
+
+if TYPE_CHECKING:
+    from custom_components.db_train_tracker.data_gatherer import PossibleTravelTimes
+
+
+class TripIndex:
+    """Planned trips ordered by their planned start.
+
+    Next to the starts the running maximum of the planned ends is kept. It is non decreasing, which allows finding
+    the first trip which has not ended yet with a binary search even if trips overlap.
+    """
+
+    def __init__(self, travel_times: Iterable[PossibleTravelTimes] = ()) -> None:
+        self._trips: List[PossibleTravelTimes] = sorted(travel_times, key=lambda t: t.planned_travel_time.start)
+        self._starts: List[datetime.datetime] = [trip.planned_travel_time.start for trip in self._trips]
+        self._max_ends: List[datetime.datetime] = []
+        for trip in self._trips:
+            end = trip.planned_travel_time.end
+            self._max_ends.append(max(self._max_ends[-1], end) if self._max_ends else end)
+
+    def __len__(self) -> int:
+        return len(self._trips)
+
+    def __iter__(self) -> Iterator[PossibleTravelTimes]:
+        return iter(self._trips)
+
+    def _first_active_index(self, now: datetime.datetime) -> int:
+        return bisect_right(self._max_ends, now)
+
+    def current(self, now: datetime.datetime) -> PossibleTravelTimes | None:
+        index = self._first_active_index(now)
+        if index >= len(self._trips):
+            return None
+        return self._trips[index]
+
+    def upcoming(self, now: datetime.datetime) -> Tuple[PossibleTravelTimes, ...]:
+        return tuple(
+            trip for trip in self._trips[self._first_active_index(now) :] if trip.planned_travel_time.end > now
+        )
+
+    def overlapping(self, start: datetime.datetime, end: datetime.datetime) -> Tuple[PossibleTravelTimes, ...]:
+        first = self._first_active_index(start)
+        last = bisect_left(self._starts, end)
+        return tuple(trip for trip in self._trips[first:last] if trip.planned_travel_time.end > start)
+
+    def evict(self, now: datetime.datetime) -> None:
+        index = self._first_active_index(now)
+        if index == 0:
+            return
+        del self._trips[:index]
+        del self._starts[:index]
+        del self._max_ends[:index]
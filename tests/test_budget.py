@@ -0,0 +1,48 @@
+from homeassistant.core import HomeAssistant
+from pytest_mock import MockerFixture
+
+from custom_components.db_train_tracker.budget import LoopBudget
+from custom_components.db_train_tracker.const import CONF_CALENDARS, CONF_HOME_STATION, CONF_LOOP_BUDGET
+from custom_components.db_train_tracker.sensor import DBTrainTrackerSensor
+
+
+async def test_loop_budget_yields_after_budget(mocker: MockerFixture) -> None:
+    sleep = mocker.patch("custom_components.db_train_tracker.budget.asyncio.sleep", new_callable=mocker.AsyncMock)
+    budget = LoopBudget(budget_ms=0)
+    budget.start()
+    assert [item async for item in budget.async_iterate(range(3))] == [0, 1, 2]
+    budget.stop()
+    assert sleep.call_count == 3
+    assert budget.longest_slice > 0
+
+
+async def test_loop_budget_does_not_yield_within_budget(mocker: MockerFixture) -> None:
+    sleep = mocker.patch("custom_components.db_train_tracker.budget.asyncio.sleep", new_callable=mocker.AsyncMock)
+    budget = LoopBudget(budget_ms=60_000)
+    budget.start()
+    assert [item async for item in budget.async_iterate(range(100))] == list(range(100))
+    budget.stop()
+    sleep.assert_not_called()
+    assert budget.longest_slice_ms < 60_000
+
+
+async def test_loop_budget_reset_keeps_maximum(mocker: MockerFixture) -> None:
+    monotonic = mocker.patch("custom_components.db_train_tracker.budget.time.monotonic", return_value=0.0)
+    budget = LoopBudget()
+    budget.start()
+    monotonic.return_value = 0.05
+    budget.stop()
+
+    # A new refresh only reports its own slices, the maximum since the start is kept.
+    budget.reset()
+    budget.start()
+    monotonic.return_value = 0.052
+    budget.stop()
+    assert budget.longest_slice_ms == 2
+    assert budget.max_slice_ms == 50
+
+
+async def test_loop_budget_from_options(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    data = {CONF_HOME_STATION: "Berlin Hbf", CONF_CALENDARS: ["calendar.work"], CONF_LOOP_BUDGET: 20}
+    sensor = DBTrainTrackerSensor(hass, mocker.MagicMock(), data)
+    assert sensor.gatherer.budget.budget == 0.02
@@ -3,16 +3,25 @@
 from unittest import mock
 
 import pytest
+import requests
 import voluptuous as vol
 from homeassistant.core import HomeAssistant
 from pytest_mock import MockerFixture
 
-from custom_components.db_train_tracker.config_flow import DOMAIN, SCHIENE, _validate_station
+from custom_components.db_train_tracker.config_flow import (
+    DOMAIN,
+    _suggest_stations,
+    _validate_departure_buffers,
+    _validate_mappings,
+    _validate_prefetch_window,
+    _validate_station,
+)
 from custom_components.db_train_tracker.const import CONF_HOME_STATION
 
 
 async def test_schiene_station_validation(hass: HomeAssistant, mocker: MockerFixture) -> None:
-    mocker.patch.object(SCHIENE, "stations", return_value=[{"value": "Hamburg Hbf"}])
+    client = mocker.patch("custom_components.db_train_tracker.config_flow.get_client").return_value
+    client.stations = mocker.MagicMock(return_value=[{"value": "Hamburg Hbf"}])
     assert await _validate_station(hass, "Hambu") == "Hamburg Hbf"
 
 
@@ -22,11 +31,72 @@ async def test_schiene_station_validation_empty(hass: HomeAssistant, mocker: Moc
 
 
 async def test_schiene_station_validation_not_found(hass: HomeAssistant, mocker: MockerFixture) -> None:
-    mocker.patch.object(SCHIENE, "stations", return_value=[])
+    client = mocker.patch("custom_components.db_train_tracker.config_flow.get_client").return_value
+    client.stations = mocker.MagicMock(return_value=[])
     with pytest.raises(vol.Invalid):
         await _validate_station(hass, "Hamburg")
 
 
+async def test_station_validation_uses_local_stations(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    client = mocker.patch("custom_components.db_train_tracker.config_flow.get_client").return_value
+    client.stations = mocker.MagicMock(return_value=[{"value": "Hamburg Hbf"}, {"value": "Hamburg Dammtor"}])
+    assert await _validate_station(hass, "Hamburg") == "Hamburg Hbf"
+    assert await _validate_station(hass, "hamburg dammtor") == "Hamburg Dammtor"
+    assert await _validate_mappings(hass, "HH,Hamburg Hbf;Dammtor,hamburg dammtor") == (
+        ("HH", "Hamburg Hbf"),
+        ("Dammtor", "Hamburg Dammtor"),
+    )
+    assert client.stations.call_count == 1
+    assert await _suggest_stations(hass, "Hamburg Hfb") == ["Hamburg Hbf"]
+
+
+async def test_mappings_validation_is_offline(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    client = mocker.patch("custom_components.db_train_tracker.config_flow.get_client").return_value
+    client.stations = mocker.MagicMock(return_value=[])
+    # Unknown targets are kept as entered instead of being searched.
+    assert await _validate_mappings(hass, "HH,Hamburg Hbf") == (("HH", "Hamburg Hbf"),)
+    assert client.stations.call_count == 0
+    with pytest.raises(vol.Invalid):
+        await _validate_mappings(hass, "HH,")
+
+
+async def test_station_validation_remembers_entered_names(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    client = mocker.patch("custom_components.db_train_tracker.config_flow.get_client").return_value
+    client.stations = mocker.MagicMock(return_value=[{"value": "Hamburg Hbf"}])
+    assert await _validate_station(hass, "Hambu") == "Hamburg Hbf"
+    assert await _validate_station(hass, " hambu ") == "Hamburg Hbf"
+    assert await _validate_mappings(hass, "HH,Hambu") == (("HH", "Hamburg Hbf"),)
+    assert client.stations.call_count == 1
+
+
+async def test_station_validation_connection_error(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    client = mocker.patch("custom_components.db_train_tracker.config_flow.get_client").return_value
+    client.stations = mocker.MagicMock(side_effect=requests.ConnectionError("offline"))
+    with pytest.raises(vol.Invalid) as error:
+        await _validate_station(hass, "Hamburg")
+    assert error.value.error_message == "cannot_connect"
+
+
+async def test_departure_buffers_validation() -> None:
+    assert await _validate_departure_buffers("Hamburg Hbf, 15; Berlin Hbf,20;") == (
+        ("Hamburg Hbf", 15),
+        ("Berlin Hbf", 20),
+    )
+    assert await _validate_departure_buffers("") == tuple()
+
+
+async def test_departure_buffers_validation_invalid() -> None:
+    with pytest.raises(vol.Invalid):
+        await _validate_departure_buffers("Hamburg Hbf,soon")
+
+
+async def test_prefetch_window_validation() -> None:
+    assert await _validate_prefetch_window(" 1:30 - 05:00") == "01:30-05:00"
+    assert await _validate_prefetch_window("") == ""
+    with pytest.raises(vol.Invalid):
+        await _validate_prefetch_window("tonight")
+
+
 async def test_flow_user_init(hass: HomeAssistant) -> None:
     """Test the initialization of the form in the first step of the config flow."""
     result = await hass.config_entries.flow.async_init(DOMAIN, context={"source": "user"})
@@ -0,0 +1,125 @@
+import asyncio
+import datetime
+from typing import Any, Dict, List
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt
+from pytest_mock import MockerFixture
+
+from custom_components.db_train_tracker.connections import ConnectionCache
+from custom_components.db_train_tracker.const import DOMAIN, SERVICE_QUERY_CONNECTIONS
+from custom_components.db_train_tracker.services import async_setup_services
+
+KEY = ("Hamburg Hbf", "Berlin Hbf", datetime.datetime(2022, 1, 1, 8, 0, tzinfo=datetime.timezone.utc))
+
+
+async def test_concurrent_queries_are_coalesced() -> None:
+    cache = ConnectionCache()
+    calls = 0
+
+    async def fetch() -> List[Dict[str, Any]]:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [{"departure": "08:00"}]
+
+    results = await asyncio.gather(*(cache.async_get(KEY, fetch, max_age=0) for _ in range(5)))
+    assert calls == 1
+    assert all(result == [{"departure": "08:00"}] for result in results)
+
+    # Sequential queries with a max age of zero always fetch, otherwise the cached result is reused.
+    await cache.async_get(KEY, fetch, max_age=0)
+    assert calls == 2
+    await cache.async_get(KEY, fetch)
+    assert calls == 2
+
+
+async def test_failed_query_is_not_cached() -> None:
+    cache = ConnectionCache()
+
+    async def fail() -> List[Dict[str, Any]]:
+        await asyncio.sleep(0.01)
+        raise ValueError("Upstream error")
+
+    results = await asyncio.gather(*(cache.async_get(KEY, fail) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(cache) == 0
+
+    async def fetch() -> List[Dict[str, Any]]:
+        return []
+
+    assert await cache.async_get(KEY, fetch) == []
+
+
+async def test_canceled_query_is_sent_again() -> None:
+    cache = ConnectionCache()
+    calls = 0
+
+    async def fetch() -> List[Dict[str, Any]]:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [{"departure": "08:00"}]
+
+    first = asyncio.ensure_future(cache.async_get(KEY, fetch))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(cache.async_get(KEY, fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    # The waiting caller is not canceled with the caller which sent the query, it queries again.
+    assert await second == [{"departure": "08:00"}]
+    assert first.cancelled()
+    assert calls == 2
+
+
+async def test_cache_is_bounded() -> None:
+    cache = ConnectionCache(max_size=2)
+
+    async def fetch() -> List[Dict[str, Any]]:
+        return []
+
+    for minute in range(5):
+        await cache.async_get((KEY[0], KEY[1], KEY[2] + datetime.timedelta(minutes=minute)), fetch)
+    assert len(cache) == 2
+
+
+async def test_query_connections_service(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    departure = dt.now().replace(second=0, microsecond=0) + datetime.timedelta(hours=1)
+    schiene = mocker.patch("custom_components.db_train_tracker.services.get_client").return_value
+    schiene.stations = mocker.MagicMock(return_value=[{"value": "Hamburg Hbf"}])
+    schiene.connections = mocker.MagicMock(
+        return_value=[
+            {
+                "details": "",
+                "departure": departure.strftime("%H:%M"),
+                "arrival": (departure + datetime.timedelta(hours=2)).strftime("%H:%M"),
+                "transfers": 0,
+                "time": "2:00",
+                "products": ["ICE"],
+                "price": None,
+                "ontime": True,
+                "canceled": False,
+                "delay": {"delay_departure": 0, "delay_arrival": 0},
+            }
+        ]
+    )
+    async_setup_services(hass)
+
+    responses = [
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_QUERY_CONNECTIONS,
+            {"origin": origin, "destination": "Berlin Hbf", "departure": departure},
+            blocking=True,
+            return_response=True,
+        )
+        for origin in ("Hamburg Hbf", "hamburg  hbf")
+    ]
+    # The second query is written differently but resolves to the same route and is served from the cache.
+    assert schiene.connections.call_count == 1
+    for response in responses:
+        assert response is not None
+        assert response["origin"] == "Hamburg Hbf"
+        assert response["connections"][0]["departure"] == departure.isoformat()
+        assert response["connections"][0]["products"] == ["ICE"]
@@ -1,9 +1,21 @@
 import datetime
 
 from homeassistant.core import HomeAssistant
+from homeassistant.util import dt
 from pytest_mock import MockerFixture
 
-from custom_components.db_train_tracker.data_gatherer import DataGatherer, GathererConfig
+from custom_components.db_train_tracker import data_gatherer as data_gatherer_module
+from custom_components.db_train_tracker.data_gatherer import (
+    CalendarEntryResult,
+    CalendarMatcher,
+    DataGatherer,
+    GathererConfig,
+    PlannedTravelTime,
+    TravelInformation,
+    deduplicate_planned_travel_times,
+    parse_time_window,
+)
+from custom_components.db_train_tracker.stations import async_get_station_store
 
 
 async def test_gather_data(hass: HomeAssistant, mocker: MockerFixture) -> None:
@@ -150,3 +162,680 @@ async def test_gather_data_no_calendar(hass: HomeAssistant, mocker: MockerFixtur
         )
     )
     assert result.exists is False
+
+
+async def test_compact_travel_times_dict(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    services_mock = mocker.patch.object(hass, "services")
+    async_call = services_mock.async_call = mocker.AsyncMock()
+    async_call.return_value = {
+        "calendar.xyz": {
+            "events": [
+                {
+                    "start": "2022-01-01T18:14:00+00:00",
+                    "end": "2022-01-01T20:20:00+00:00",
+                    "summary": "Berlin Hbf → Hamburg Hbf",
+                }
+            ]
+        }
+    }
+
+    schiene = mocker.MagicMock()
+    schiene.connections = mocker.MagicMock(
+        return_value=[
+            {
+                "details": "http://temp123",
+                "departure": "18:14",
+                "arrival": "20:20",
+                "transfers": 0,
+                "time": "2:06",
+                "products": ["ICE"],
+                "price": 103.3,
+                "ontime": False,
+                "canceled": False,
+                "delay": {"delay_departure": 3, "delay_arrival": 5},
+            },
+        ]
+    )
+
+    gatherer = DataGatherer(hass, schiene)
+    result = await gatherer.collect(GathererConfig(origin="Hamburg Hbf", calendars=("calendar.xyz",)))
+    assert result.connection is not None
+    compact = result.connection.to_dict(compact=True)
+    assert compact["o"] == "Berlin Hbf"
+    assert compact["d"] == "Hamburg Hbf"
+    assert compact["s"] == int(result.start.timestamp())
+    assert compact["c"] == [
+        {
+            "d": int(result.start.timestamp()),
+            "a": int(result.end.timestamp()),
+            "dd": 3,
+            "ad": 5,
+            "t": 0,
+            "p": ("ICE",),
+            "o": False,
+            "x": False,
+        }
+    ]
+
+
+async def test_leave_by_skips_canceled_connection(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    services_mock = mocker.patch.object(hass, "services")
+    async_call = services_mock.async_call = mocker.AsyncMock()
+    async_call.return_value = {
+        "calendar.xyz": {
+            "events": [
+                {
+                    "start": "2022-01-01T18:14:00+00:00",
+                    "end": "2022-01-01T20:20:00+00:00",
+                    "summary": "Berlin Hbf → Hamburg Hbf",
+                }
+            ]
+        }
+    }
+
+    schiene = mocker.MagicMock()
+    schiene.connections = mocker.MagicMock(
+        return_value=[
+            {
+                "details": "http://temp123",
+                "departure": "18:14",
+                "arrival": "20:20",
+                "transfers": 0,
+                "time": "2:06",
+                "products": ["ICE"],
+                "price": 103.3,
+                "ontime": True,
+                "canceled": True,
+            },
+            {
+                "details": "http://temp123",
+                "departure": "18:20",
+                "arrival": "21:20",
+                "transfers": 0,
+                "time": "3:00",
+                "products": ["ICE"],
+                "price": 103.3,
+                "ontime": False,
+                "canceled": False,
+                "delay": {"delay_departure": 5, "delay_arrival": 5},
+            },
+        ]
+    )
+
+    gatherer = DataGatherer(hass, schiene)
+    result = await gatherer.collect(
+        GathererConfig(
+            origin="Hamburg Hbf",
+            calendars=("calendar.xyz",),
+            departure_buffer=30,
+            departure_buffers=(("Berlin Hbf", 10),),
+        )
+    )
+    assert result.leave_by is not None
+    assert result.leave_by.time() == datetime.time(18, 15)
+
+
+async def test_change_events(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    hass.bus = mocker.MagicMock()
+    services_mock = mocker.patch.object(hass, "services")
+    async_call = services_mock.async_call = mocker.AsyncMock()
+    async_call.return_value = {
+        "calendar.xyz": {
+            "events": [
+                {
+                    "start": "2099-01-01T18:14:00+00:00",
+                    "end": "2099-01-01T20:20:00+00:00",
+                    "summary": "Berlin Hbf → Hamburg Hbf",
+                }
+            ]
+        }
+    }
+    connection = {
+        "details": "http://temp123",
+        "departure": "18:14",
+        "arrival": "20:20",
+        "transfers": 0,
+        "time": "2:06",
+        "products": ["ICE"],
+        "price": 103.3,
+        "ontime": True,
+        "canceled": False,
+    }
+    schiene = mocker.MagicMock()
+    schiene.connections = mocker.MagicMock(return_value=[connection])
+
+    gatherer = DataGatherer(hass, schiene)
+    config = GathererConfig(origin="Hamburg Hbf", calendars=("calendar.xyz",))
+    await gatherer.collect(config)
+    await gatherer.collect(config)
+    hass.bus.async_fire.assert_not_called()
+
+    schiene.connections.return_value = [
+        {**connection, "ontime": False, "canceled": True, "delay": {"delay_departure": 4, "delay_arrival": 6}}
+    ]
+    await gatherer.collect(config)
+    fired = {call.args[0]: call.args[1] for call in hass.bus.async_fire.call_args_list}
+    assert fired["db_train_tracker_canceled"]["home_station"] == "Hamburg Hbf"
+    assert fired["db_train_tracker_delay_changed"]["departure_delay"] == 4
+    assert fired["db_train_tracker_delay_changed"]["previous_departure_delay"] == 0
+    assert fired["db_train_tracker_delay_changed"]["arrival_delay"] == 6
+
+
+def test_origin_per_event() -> None:
+    config = GathererConfig(
+        origin="Hamburg Hbf",
+        calendars=("calendar.home", "calendar.work"),
+        calendar_origins=(("calendar.work", "Berlin Hbf"),),
+    )
+    assert config.origins == ("Hamburg Hbf", "Berlin Hbf")
+
+    def entry(calendar: str, location: str | None = None) -> CalendarEntryResult:
+        return CalendarEntryResult(
+            calendar=calendar,
+            start="2022-01-01T18:14:00+00:00",
+            end="2022-01-01T20:20:00+00:00",
+            summary="Train travel to Düsseldorf Hbf",
+            location=location,
+        )
+
+    assert config.get_origin_of(entry("calendar.home")) == "Hamburg Hbf"
+    assert config.get_origin_of(entry("calendar.work")) == "Berlin Hbf"
+    assert config.get_origin_of(entry("calendar.work", "Office")) == "Berlin Hbf"
+    assert config.get_origin_of(entry("calendar.work", " hamburg hbf")) == "Hamburg Hbf"
+
+
+async def test_gather_data_from_location(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    services_mock = mocker.patch.object(hass, "services")
+    async_call = services_mock.async_call = mocker.AsyncMock()
+    async_call.return_value = {
+        "calendar.xyz": {
+            "events": [
+                {
+                    "start": "2022-01-01T18:14:00+00:00",
+                    "end": "2022-01-01T20:20:00+00:00",
+                    "summary": "Visiting the office",
+                    "location": "Berlin Hbf",
+                },
+                {
+                    "start": "2022-01-01T21:00:00+00:00",
+                    "end": "2022-01-01T22:00:00+00:00",
+                    "summary": "Train travel to Düsseldorf Hbf",
+                    "location": "Room 1",
+                },
+                {
+                    "start": "2022-01-02T08:00:00+00:00",
+                    "end": "2022-01-02T10:00:00+00:00",
+                    "summary": "Stuttgart Hbf → Hamburg Hbf",
+                    "location": "Hamburg Hbf",
+                },
+                {
+                    "start": "2022-01-02T12:00:00+00:00",
+                    "end": "2022-01-02T13:00:00+00:00",
+                    "summary": "Lunch",
+                    "location": "Hauptstraße 1, Köln",
+                },
+                {
+                    "start": "2022-01-02T14:00:00+00:00",
+                    "end": "2022-01-02T15:00:00+00:00",
+                    "summary": "Meeting",
+                    "location": "Munich",
+                },
+            ]
+        }
+    }
+
+    schiene = mocker.MagicMock()
+    schiene.stations = mocker.MagicMock(return_value=[{"value": "Köln Hbf"}])
+    schiene.connections = mocker.MagicMock(return_value=[])
+    (await async_get_station_store(hass)).add(["Berlin Hbf"])
+
+    gatherer = DataGatherer(hass, schiene)
+    config = GathererConfig(
+        origin="Hamburg Hbf",
+        calendars=("calendar.xyz",),
+        mappings=(("Munich", "München Hbf"),),
+        location_destinations=True,
+    )
+    planned_travel_times = await gatherer.get_planned_travel_times(config)
+    # Locations which are local stations are the destination, other entries fall back to their summary.
+    assert [(travel.origin, travel.destination) for travel in planned_travel_times] == [
+        ("Hamburg Hbf", "Berlin Hbf"),
+        ("Hamburg Hbf", "Düsseldorf Hbf"),
+        ("Stuttgart Hbf", "Hamburg Hbf"),
+        ("Hamburg Hbf", "München Hbf"),
+    ]
+    assert schiene.stations.call_count == 0
+
+    # Locations are ignored unless enabled.
+    gatherer = DataGatherer(hass, schiene)
+    planned_travel_times = await gatherer.get_planned_travel_times(config._replace(location_destinations=False))
+    assert [(travel.origin, travel.destination) for travel in planned_travel_times] == [
+        ("Hamburg Hbf", "Düsseldorf Hbf"),
+        ("Stuttgart Hbf", "Hamburg Hbf"),
+    ]
+
+
+async def test_resolved_location_skips_expressions(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    services_mock = mocker.patch.object(hass, "services")
+    services_mock.async_call = mocker.AsyncMock(
+        return_value={
+            "calendar.xyz": {
+                "events": [
+                    {
+                        "start": "2022-01-01T18:14:00+00:00",
+                        "end": "2022-01-01T20:20:00+00:00",
+                        "summary": "Train travel to Köln Hbf",
+                        "location": "Berlin Hbf",
+                    }
+                ]
+            }
+        }
+    )
+    schiene = mocker.MagicMock()
+    (await async_get_station_store(hass)).add(["Berlin Hbf"])
+
+    match_summary = mocker.spy(CalendarMatcher, "match_summary")
+    for offload_parsing in (False, True):
+        gatherer = DataGatherer(hass, schiene)
+        config = GathererConfig(origin="Hamburg Hbf", calendars=("calendar.xyz",), offload_parsing=offload_parsing)
+        planned_travel_times = await gatherer.get_planned_travel_times(config)
+        assert [(travel.origin, travel.destination) for travel in planned_travel_times] == [
+            ("Hamburg Hbf", "Berlin Hbf")
+        ]
+        assert match_summary.call_count == 0
+        assert gatherer.matcher is not None
+        assert not any(gatherer.matcher.get_costs().values())
+    assert schiene.stations.call_count == 0
+
+
+async def test_calendar_events_are_cached(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    services_mock = mocker.patch.object(hass, "services")
+    async_call = services_mock.async_call = mocker.AsyncMock()
+    async_call.return_value = {"calendar.xyz": {"events": []}}
+
+    gatherer = DataGatherer(hass, mocker.MagicMock())
+    config = GathererConfig(origin="Hamburg Hbf", calendars=("calendar.xyz",))
+    await gatherer.get_planned_travel_times(config)
+    first_window = async_call.call_args_list[0].kwargs["service_data"]
+    await gatherer.get_planned_travel_times(config)
+    # Only the slice after the previous window is requested.
+    for call in async_call.call_args_list[1:]:
+        assert call.kwargs["service_data"]["start_date_time"] == first_window["end_date_time"]
+
+    gatherer.invalidated_calendars.add("calendar.xyz")
+    call_count = async_call.call_count
+    await gatherer.get_planned_travel_times(config)
+    assert async_call.call_count == call_count + 1
+    assert async_call.call_args.kwargs["service_data"]["start_date_time"] != first_window["end_date_time"]
+    assert "calendar.xyz" not in gatherer.invalidated_calendars
+
+
+async def test_calendar_cap_fetches_dropped_events_later(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    mocker.patch.object(data_gatherer_module, "MAX_CACHED_CALENDAR_ENTRIES", 2)
+    logger = mocker.patch.object(data_gatherer_module, "_LOGGER")
+    now = dt.now().replace(second=0, microsecond=0)
+    events = [
+        {
+            "start": (now + datetime.timedelta(hours=hours)).isoformat(),
+            "end": (now + datetime.timedelta(hours=hours, minutes=30)).isoformat(),
+            "summary": f"Event {hours}",
+        }
+        for hours in (1, 2, 3, 4)
+    ]
+
+    async def _get_events(domain: str, service: str, service_data: dict, **kwargs: object) -> dict:
+        start = dt.parse_datetime(service_data["start_date_time"])
+        end = dt.parse_datetime(service_data["end_date_time"])
+        return {
+            "calendar.xyz": {
+                "events": [
+                    event
+                    for event in events
+                    if dt.parse_datetime(event["end"]) > start and dt.parse_datetime(event["start"]) < end
+                ]
+            }
+        }
+
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    services_mock = mocker.patch.object(hass, "services")
+    services_mock.async_call = mocker.AsyncMock(side_effect=_get_events)
+    gatherer = DataGatherer(hass, mocker.MagicMock())
+    config = GathererConfig(origin="Hamburg Hbf", calendars=("calendar.xyz",))
+
+    mocker.patch.object(data_gatherer_module.dt, "now", return_value=now)
+    await gatherer.get_planned_travel_times(config)
+    cached = gatherer.calendar_cache["calendar.xyz"]
+    assert [entry.summary for entry in cached.entries] == ["Event 1", "Event 2"]
+    assert cached.window_end == now + datetime.timedelta(hours=3)
+    assert logger.warning.call_count == 1
+
+    # Once the kept events ended, the dropped ones are fetched by the sliding window.
+    mocker.patch.object(data_gatherer_module.dt, "now", return_value=now + datetime.timedelta(hours=2, minutes=45))
+    await gatherer.get_planned_travel_times(config)
+    assert [entry.summary for entry in gatherer.calendar_cache["calendar.xyz"].entries] == ["Event 3", "Event 4"]
+
+
+def test_prefetch_window() -> None:
+    config = GathererConfig(origin="Hamburg Hbf", calendars=(), prefetch_window=parse_time_window("23:30-05:00"))
+    assert config.in_prefetch_window(datetime.datetime(2022, 1, 1, 23, 45))
+    assert config.in_prefetch_window(datetime.datetime(2022, 1, 2, 4, 59))
+    assert not config.in_prefetch_window(datetime.datetime(2022, 1, 2, 5, 0))
+    assert not GathererConfig(origin="Hamburg Hbf", calendars=()).in_prefetch_window(dt.now())
+
+
+async def test_prefetched_connections(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    hass.bus = mocker.MagicMock()
+    now = dt.now().replace(second=0, microsecond=0)
+    services_mock = mocker.patch.object(hass, "services")
+    services_mock.async_call = mocker.AsyncMock(
+        return_value={
+            "calendar.xyz": {
+                "events": [
+                    {
+                        "start": (now + datetime.timedelta(hours=hours)).isoformat(),
+                        "end": (now + datetime.timedelta(hours=hours + 1)).isoformat(),
+                        "summary": f"Train Travel to {destination}",
+                    }
+                    for hours, destination in ((1, "Berlin Hbf"), (6, "Kiel Hbf"))
+                ]
+            }
+        }
+    )
+    schiene = mocker.MagicMock()
+    schiene.connections = mocker.MagicMock(return_value=[])
+    window = f"{(now - datetime.timedelta(hours=1)):%H:%M}-{(now + datetime.timedelta(hours=1)):%H:%M}"
+    config = GathererConfig(
+        origin="Hamburg Hbf", calendars=("calendar.xyz",), prefetch_window=parse_time_window(window)
+    )
+
+    gatherer = DataGatherer(hass, schiene)
+    await gatherer.collect(config)
+    await gatherer.collect(config)
+    destinations = [call.kwargs["destination"] for call in schiene.connections.call_args_list]
+    # The travel departing soon is queried on every refresh, the later one only once.
+    assert destinations.count("Berlin Hbf") == 2
+    assert destinations.count("Kiel Hbf") == 1
+    assert gatherer.cache_sizes()["prefetched"] == 1
+
+
+async def test_result_at_drops_departed_connections(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    services_mock = mocker.patch.object(hass, "services")
+    async_call = services_mock.async_call = mocker.AsyncMock()
+    async_call.return_value = {
+        "calendar.xyz": {
+            "events": [
+                {
+                    "start": "2099-01-01T18:14:00+00:00",
+                    "end": "2099-01-01T23:20:00+00:00",
+                    "summary": "Berlin Hbf → Hamburg Hbf",
+                }
+            ]
+        }
+    }
+    connection = {
+        "details": "http://temp123",
+        "departure": "18:14",
+        "arrival": "20:20",
+        "transfers": 0,
+        "time": "2:06",
+        "products": ["ICE"],
+        "price": 103.3,
+        "ontime": False,
+        "canceled": False,
+        "delay": {"delay_departure": 2, "delay_arrival": 2},
+    }
+    schiene = mocker.MagicMock()
+    schiene.connections = mocker.MagicMock(
+        return_value=[connection, {**connection, "departure": "18:20", "arrival": "21:20", "ontime": True, "delay": {}}]
+    )
+
+    gatherer = DataGatherer(hass, schiene)
+    config = GathererConfig(origin="Hamburg Hbf", calendars=("calendar.xyz",))
+    result = await gatherer.collect(config)
+    assert result.start is not None
+    first_departure = result.start + datetime.timedelta(minutes=2)
+    assert gatherer.next_change_at(result.start) == first_departure
+
+    result = gatherer.result_at(config, first_departure)
+    assert result.start is not None
+    assert result.start.time() == datetime.time(18, 20)
+    assert result.next_start is None
+
+    result = gatherer.result_at(config, result.start + datetime.timedelta(minutes=1))
+    assert result.start is not None
+    assert result.start.time() == datetime.time(18, 20)
+    assert gatherer.next_change_at(result.start + datetime.timedelta(minutes=1)) is not None
+
+
+async def test_travel_times_lookahead_and_max_results(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    connection = {
+        "details": "http://temp123",
+        "departure": "18:14",
+        "arrival": "20:20",
+        "transfers": 0,
+        "time": "2:06",
+        "products": ["ICE"],
+        "price": 103.3,
+        "ontime": True,
+        "canceled": False,
+    }
+    schiene = mocker.MagicMock()
+    schiene.connections = mocker.MagicMock(
+        return_value=[
+            connection,
+            {**connection, "canceled": True},
+            {**connection, "departure": "18:30", "arrival": "20:40"},
+            {**connection, "departure": "19:30", "arrival": "21:40"},
+            {**connection, "departure": "21:30", "arrival": "23:40"},
+        ]
+    )
+    from_dict = mocker.spy(TravelInformation, "from_dict")
+    start = dt.as_local(datetime.datetime(2099, 1, 1, 18, 14))
+    planned_travel_time = PlannedTravelTime(
+        start=start,
+        end=start + datetime.timedelta(hours=2),
+        origin="Hamburg Hbf",
+        destination="Berlin Hbf",
+    )
+
+    gatherer = DataGatherer(hass, schiene)
+    config = GathererConfig(origin="Hamburg Hbf", calendars=tuple(), lookahead_minutes=30)
+    travel_times = await gatherer.get_travel_times_of(planned_travel_time, config)
+    assert [conn.departure for conn in travel_times.connections] == ["18:14", "18:30", "19:30"]
+    assert from_dict.call_count == 5
+
+    from_dict.reset_mock()
+    travel_times = await gatherer.get_travel_times_of(planned_travel_time, config._replace(max_results=1))
+    assert [conn.departure for conn in travel_times.connections] == ["18:14"]
+    assert not travel_times.connections[0].canceled
+    assert from_dict.call_count == 3
+
+
+async def test_gather_data_offload_parsing(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    services_mock = mocker.patch.object(hass, "services")
+    async_call = services_mock.async_call = mocker.AsyncMock()
+    async_call.return_value = {
+        "calendar.xyz": {
+            "events": [
+                {
+                    "start": "2022-01-01T21:00:00+00:00",
+                    "end": "2022-01-01T22:00:00+00:00",
+                    "summary": "Train travel to Düsseldorf Hbf",
+                },
+                {
+                    "start": "2022-01-01T18:14:00+00:00",
+                    "end": "2022-01-01T20:20:00+00:00",
+                    "summary": "Berlin Hbf → Hamburg Hbf",
+                },
+            ]
+        }
+    }
+    executor_job = mocker.spy(hass, "async_add_executor_job")
+
+    gatherer = DataGatherer(hass, mocker.MagicMock())
+    config = GathererConfig(origin="Hamburg Hbf", calendars=("calendar.xyz",), offload_parsing=True)
+    planned_travel_times = await gatherer.get_planned_travel_times(config)
+    assert [(travel.origin, travel.destination) for travel in planned_travel_times] == [
+        ("Berlin Hbf", "Hamburg Hbf"),
+        ("Hamburg Hbf", "Düsseldorf Hbf"),
+    ]
+    matcher = gatherer.matcher
+    assert matcher is not None
+    assert executor_job.call_args.args[0] == matcher.match
+
+    # The matcher and its compiled expressions are reused between refreshes.
+    await gatherer.get_planned_travel_times(config)
+    assert gatherer.matcher is matcher
+
+
+def test_deduplicate_planned_travel_times() -> None:
+    start = datetime.datetime(2022, 1, 1, 18, 0, tzinfo=datetime.timezone.utc)
+    hour = datetime.timedelta(hours=1)
+    planned = [
+        PlannedTravelTime(start, start + hour, "Berlin Hbf", "Hamburg Hbf", ("calendar.team",)),
+        PlannedTravelTime(
+            start - datetime.timedelta(minutes=5), start + hour, "berlin hbf", "Hamburg Hbf", ("calendar.me",)
+        ),
+        PlannedTravelTime(start, start + 2 * hour, "Berlin Hbf", "Hamburg Hbf", ("calendar.me",)),
+        PlannedTravelTime(start, start + hour, "Berlin Hbf", "Köln Hbf", ("calendar.team",)),
+        PlannedTravelTime(start + hour, start + 2 * hour, "Berlin Hbf", "Hamburg Hbf", ("calendar.team",)),
+    ]
+
+    deduplicated = deduplicate_planned_travel_times(planned, datetime.timedelta(minutes=10))
+
+    assert deduplicated == [
+        PlannedTravelTime(
+            start - datetime.timedelta(minutes=5),
+            start + 2 * hour,
+            "berlin hbf",
+            "Hamburg Hbf",
+            ("calendar.me", "calendar.team"),
+        ),
+        PlannedTravelTime(start, start + hour, "Berlin Hbf", "Köln Hbf", ("calendar.team",)),
+        PlannedTravelTime(start + hour, start + 2 * hour, "Berlin Hbf", "Hamburg Hbf", ("calendar.team",)),
+    ]
+    assert len(deduplicate_planned_travel_times(planned, datetime.timedelta(0))) == 4
+
+
+async def test_same_trip_in_several_calendars(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    services_mock = mocker.patch.object(hass, "services")
+
+    async def _get_events(domain: str, service: str, service_data: dict, **kwargs: object) -> dict:
+        calendar = service_data["entity_id"]
+        start = "2099-01-01T18:14:00+00:00" if calendar == "calendar.me" else "2099-01-01T18:10:00+00:00"
+        summary = "Train Travel to Hamburg" if calendar == "calendar.me" else "Blocker: Travel to Hamburg Hbf"
+        return {calendar: {"events": [{"start": start, "end": "2099-01-01T20:20:00+00:00", "summary": summary}]}}
+
+    services_mock.async_call = _get_events
+    schiene = mocker.MagicMock()
+    schiene.connections = mocker.MagicMock(return_value=[])
+
+    gatherer = DataGatherer(hass, schiene)
+    config = GathererConfig(
+        origin="Berlin Hbf",
+        calendars=("calendar.me", "calendar.team"),
+        mappings=(("Hamburg$", "Hamburg Hbf"),),
+    )
+    planned_travel_times = await gatherer.get_planned_travel_times(config)
+    assert [(planned.start.minute, planned.calendars) for planned in planned_travel_times] == [
+        (10, ("calendar.team", "calendar.me"))
+    ]
+
+    await gatherer.collect(config)
+    schiene.connections.assert_called_once()
+
+
+def test_alternative_stations_config() -> None:
+    config = GathererConfig(
+        origin="Berlin Hbf",
+        calendars=(),
+        alternative_stations=(("Berlin Hbf", "Berlin Südkreuz"),),
+        alternative_delay_minutes=0,
+    )
+    assert config.get_alternatives_of(" berlin  hbf") == ("Berlin Südkreuz",)
+    assert config.get_alternatives_of("Hamburg Hbf") == ()
+    on_time = TravelInformation.from_dict(dt.now(), {"departure": "18:14", "arrival": "20:20", "products": []})
+    # A threshold of zero still does not look up alternatives while the train runs on time.
+    assert not config.needs_alternatives([on_time])
+    assert config.needs_alternatives([on_time._replace(departure_delay=1)])
+    assert config.needs_alternatives([on_time._replace(canceled=True)])
+
+
+async def test_alternatives_for_canceled_connection(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    def _connection(departure: str, arrival: str, canceled: bool = False, delay: int = 0) -> dict:
+        return {
+            "details": "",
+            "departure": departure,
+            "arrival": arrival,
+            "transfers": 0,
+            "time": "1:00",
+            "products": ["ICE"],
+            "price": None,
+            "ontime": delay == 0,
+            "canceled": canceled,
+            "delay": {"delay_departure": delay, "delay_arrival": delay},
+        }
+
+    routes = {
+        ("Berlin Hbf", "Hamburg Hbf"): [_connection("18:14", "20:20", canceled=True)],
+        ("Berlin Südkreuz", "Hamburg Hbf"): [_connection("18:20", "20:40"), _connection("18:50", "21:10")],
+        ("Berlin Hbf", "Hamburg Dammtor"): [_connection("18:30", "20:30", delay=5)],
+    }
+
+    def _connections(origin: str, destination: str, dt: datetime.datetime) -> list:
+        if (origin, destination) not in routes:
+            raise ConnectionError("Upstream error")
+        return routes[(origin, destination)]
+
+    schiene = mocker.MagicMock()
+    schiene.connections = mocker.MagicMock(side_effect=_connections)
+    start = dt.as_local(datetime.datetime(2099, 1, 1, 18, 0, tzinfo=datetime.timezone.utc))
+    planned = PlannedTravelTime(start, start + datetime.timedelta(hours=3), "Berlin Hbf", "Hamburg Hbf")
+    config = GathererConfig(
+        origin="Berlin Hbf",
+        calendars=("calendar.xyz",),
+        max_results=2,
+        alternative_stations=(("Berlin Hbf", "Berlin Südkreuz"), ("Hamburg Hbf", "Hamburg Dammtor")),
+    )
+    gatherer = DataGatherer(hass, schiene)
+
+    travel_times = await gatherer.get_travel_times_of(planned, config)
+
+    # Three alternative routes are queried, the one via both alternative stations fails and is skipped.
+    # The delayed train via Hamburg Dammtor still arrives first.
+    assert schiene.connections.call_count == 4
+    assert [
+        (alternative.origin, alternative.destination, alternative.connection.departure)
+        for alternative in travel_times.alternatives
+    ] == [("Berlin Hbf", "Hamburg Dammtor", "18:30"), ("Berlin Südkreuz", "Hamburg Hbf", "18:20")]
+    assert travel_times.to_dict()["alternatives"][1]["origin"] == "Berlin Südkreuz"
+    assert travel_times.to_compact_dict()["a"][0]["d"] == "Hamburg Dammtor"
+
+    # Connections running on time or below the delay threshold cost no additional queries.
+    schiene.connections.reset_mock()
+    routes[("Berlin Hbf", "Hamburg Hbf")] = [_connection("18:14", "20:20", delay=10)]
+    travel_times = await gatherer.get_travel_times_of(planned, config)
+    assert schiene.connections.call_count == 1
+    assert travel_times.alternatives == tuple()
+    assert "a" not in travel_times.to_compact_dict()
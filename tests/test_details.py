@@ -0,0 +1,219 @@
+import datetime
+from types import SimpleNamespace
+from typing import Any, List
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt
+from pytest_mock import MockerFixture
+
+from custom_components.db_train_tracker.data_gatherer import DataGatherer, GathererConfig
+from custom_components.db_train_tracker.details import (
+    DETAILS_SEARCH_LIMIT,
+    JourneyDetails,
+    JourneyDetailsCache,
+    JourneyLeg,
+    JourneyStop,
+    fetch_journey_details,
+)
+
+DEPARTURE = datetime.datetime(2099, 1, 1, 18, 14, tzinfo=datetime.timezone.utc)
+
+DETAILS = JourneyDetails(
+    legs=(
+        JourneyLeg(
+            name="ICE 597",
+            direction="München Hbf",
+            origin="Berlin Hbf",
+            destination="Hamburg Hbf",
+            departure=DEPARTURE,
+            arrival=DEPARTURE + datetime.timedelta(hours=2),
+            stops=(JourneyStop("Berlin Hbf", DEPARTURE, "7"), JourneyStop("Hamburg Hbf", None, "13")),
+        ),
+    )
+)
+
+
+def _segment(departure: datetime.datetime) -> Any:
+    # Deutsche Bahn returns local times without a time zone.
+    departure = dt.as_local(departure).replace(tzinfo=None)
+    return SimpleNamespace(
+        means_of_transport=SimpleNamespace(name="ICE 597", direction="München Hbf"),
+        departure_location="Berlin Hbf",
+        arrival_location="Hamburg Hbf",
+        departure_time=departure,
+        arrival_time=departure + datetime.timedelta(hours=2),
+        stops=[
+            SimpleNamespace(name="Berlin Hbf", departure_time=departure, track="7"),
+            SimpleNamespace(name="Hamburg Hbf", departure_time=None, track="13"),
+        ],
+    )
+
+
+def _search_connections(mocker: MockerFixture, departures: List[datetime.datetime]) -> Any:
+    # Like weiche the search returns at most limit connections.
+    return mocker.MagicMock(
+        side_effect=lambda at, from_location, to_location, limit: [
+            SimpleNamespace(segments=[_segment(departure)]) for departure in departures
+        ][:limit]
+    )
+
+
+def test_fetch_journey_details(mocker: MockerFixture) -> None:
+    schiene = mocker.MagicMock()
+    schiene.api.search_locations = mocker.MagicMock(side_effect=lambda name, limit: [SimpleNamespace(id=name)])
+    # An earlier connection comes first, the scheduled one has to be searched in the result.
+    schiene.api.search_connections = _search_connections(
+        mocker, [DEPARTURE - datetime.timedelta(minutes=10), DEPARTURE]
+    )
+
+    details = fetch_journey_details(schiene, "Berlin Hbf", "Hamburg Hbf", DEPARTURE)
+
+    assert details is not None
+    assert details.departure_track == "7"
+    assert details.legs[0].name == "ICE 597"
+    assert details.legs[0].arrival_track == "13"
+    assert details.to_dict()["legs"][0]["stops"][1] == {"name": "Hamburg Hbf", "departure": None, "track": "13"}
+    schiene.api.search_connections.assert_called_once_with(
+        at=DEPARTURE, from_location="Berlin Hbf", to_location="Hamburg Hbf", limit=DETAILS_SEARCH_LIMIT
+    )
+
+    # The same time on the next day is a different connection.
+    schiene.api.search_connections = _search_connections(mocker, [DEPARTURE + datetime.timedelta(days=1)])
+    assert fetch_journey_details(schiene, "Berlin Hbf", "Hamburg Hbf", DEPARTURE) is None
+    schiene.api.search_connections = _search_connections(mocker, [])
+    assert fetch_journey_details(schiene, "Berlin Hbf", "Hamburg Hbf", DEPARTURE) is None
+
+
+async def test_details_cache(mocker: MockerFixture) -> None:
+    cache = JourneyDetailsCache(max_size=2)
+    fetch = mocker.AsyncMock(return_value=DETAILS)
+    key = ("Berlin Hbf", "Hamburg Hbf", DEPARTURE)
+
+    assert await cache.async_get(key, (0, 0, False), fetch) == DETAILS
+    assert await cache.async_get(key, (0, 0, False), fetch) == DETAILS
+    assert fetch.await_count == 1
+    # A delay change invalidates the details.
+    assert cache.get(key, (5, 5, False)) is None
+    assert await cache.async_get(key, (5, 5, False), fetch) == DETAILS
+    assert fetch.await_count == 2
+
+    for minutes in range(1, 4):
+        await cache.async_get(
+            ("Berlin Hbf", "Hamburg Hbf", DEPARTURE + datetime.timedelta(minutes=minutes)), (0, 0, False), fetch
+        )
+    assert len(cache) == 2
+    assert cache.get(key, (5, 5, False)) is None
+
+
+async def test_collect_fetches_details_of_next_connection(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    hass.bus = mocker.MagicMock()
+    services_mock = mocker.patch.object(hass, "services")
+    services_mock.async_call = mocker.AsyncMock(
+        return_value={
+            "calendar.xyz": {
+                "events": [
+                    {
+                        "start": "2099-01-01T18:14:00+00:00",
+                        "end": "2099-01-01T20:20:00+00:00",
+                        "summary": "Berlin Hbf → Hamburg Hbf",
+                    }
+                ]
+            }
+        }
+    )
+    connection = {
+        "details": "",
+        "departure": "18:14",
+        "arrival": "20:20",
+        "transfers": 0,
+        "time": "2:06",
+        "products": ["ICE"],
+        "price": None,
+        "ontime": True,
+        "canceled": False,
+    }
+    schiene = mocker.MagicMock()
+    schiene.connections = mocker.MagicMock(return_value=[connection, {**connection, "departure": "18:44"}])
+    fetch = mocker.patch("custom_components.db_train_tracker.data_gatherer.fetch_journey_details", return_value=DETAILS)
+
+    gatherer = DataGatherer(hass, schiene)
+    config = GathererConfig(origin="Hamburg Hbf", calendars=("calendar.xyz",), journey_details=True)
+    result = await gatherer.collect(config)
+    await gatherer.collect(config)
+
+    # Only the first connection of the next trip is looked up, and only once while its delay is unchanged.
+    assert fetch.call_count == 1
+    assert gatherer.cached_details(result.connection) == DETAILS
+
+    schiene.connections.return_value = [{**connection, "ontime": False, "delay": {"delay_departure": 3}}]
+    result = await gatherer.collect(config)
+    assert fetch.call_count == 2
+
+    fetch.side_effect = ValueError("Upstream error")
+    schiene.connections.return_value = [{**connection, "ontime": False, "delay": {"delay_departure": 8}}]
+    result = await gatherer.collect(config)
+    assert result.exists
+    assert gatherer.cached_details(result.connection) is None
+
+    await gatherer.collect(config._replace(journey_details=False))
+    assert fetch.call_count == 3
+
+
+async def test_platform_change_event(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    hass.states = mocker.MagicMock()
+    hass.states.get = mocker.MagicMock(return_value=mocker.MagicMock(state="on"))
+    hass.bus = mocker.MagicMock()
+    services_mock = mocker.patch.object(hass, "services")
+    services_mock.async_call = mocker.AsyncMock(
+        return_value={
+            "calendar.xyz": {
+                "events": [
+                    {
+                        "start": "2099-01-01T18:14:00+00:00",
+                        "end": "2099-01-01T20:20:00+00:00",
+                        "summary": "Berlin Hbf → Hamburg Hbf",
+                    }
+                ]
+            }
+        }
+    )
+    connection = {
+        "details": "",
+        "departure": "18:14",
+        "arrival": "20:20",
+        "transfers": 0,
+        "time": "2:06",
+        "products": ["ICE"],
+        "price": None,
+        "ontime": True,
+        "canceled": False,
+    }
+    schiene = mocker.MagicMock()
+    schiene.connections = mocker.MagicMock(return_value=[connection])
+    leg = DETAILS.legs[0]
+    moved = JourneyDetails(legs=(leg._replace(stops=(leg.stops[0]._replace(track="8"), *leg.stops[1:])),))
+    mocker.patch(
+        "custom_components.db_train_tracker.data_gatherer.fetch_journey_details", side_effect=[DETAILS, DETAILS, moved]
+    )
+
+    gatherer = DataGatherer(hass, schiene)
+    config = GathererConfig(origin="Hamburg Hbf", calendars=("calendar.xyz",), journey_details=True)
+    await gatherer.collect(config)
+    # The details are fetched again after the delay changed, the track stayed the same.
+    schiene.connections.return_value = [{**connection, "ontime": False, "delay": {"delay_departure": 3}}]
+    await gatherer.collect(config)
+    assert "db_train_tracker_platform_changed" not in [call.args[0] for call in hass.bus.async_fire.call_args_list]
+
+    schiene.connections.return_value = [{**connection, "ontime": False, "delay": {"delay_departure": 5}}]
+    await gatherer.collect(config)
+    fired = {call.args[0]: call.args[1] for call in hass.bus.async_fire.call_args_list}
+    assert fired["db_train_tracker_platform_changed"] == {
+        "home_station": "Hamburg Hbf",
+        "origin": "Berlin Hbf",
+        "destination": "Hamburg Hbf",
+        "departure": dt.as_local(DEPARTURE).isoformat(),
+        "track": "8",
+        "previous_track": "7",
+    }
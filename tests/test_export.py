@@ -0,0 +1,111 @@
+import asyncio
+import csv
+import datetime
+from pathlib import Path
+from typing import List
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt
+from pytest_mock import MockerFixture
+
+from custom_components.db_train_tracker import export as export_module
+from custom_components.db_train_tracker.data_gatherer import (
+    GathererResult,
+    PlannedTravelTime,
+    PossibleTravelTimes,
+    TravelInformation,
+)
+from custom_components.db_train_tracker.export import EXPORT_COLUMNS, ConnectionExporter
+
+START = dt.as_local(datetime.datetime(2099, 1, 1, 18, 0, tzinfo=datetime.timezone.utc))
+
+
+def _result(departures: List[str], delay: int = 0) -> GathererResult:
+    planned = PlannedTravelTime(START, START + datetime.timedelta(hours=3), "Berlin Hbf", "Hamburg Hbf")
+    connections = tuple(
+        TravelInformation.from_dict(
+            START,
+            {
+                "departure": departure,
+                "arrival": "21:00",
+                "transfers": 1,
+                "time": "2:00",
+                "products": ["ICE", "RE"],
+                "ontime": delay == 0,
+                "canceled": False,
+                "delay": {"delay_departure": delay, "delay_arrival": delay},
+            },
+        )
+        for departure in departures
+    )
+    return GathererResult(travel_times=(PossibleTravelTimes(planned, connections),))
+
+
+def _read(path: Path) -> List[List[str]]:
+    with path.open(newline="", encoding="utf-8") as file:
+        return list(csv.reader(file))
+
+
+async def test_export_day_partitions(hass: HomeAssistant, tmp_path: Path, mocker: MockerFixture) -> None:
+    (tmp_path / "2098-12-01.csv").write_text("old")
+    (tmp_path / "notes.csv").write_text("kept")
+    exporter = ConnectionExporter(hass, tmp_path, retention_days=2)
+    snapshot = START - datetime.timedelta(days=1)
+
+    exporter.add(snapshot, _result(["18:14", "18:44"]))
+    exporter.add(START, _result(["18:14"], delay=5))
+    assert not exporter.directory.joinpath(f"{START.date().isoformat()}.csv").exists()
+    mocker.patch.object(export_module.dt, "now", return_value=START + datetime.timedelta(hours=1))
+    assert await exporter.async_flush() == 3
+    exporter.add(START, _result(["18:44"], delay=7))
+    assert await exporter.async_flush() == 1
+
+    # Each day has its own file with a single header, files of days past the retention are deleted.
+    assert sorted(path.name for path in tmp_path.glob("*.csv")) == [
+        f"{snapshot.date().isoformat()}.csv",
+        f"{START.date().isoformat()}.csv",
+        "notes.csv",
+    ]
+    rows = _read(tmp_path / f"{START.date().isoformat()}.csv")
+    assert rows[0] == list(EXPORT_COLUMNS)
+    assert [(row[4], row[6], row[12]) for row in rows[1:]] == [
+        (START.replace(minute=14).isoformat(), "5", "ICE;RE"),
+        (START.replace(minute=44).isoformat(), "7", "ICE;RE"),
+    ]
+    assert len(_read(tmp_path / f"{snapshot.date().isoformat()}.csv")) == 3
+    assert exporter.to_dict()["written"] == 4
+
+
+async def test_export_is_batched_and_bounded(hass: HomeAssistant, tmp_path: Path, mocker: MockerFixture) -> None:
+    mocker.patch.object(export_module, "EXPORT_BATCH_ROWS", 4)
+    mocker.patch.object(export_module, "MAX_PENDING_ROWS", 5)
+    write = mocker.patch.object(export_module, "write_partitions", side_effect=OSError("Disk full"))
+    exporter = ConnectionExporter(hass, tmp_path)
+
+    exporter.add(START, _result(["18:14", "18:44"]))
+    await asyncio.sleep(0)
+    assert write.call_count == 0
+
+    # Reaching the batch size writes in the background, failed rows are kept for the next attempt.
+    exporter.add(START, _result(["19:14", "19:44"]))
+    await asyncio.sleep(0)
+    await exporter.async_flush()
+    assert len(exporter) == 4
+    assert write.call_count == 2
+
+    exporter.add(START, _result(["20:14", "20:44"]))
+    assert len(exporter) == 5
+    assert exporter.rows_dropped == 1
+
+    write.side_effect = None
+    write.return_value = (5, 0)
+    assert await exporter.async_flush() == 5
+    assert len(exporter) == 0
+
+
+async def test_export_keeps_current_day(hass: HomeAssistant, tmp_path: Path, mocker: MockerFixture) -> None:
+    mocker.patch.object(export_module.dt, "now", return_value=START)
+    exporter = ConnectionExporter(hass, tmp_path, retention_days=0)
+    exporter.add(START, _result(["18:14"]))
+    assert await exporter.async_flush() == 1
+    assert len(_read(tmp_path / f"{START.date().isoformat()}.csv")) == 2
@@ -0,0 +1,48 @@
+import pytest
+import voluptuous as vol
+from homeassistant.core import HomeAssistant
+
+from custom_components.db_train_tracker.config_flow import _validate_regular_expressions
+from custom_components.db_train_tracker.const import DEFAULT_FILTERED_REGULAR_EXPRESSIONS
+from custom_components.db_train_tracker.data_gatherer import CalendarMatcher, GathererConfig
+from custom_components.db_train_tracker.expressions import (
+    MAX_SUMMARY_LENGTH,
+    compile_expression,
+    is_expression_too_slow,
+)
+
+
+def test_default_expressions_are_fast() -> None:
+    for expression in DEFAULT_FILTERED_REGULAR_EXPRESSIONS:
+        assert not is_expression_too_slow(compile_expression(expression))
+
+
+def test_backtracking_expressions_are_slow() -> None:
+    for expression in ("(a+)+$", "(.*a){12}x", r"Train Travel to (\w+\s?)+!"):
+        assert is_expression_too_slow(compile_expression(expression))
+
+
+async def test_regular_expressions_validation(hass: HomeAssistant) -> None:
+    assert await _validate_regular_expressions(hass, "Travel to(.+); (?P<origin>.+)→(?P<destination>.+)") == (
+        "Travel to(.+)",
+        "(?P<origin>.+)→(?P<destination>.+)",
+    )
+    with pytest.raises(vol.Invalid, match="expression_invalid"):
+        await _validate_regular_expressions(hass, "Travel to(.+")
+    with pytest.raises(vol.Invalid, match="expression_too_slow"):
+        await _validate_regular_expressions(hass, "Travel to(.+);(a|a)+b")
+
+
+def test_matching_is_capped_and_accounted() -> None:
+    matcher = CalendarMatcher(
+        GathererConfig(origin="Hamburg Hbf", calendars=(), filtered_regular_expressions=("(.+)!",))
+    )
+    assert matcher.match_summary("Berlin Hbf!", "Hamburg Hbf") == ("Hamburg Hbf", "Berlin Hbf")
+    # The exclamation mark is beyond the length cap, so the expression does not match anymore.
+    assert matcher.match_summary("a" * MAX_SUMMARY_LENGTH + "!", "Hamburg Hbf") is None
+    costs = matcher.get_costs()
+    assert list(costs) == ["(.+)!"]
+    assert costs["(.+)!"] > 0
+
+    matcher.reset_costs()
+    assert matcher.get_costs() == {"(.+)!": 0.0}
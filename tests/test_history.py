@@ -0,0 +1,71 @@
+import datetime
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt
+
+from custom_components.db_train_tracker.data_gatherer import (
+    GathererResult,
+    PlannedTravelTime,
+    PossibleTravelTimes,
+    TravelInformation,
+)
+from custom_components.db_train_tracker.history import DelayHistory
+
+
+def _result(departure: datetime.datetime, delay: int, canceled: bool = False) -> GathererResult:
+    planned = PlannedTravelTime(
+        start=departure,
+        end=departure + datetime.timedelta(hours=2),
+        origin="Berlin Hbf",
+        destination="Hamburg Hbf",
+    )
+    connection = TravelInformation(
+        reference_time=departure,
+        departure=departure.strftime("%H:%M"),
+        arrival=(departure + datetime.timedelta(hours=2)).strftime("%H:%M"),
+        ontime=delay == 0,
+        transfers=0,
+        time="2:00",
+        products=("ICE",),
+        price=None,
+        departure_delay=delay,
+        arrival_delay=delay,
+        canceled=canceled,
+        details_url="",
+    )
+    return GathererResult(travel_times=(PossibleTravelTimes(planned_travel_time=planned, connections=(connection,)),))
+
+
+async def test_delay_statistics(hass: HomeAssistant) -> None:
+    start = dt.as_local(datetime.datetime(2022, 1, 1, 8, 0, tzinfo=datetime.timezone.utc))
+    history = DelayHistory(days=7)
+    for index, delay in enumerate((0, 0, 2, 5, 10, 0, 1, 3, 0, 30)):
+        departure = start + datetime.timedelta(hours=index)
+        # Only the last observation before the departure counts.
+        history.observe(_result(departure, delay + 5))
+        history.observe(_result(departure, delay))
+    history.observe(_result(start + datetime.timedelta(hours=10), 0, canceled=True))
+    history.flush(start + datetime.timedelta(hours=12))
+
+    statistics = history.statistics("Berlin Hbf", "Hamburg Hbf")
+    assert statistics is not None
+    assert statistics.samples == 11
+    assert statistics.percentile(0.5) == 1
+    assert statistics.percentile(0.9) == 10
+    assert statistics.cancellation_rate == 1 / 11
+
+
+async def test_delay_statistics_pending_and_rotation(hass: HomeAssistant) -> None:
+    start = dt.as_local(datetime.datetime(2022, 1, 1, 8, 0, tzinfo=datetime.timezone.utc))
+    history = DelayHistory(days=2)
+    history.observe(_result(start, 4))
+    history.flush(start - datetime.timedelta(minutes=1))
+    assert history.statistics("Berlin Hbf", "Hamburg Hbf") is None
+
+    history.flush(start)
+    statistics = history.statistics("Berlin Hbf", "Hamburg Hbf")
+    assert statistics is not None
+    assert statistics.percentile(0.5) == 4
+
+    history.flush(start + datetime.timedelta(days=3))
+    assert history.statistics("Berlin Hbf", "Hamburg Hbf") is None
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from homeassistant.core import HomeAssistant
+from pytest_mock import MockerFixture
+
+from custom_components.db_train_tracker import client as client_module
+from custom_components.db_train_tracker.client import async_import_client
+
+ROOT = Path(__file__).parent.parent
+
+IMPORT_SCRIPT = """
+import sys
+import custom_components.db_train_tracker
+import custom_components.db_train_tracker.config_flow
+import custom_components.db_train_tracker.sensor
+import custom_components.db_train_tracker.diagnostics
+print("weiche" in sys.modules, "custom_components.db_train_tracker.proxies" in sys.modules)
+"""
+
+
+def test_import_defers_client() -> None:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(ROOT), os.environ.get("PYTHONPATH", "")])}
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=ROOT,
+        check=True,
+    )
+    # The Deutsche Bahn client is only loaded once it is needed, in the import executor.
+    assert result.stdout.strip() == "False False"
+
+
+async def test_client_is_imported_in_executor(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    mocker.patch.dict(sys.modules)
+    sys.modules.pop("custom_components.db_train_tracker.proxies", None)
+    job = mocker.patch.object(hass, "async_add_import_executor_job", mocker.AsyncMock())
+    await async_import_client(hass)
+    job.assert_awaited_once_with(client_module._import_client_modules)
@@ -0,0 +1,239 @@
+"""Load test running many trackers with synthetic calendars against a fake Deutsche Bahn backend.
+
+Runs a small configuration with asserted counts as part of the test suite. Larger deployments can be sized by
+configuring the sizing run through environment variables, it logs its report::
+
+    LOAD_TEST_TRACKERS=50 LOAD_TEST_CALENDARS=5 LOAD_TEST_LATENCY_MS=200 pytest tests/test_load.py --log-cli-level=INFO
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import random
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, NamedTuple
+
+import pytest
+import requests
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse
+from homeassistant.util import dt
+
+from custom_components.db_train_tracker.const import CONF_CALENDARS, CONF_HOME_STATION
+from custom_components.db_train_tracker.sensor import DBTrainTrackerSensor
+
+_LOGGER = logging.getLogger(__name__)
+
+# The small configuration run by the test suite only asserts counts, which do not depend on the speed of the
+# machine. The fake backend answers after this latency, far longer than the loop needs to start the queries of
+# the other trackers, so parallel trackers always overlap upstream.
+SMOKE_TEST_LATENCY_MS = 20
+MAX_PEAK_MEMORY = 8 * 1024 * 1024
+
+
+class FakeSchiene:
+    """Replacement of the Schiene client which injects latency and connection errors."""
+
+    def __init__(self, latency_ms: float = 0, error_rate: float = 0, seed: int = 0) -> None:
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _request(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failed = self.random.random() < self.error_rate
+        try:
+            time.sleep(self.latency)
+            if failed:
+                with self._lock:
+                    self.errors += 1
+                raise requests.ConnectionError("Injected connection error")
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stations(self, station: str, limit: int = 10) -> List[Dict[str, Any]]:
+        self._request()
+        return [{"value": station}][:limit]
+
+    def connections(self, origin: str, destination: str, dt: datetime.datetime, only_direct: bool = False) -> list:
+        self._request()
+        return [
+            {
+                "details": "",
+                "departure": (dt + datetime.timedelta(minutes=15 * index)).strftime("%H:%M"),
+                "arrival": (dt + datetime.timedelta(minutes=15 * index + 90)).strftime("%H:%M"),
+                "transfers": index % 3,
+                "time": "1:30",
+                "products": ["ICE", "REGIONAL"][: 1 + index % 2],
+                "price": None,
+                "ontime": index % 4 != 0,
+                "canceled": index % 7 == 0,
+                "delay": {"delay_departure": index % 4, "delay_arrival": index % 5},
+            }
+            for index in range(10)
+        ]
+
+
+class LoadTestReport(NamedTuple):
+    refreshes: int
+    duration: float
+    upstream_calls: int
+    upstream_errors: int
+    unavailable_trackers: int
+    max_concurrent_upstream_calls: int
+    executor_workers: int | None
+    peak_memory: int
+    max_loop_lag: float
+    p95_loop_lag: float
+
+    @property
+    def throughput(self) -> float:
+        return self.refreshes / self.duration if self.duration else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.refreshes} refreshes in {self.duration:.2f}s ({self.throughput:.1f}/s), "
+            f"{self.upstream_calls} upstream calls ({self.upstream_errors} errors), "
+            f"{self.unavailable_trackers} unavailable trackers, "
+            f"executor saturation {self.max_concurrent_upstream_calls}/{self.executor_workers}, "
+            f"peak memory {self.peak_memory / 1024:.0f} KiB, "
+            f"loop lag max {self.max_loop_lag * 1000:.1f}ms p95 {self.p95_loop_lag * 1000:.1f}ms"
+        )
+
+
+def _register_calendars(hass: HomeAssistant, calendars: List[str], events_per_calendar: int) -> None:
+    now = dt.now().replace(second=0, microsecond=0)
+    events = {
+        calendar: [
+            {
+                "start": (now + datetime.timedelta(hours=index + 1)).isoformat(),
+                "end": (now + datetime.timedelta(hours=index + 3)).isoformat(),
+                "summary": f"Train travel to Station {calendar_index}-{index}",
+            }
+            for index in range(events_per_calendar)
+        ]
+        for calendar_index, calendar in enumerate(calendars)
+    }
+
+    async def _get_events(call: ServiceCall) -> Dict[str, Any]:
+        entity_id = call.data["entity_id"]
+        return {entity_id: {"events": events[entity_id]}}
+
+    for calendar in calendars:
+        hass.states.async_set(calendar, "off")
+    hass.services.async_register("calendar", "get_events", _get_events, supports_response=SupportsResponse.ONLY)
+
+
+async def _monitor_loop_lag(lags: List[float], interval: float) -> None:
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        lags.append(max(time.monotonic() - start - interval, 0))
+
+
+async def run_load_test(
+    hass: HomeAssistant,
+    trackers: int,
+    calendars: int,
+    events_per_calendar: int = 5,
+    rounds: int = 3,
+    latency_ms: float = 0,
+    error_rate: float = 0,
+) -> LoadTestReport:
+    schiene = FakeSchiene(latency_ms=latency_ms, error_rate=error_rate)
+    calendar_ids = [f"calendar.load_{index}" for index in range(trackers * calendars)]
+    _register_calendars(hass, calendar_ids, events_per_calendar)
+    sensors = [
+        DBTrainTrackerSensor(
+            hass,
+            schiene,  # type: ignore[arg-type]
+            {
+                CONF_HOME_STATION: f"Home {tracker}",
+                CONF_CALENDARS: calendar_ids[tracker * calendars : (tracker + 1) * calendars],
+            },
+        )
+        for tracker in range(trackers)
+    ]
+
+    lags: List[float] = []
+    lag_monitor = asyncio.ensure_future(_monitor_loop_lag(lags, 0.01))
+    start = time.monotonic()
+    try:
+        for _ in range(rounds):
+            await asyncio.gather(*(sensor.async_update() for sensor in sensors))
+        duration = time.monotonic() - start
+    finally:
+        lag_monitor.cancel()
+    upstream_calls = schiene.calls
+    unavailable_trackers = sum(not sensor.available for sensor in sensors)
+
+    # Tracing slows down Python several times, so the memory is measured in an additional round after the timed ones.
+    tracemalloc.start()
+    try:
+        await asyncio.gather(*(sensor.async_update() for sensor in sensors))
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        for sensor in sensors:
+            await sensor.async_will_remove_from_hass()
+
+    executor = getattr(hass.loop, "_default_executor", None)
+    sorted_lags = sorted(lags) or [0.0]
+    return LoadTestReport(
+        refreshes=trackers * rounds,
+        duration=duration,
+        upstream_calls=upstream_calls,
+        upstream_errors=schiene.errors,
+        unavailable_trackers=unavailable_trackers,
+        max_concurrent_upstream_calls=schiene.max_in_flight,
+        executor_workers=getattr(executor, "_max_workers", None),
+        peak_memory=peak_memory,
+        max_loop_lag=sorted_lags[-1],
+        p95_loop_lag=sorted_lags[int(0.95 * (len(sorted_lags) - 1))],
+    )
+
+
+async def test_load(hass: HomeAssistant) -> None:
+    trackers, calendars, events_per_calendar, rounds = 3, 2, 5, 3
+    report = await run_load_test(
+        hass,
+        trackers=trackers,
+        calendars=calendars,
+        events_per_calendar=events_per_calendar,
+        rounds=rounds,
+        latency_ms=SMOKE_TEST_LATENCY_MS,
+    )
+    _LOGGER.info(report)
+    # Every planned travel is queried exactly once per refresh, all refreshes succeed and the trackers query in
+    # parallel. The timings are only reported, they depend on the machine.
+    assert report.upstream_calls == trackers * calendars * events_per_calendar * rounds
+    assert report.upstream_errors == 0
+    assert report.unavailable_trackers == 0
+    assert report.max_concurrent_upstream_calls > 1
+    assert report.peak_memory < MAX_PEAK_MEMORY
+
+
+@pytest.mark.skipif("LOAD_TEST_TRACKERS" not in os.environ, reason="Sizing run, enabled by LOAD_TEST_TRACKERS")
+async def test_load_sizing(hass: HomeAssistant) -> None:
+    report = await run_load_test(
+        hass,
+        trackers=int(os.environ["LOAD_TEST_TRACKERS"]),
+        calendars=int(os.environ.get("LOAD_TEST_CALENDARS", 2)),
+        events_per_calendar=int(os.environ.get("LOAD_TEST_EVENTS", 5)),
+        rounds=int(os.environ.get("LOAD_TEST_ROUNDS", 3)),
+        latency_ms=float(os.environ.get("LOAD_TEST_LATENCY_MS", 1)),
+        error_rate=float(os.environ.get("LOAD_TEST_ERROR_RATE", 0)),
+    )
+    _LOGGER.info(report)
+    assert report.upstream_calls > 0
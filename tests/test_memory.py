@@ -0,0 +1,146 @@
+import datetime
+import gc
+import tracemalloc
+from typing import Any, Dict, List
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt
+from pytest_mock import MockerFixture
+
+from custom_components.db_train_tracker.connections import MAX_CACHED_CONNECTIONS
+from custom_components.db_train_tracker.const import (
+    CONF_CALENDARS,
+    CONF_DURATION,
+    CONF_HOME_STATION,
+    DEFAULT_MAX_RESULTS,
+)
+from custom_components.db_train_tracker.data_gatherer import MAX_CACHED_CALENDAR_ENTRIES
+from custom_components.db_train_tracker.details import MAX_CACHED_DETAILS
+from custom_components.db_train_tracker.history import MAX_PENDING_DEPARTURES, MAX_SAMPLES_PER_DAY, DelayHistory
+from custom_components.db_train_tracker.sensor import DBTrainTrackerSensor
+from custom_components.db_train_tracker.stations import MAX_CACHED_STATIONS
+
+WARM_UP_CYCLES = 500
+MEASURED_CYCLES = 1000
+ALLOWED_GROWTH = 64 * 1024
+
+
+class _State:
+    state = "on"
+
+
+class _States:
+    def get(self, entity_id: str) -> _State:
+        return _State()
+
+
+class _Bus:
+    def async_fire(self, event_type: str, event_data: Dict[str, Any]) -> None:
+        pass
+
+
+class _Services:
+    """Calendar service returning events with a different location on each refresh."""
+
+    def __init__(self) -> None:
+        self.cycle = 0
+
+    async def async_call(
+        self, domain: str, service: str, service_data: Dict[str, Any], **kwargs: Any
+    ) -> Dict[str, Any]:
+        now = dt.now().replace(second=0, microsecond=0)
+        return {
+            service_data["entity_id"]: {
+                "events": [
+                    {
+                        "start": (now + datetime.timedelta(hours=index + 1)).isoformat(),
+                        "end": (now + datetime.timedelta(hours=index + 3)).isoformat(),
+                        "summary": "Train travel to Hamburg Hbf",
+                        "location": f"Room {self.cycle}-{index}",
+                    }
+                    for index in range(3)
+                ]
+            }
+        }
+
+
+class _Schiene:
+    def stations(self, station: str, limit: int = 10) -> List[Dict[str, Any]]:
+        return []
+
+    def connections(self, origin: str, destination: str, dt: datetime.datetime, only_direct: bool = False) -> list:
+        return [
+            {
+                "details": "",
+                "departure": (dt + datetime.timedelta(minutes=30 * index)).strftime("%H:%M"),
+                "arrival": (dt + datetime.timedelta(minutes=30 * index + 90)).strftime("%H:%M"),
+                "transfers": 0,
+                "time": "1:30",
+                "products": ["ICE"],
+                "price": None,
+                "ontime": True,
+                "canceled": False,
+                "delay": {"delay_departure": index, "delay_arrival": index},
+            }
+            for index in range(2)
+        ]
+
+
+async def test_steady_state_memory(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    services = _Services()
+    mocker.patch.object(hass, "services", services)
+    hass.states = _States()
+    hass.bus = _Bus()
+    # Every refresh moves the clock ten minutes on, so departures pass and the history rotates its days.
+    simulated_now = dt.as_local(datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc))
+    # Plain functions instead of mocks, which would record every call.
+    mocker.patch.object(dt, "now", new=lambda *args: simulated_now)
+    # The timer advancing the state between refreshes is not needed here.
+    mocker.patch.object(DBTrainTrackerSensor, "_async_schedule_tick", new=lambda self: None)
+    sensor = DBTrainTrackerSensor(
+        hass,
+        _Schiene(),  # type: ignore[arg-type]
+        {CONF_HOME_STATION: "Berlin Hbf", CONF_CALENDARS: ["calendar.travel"], CONF_DURATION: 24},
+    )
+    sensor.history = DelayHistory(days=2)
+    gatherer = sensor.gatherer
+
+    async def refresh(cycle: int) -> None:
+        nonlocal simulated_now
+        services.cycle = cycle
+        gatherer.invalidated_calendars.add("calendar.travel")
+        await sensor.async_update()
+        # The query service looks up the locations, each one a different miss. The index is full after the warm up.
+        for index in range(3):
+            await gatherer.stations.async_resolve(f"Room {cycle}-{index}")
+        simulated_now += datetime.timedelta(minutes=10)
+
+    tracemalloc.start()
+    try:
+        for cycle in range(WARM_UP_CYCLES):
+            await refresh(cycle)
+        gc.collect()
+        baseline, _ = tracemalloc.get_traced_memory()
+        baseline_attributes = len(sensor.attrs)
+        for cycle in range(WARM_UP_CYCLES, WARM_UP_CYCLES + MEASURED_CYCLES):
+            await refresh(cycle)
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert sensor.available
+    sizes = sensor.cache_sizes()
+    assert sizes["stations"] == len(gatherer.stations) == MAX_CACHED_STATIONS
+    assert sizes["calendar_entries"] <= MAX_CACHED_CALENDAR_ENTRIES
+    assert sizes["connections"] <= MAX_CACHED_CONNECTIONS
+    assert sizes["details"] <= MAX_CACHED_DETAILS
+    assert 0 < sizes["history_days"] <= 2
+    assert 0 < sizes["history_samples"] <= 2 * MAX_SAMPLES_PER_DAY
+    assert sizes["history_routes"] == 1
+    assert sizes["history_pending"] <= MAX_PENDING_DEPARTURES
+    # The attributes only describe the current planned travels, they do not accumulate over the refreshes.
+    assert len(sensor.attrs) == baseline_attributes
+    assert 0 < len(sensor.attrs["planned_travels"]) <= 3
+    assert all(len(travel["connections"]) <= DEFAULT_MAX_RESULTS for travel in sensor.attrs["planned_travels"])
+    assert current - baseline < ALLOWED_GROWTH, f"Memory grew by {current - baseline} bytes"
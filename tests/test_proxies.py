@@ -0,0 +1,75 @@
+from typing import Any, Dict, List
+
+import pytest
+import requests
+
+from custom_components.db_train_tracker.proxies import PROXY_MAX_CONSECUTIVE_FAILURES, ProxyPool, parse_proxies
+
+
+class _Client:
+    def __init__(self, proxy: str) -> None:
+        self.proxy = proxy
+        self.failing = False
+
+    def stations(self, station: str, limit: int = 10) -> List[Dict[str, Any]]:
+        if self.failing:
+            raise requests.ConnectionError("Proxy down")
+        if not station:
+            raise ValueError("Invalid query")
+        return [{"value": self.proxy}]
+
+
+def test_parse_proxies() -> None:
+    assert parse_proxies("http://a:1; http://b:2;") == ("http://a:1", "http://b:2")
+    assert parse_proxies("") == tuple()
+
+
+def test_round_robin() -> None:
+    pool = ProxyPool(["a", "b", "c"], client_factory=_Client)  # type: ignore[arg-type]
+    assert [pool.stations("Hamburg")[0]["value"] for _ in range(6)] == ["a", "b", "c", "a", "b", "c"]
+    assert [statistics["requests"] for statistics in pool.statistics()] == [2, 2, 2]
+
+
+def test_failing_proxy_is_ejected() -> None:
+    pool = ProxyPool(["a", "b"], client_factory=_Client)  # type: ignore[arg-type]
+    pool.clients[0].failing = True  # type: ignore[attr-defined]
+    failures = 0
+    while failures < PROXY_MAX_CONSECUTIVE_FAILURES:
+        try:
+            pool.stations("Hamburg")
+        except requests.ConnectionError:
+            failures += 1
+
+    assert [pool.stations("Hamburg")[0]["value"] for _ in range(3)] == ["b", "b", "b"]
+    statistics = pool.statistics()
+    assert statistics[0]["errors"] == PROXY_MAX_CONSECUTIVE_FAILURES
+    assert statistics[0]["ejected"]
+    assert not statistics[1]["ejected"]
+    assert statistics[1]["latency_ms"] is not None
+
+
+def test_request_errors_do_not_eject_proxy() -> None:
+    pool = ProxyPool(["a"], client_factory=_Client)  # type: ignore[arg-type]
+    for _ in range(PROXY_MAX_CONSECUTIVE_FAILURES + 1):
+        with pytest.raises(ValueError):
+            pool.stations("")
+    statistics = pool.statistics()[0]
+    assert statistics["errors"] == 0
+    assert not statistics["ejected"]
+    assert pool.stations("Hamburg")[0]["value"] == "a"
+
+
+def test_pool_is_a_client() -> None:
+    pool = ProxyPool(["http://a:1", "http://b:2"], client_factory=_Client)  # type: ignore[arg-type]
+    # The inherited api exists and uses a proxy as well.
+    assert pool.api.session.proxies == {"http": "http://a:1", "https": "http://a:1"}
+
+
+def test_all_proxies_ejected() -> None:
+    pool = ProxyPool(["a"], client_factory=_Client)  # type: ignore[arg-type]
+    pool.clients[0].failing = True  # type: ignore[attr-defined]
+    for _ in range(PROXY_MAX_CONSECUTIVE_FAILURES + 1):
+        with pytest.raises(requests.ConnectionError):
+            pool.stations("Hamburg")
+    # The proxy is still used as there is no other one left.
+    assert pool.statistics()[0]["requests"] == PROXY_MAX_CONSECUTIVE_FAILURES + 1
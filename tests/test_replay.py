@@ -0,0 +1,151 @@
+import datetime
+import json
+from pathlib import Path
+
+import pytest
+from homeassistant.util import dt
+
+from custom_components.db_train_tracker.data_gatherer import GathererConfig
+from custom_components.db_train_tracker.replay import (
+    ReplaySchiene,
+    async_replay,
+    load_calendar_dump,
+    load_config,
+    main,
+    parse_ics,
+)
+
+ICS = """BEGIN:VCALENDAR
+VERSION:2.0
+BEGIN:VEVENT
+DTSTART;TZID=Europe/Berlin:20240502T100000
+DTEND;TZID=Europe/Berlin:20240502T120000
+SUMMARY:Train Travel to Hamburg
+END:VEVENT
+BEGIN:VEVENT
+DTSTART:20240502T120000Z
+DTEND:20240502T130000Z
+SUMMARY:Weekly sync
+LOCATION:Berlin Hbf
+END:VEVENT
+BEGIN:VEVENT
+DTSTART;VALUE=DATE:20240503
+SUMMARY:Holiday\\, no
+  travel
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+def test_parse_ics() -> None:
+    events = parse_ics(ICS)
+    assert [event["summary"] for event in events] == ["Train Travel to Hamburg", "Weekly sync", "Holiday, no travel"]
+    assert events[0]["start"] == "2024-05-02T10:00:00+02:00"
+    assert events[1]["end"] == "2024-05-02T13:00:00+00:00"
+    assert events[1]["location"] == "Berlin Hbf"
+    assert events[2]["start"] == "2024-05-03"
+    assert events[2]["end"] == "2024-05-04"
+
+
+def test_load_config(tmp_path: Path) -> None:
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"origin": "Berlin Hbf", "mappings": [["Hamburg", "Hamburg Hbf"]]}))
+    config = load_config(path, ["calendar.travel"])
+    assert config.calendars == ("calendar.travel",)
+    assert config.mappings == (("Hamburg", "Hamburg Hbf"),)
+    assert config.filtered_regular_expressions == GathererConfig._field_defaults["filtered_regular_expressions"]
+
+    path.write_text(json.dumps({"origin": "Berlin Hbf", "home": "Hamburg Hbf"}))
+    with pytest.raises(ValueError):
+        load_config(path, ["calendar.travel"])
+
+
+async def test_replay(tmp_path: Path) -> None:
+    path = tmp_path / "travel.ics"
+    path.write_text(ICS)
+    calendars = load_calendar_dump(path)
+    assert list(calendars) == ["calendar.travel"]
+    config = GathererConfig(
+        origin="Berlin Hbf", calendars=("calendar.travel",), mappings=(("Hamburg", "Hamburg Hbf"),), max_results=2
+    )
+    now = datetime.datetime(2024, 5, 2, 6, tzinfo=datetime.timezone.utc)
+    schiene = ReplaySchiene(["Berlin Hbf", "Hamburg Hbf"])
+
+    report = await async_replay(calendars, config, now, schiene)
+
+    # The event located at the home station is no travel.
+    assert [
+        (travel_time.origin, travel_time.destination, len(travel_time.connections))
+        for travel_time in report.result.travel_times
+    ] == [("Berlin Hbf", "Hamburg Hbf", 2)]
+    assert report.result.travel_times[0].planned_travel_time.start == dt.parse_datetime("2024-05-02T10:00:00+02:00")
+    assert [stage.name for stage in report.stages] == ["calendar", "matching", "connections", "result"]
+    assert all(stage.seconds >= 0 for stage in report.stages)
+    assert report.connection_queries == 1
+    assert "Train[ ]*Travel[ ]*to(.+)" in report.expression_costs
+
+
+def test_main(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    calendar_path = tmp_path / "calendar.json"
+    calendar_path.write_text(
+        json.dumps(
+            {
+                "calendar.work": {
+                    "events": [
+                        {
+                            "start": "2024-05-02T10:00:00+02:00",
+                            "end": "2024-05-02T12:00:00+02:00",
+                            "summary": "Train Travel to Hamburg Hbf",
+                            "uid": "1",
+                        }
+                    ]
+                }
+            }
+        )
+    )
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"origin": "Berlin Hbf"}))
+    connections_path = tmp_path / "connections.json"
+    connections_path.write_text(
+        json.dumps(
+            {
+                "routes": [
+                    {
+                        "origin": "Berlin Hbf",
+                        "destination": "Hamburg Hbf",
+                        "connections": [
+                            {
+                                "departure": "10:36",
+                                "arrival": "12:24",
+                                "time": "1:48",
+                                "products": ["ICE"],
+                                "delay": {"delay_departure": 5, "delay_arrival": 3},
+                            }
+                        ],
+                    }
+                ]
+            }
+        )
+    )
+    previous_time_zone = dt.DEFAULT_TIME_ZONE
+
+    assert (
+        main(
+            [
+                str(calendar_path),
+                str(config_path),
+                "--connections",
+                str(connections_path),
+                "--now",
+                "2024-05-02T08:00",
+            ]
+        )
+        == 0
+    )
+
+    output = capsys.readouterr().out
+    assert "Matched trips: 1" in output
+    assert "2024-05-02 10:00 Berlin Hbf → Hamburg Hbf (1 connections)" in output
+    assert "10:36 +5 → 12:24 (ICE)" in output
+    assert "matching" in output
+    assert dt.DEFAULT_TIME_ZONE == previous_time_zone
@@ -0,0 +1,42 @@
+from homeassistant.core import HomeAssistant
+from pytest_mock import MockerFixture
+
+from custom_components.db_train_tracker import stations as stations_module
+from custom_components.db_train_tracker.stations import StationStore, async_get_station_store
+
+
+async def test_station_store_suggestions(hass: HomeAssistant) -> None:
+    store = StationStore(hass)
+    store.add(["Hamburg Hbf", "Hamburg Dammtor", "Hamburg-Altona", "Berlin Hbf", "Hamm (Westf) Hbf"])
+
+    assert store.get("hamburg  hbf") == "Hamburg Hbf"
+    assert store.get("Hamburg") is None
+    assert store.suggest("hamburg") == ["Hamburg Dammtor", "Hamburg Hbf", "Hamburg-Altona"]
+    assert store.suggest("Ham", limit=2) == ["Hamburg Dammtor", "Hamburg Hbf"]
+    assert store.suggest("Köln") == []
+
+
+async def test_station_store_is_bounded(hass: HomeAssistant, mocker: MockerFixture) -> None:
+    mocker.patch.object(stations_module, "MAX_STORED_STATIONS", 3)
+    store = StationStore(hass)
+    store.add([f"Station {index}" for index in range(5)])
+    assert len(store) == 3
+    assert store.get("Station 0") is None
+    assert store.suggest("Station") == ["Station 2", "Station 3", "Station 4"]
+
+
+async def test_station_store_is_shared(hass: HomeAssistant) -> None:
+    store = await async_get_station_store(hass)
+    store.add(["Hamburg Hbf"])
+    assert (await async_get_station_store(hass)).get("Hamburg Hbf") == "Hamburg Hbf"
+
+
+async def test_station_store_aliases(hass: HomeAssistant) -> None:
+    store = StationStore(hass)
+    store.add(["Hamburg Hbf"])
+    store.add_alias("Hamburg", "Hamburg Hbf")
+    # Aliases do not shadow stations and are not suggested.
+    store.add_alias("hamburg hbf", "Hamburg Dammtor")
+    assert store.get(" HAMBURG ") == "Hamburg Hbf"
+    assert store.get("Hamburg Hbf") == "Hamburg Hbf"
+    assert store.suggest("Hamburg") == ["Hamburg Hbf"]
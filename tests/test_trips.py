@@ -0,0 +1,42 @@
+import datetime
+
+from custom_components.db_train_tracker.data_gatherer import PlannedTravelTime, PossibleTravelTimes
+from custom_components.db_train_tracker.trips import TripIndex
+
+START = datetime.datetime(2022, 1, 1, 8, 0, tzinfo=datetime.timezone.utc)
+
+
+def _trip(destination: str, start_hour: int, end_hour: int) -> PossibleTravelTimes:
+    return PossibleTravelTimes(
+        planned_travel_time=PlannedTravelTime(
+            start=START + datetime.timedelta(hours=start_hour),
+            end=START + datetime.timedelta(hours=end_hour),
+            origin="Hamburg Hbf",
+            destination=destination,
+        ),
+        connections=tuple(),
+    )
+
+
+def _destinations(travel_times: tuple) -> list:
+    return [travel_time.destination for travel_time in travel_times]
+
+
+def test_trip_index_queries() -> None:
+    index = TripIndex([_trip("Köln Hbf", 5, 6), _trip("Berlin Hbf", 0, 10), _trip("Bremen Hbf", 2, 3)])
+
+    current = index.current(START + datetime.timedelta(hours=4))
+    assert current is not None
+    assert current.destination == "Berlin Hbf"
+    assert _destinations(index.upcoming(START + datetime.timedelta(hours=4))) == ["Berlin Hbf", "Köln Hbf"]
+    assert _destinations(
+        index.overlapping(START + datetime.timedelta(hours=2, minutes=30), START + datetime.timedelta(hours=5))
+    ) == ["Berlin Hbf", "Bremen Hbf"]
+    assert index.current(START + datetime.timedelta(hours=10)) is None
+
+
+def test_trip_index_evict() -> None:
+    index = TripIndex([_trip("Bremen Hbf", 0, 1), _trip("Berlin Hbf", 2, 3), _trip("Köln Hbf", 4, 5)])
+    index.evict(START + datetime.timedelta(hours=3))
+    assert len(index) == 1
+    assert _destinations(index.upcoming(START + datetime.timedelta(hours=3))) == ["Köln Hbf"]